@@ -0,0 +1,80 @@
+"""
+Per-request overhead of Auth.get_current_user on a cache hit.
+
+Compares the old path (unpickling a whole ORM User from Redis) with the two tiers of the user cache.
+Redis is replaced by an in-memory stand-in so only the client-side cost is measured:
+
+    python -m benchmarks.auth --iterations 20000
+"""
+import argparse
+import asyncio
+import pickle
+from datetime import datetime
+from time import perf_counter
+
+from src.database.models import User
+from src.services.auth import auth_service
+from src.services.user_cache import CachedUser, LocalCache, UserCache
+
+
+class MemoryRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+def make_user() -> User:
+    return User(id=1, username="benchmark", email="benchmark@example.com", password="$2b$12$" + "x" * 53,
+                created_at=datetime(2023, 10, 19), avatar="https://example.com/avatar.png",
+                refresh_token="x" * 200, confirmed_email=True)
+
+
+async def timed(label: str, call, iterations: int) -> None:
+    started = perf_counter()
+    for _ in range(iterations):
+        await call()
+    per_call = (perf_counter() - started) / iterations
+    print(f"{label:<28} {per_call * 1e6:8.1f} us/request")
+
+
+async def main(args):
+    user = make_user()
+    token = await auth_service.create_access_token(data={"sub": user.email})
+    pickled = pickle.dumps(user)
+    memory = MemoryRedis()
+
+    async def pickle_hit():
+        return pickle.loads(await memory.get("pickled"))
+
+    await memory.set("pickled", pickled)
+    print(f"pickled user: {len(pickled)} bytes, cached projection: {len(UserCache.dumps(CachedUser.from_user(user)))} bytes")
+    await timed("pickle.loads (old)", pickle_hit, args.iterations)
+
+    redis_tier = UserCache(memory, ttl=900, local=LocalCache(maxsize=0, ttl=0))
+    await redis_tier.set(user)
+    await timed("redis tier", lambda: redis_tier.get(user.email), args.iterations)
+
+    local_tier = UserCache(memory, ttl=900, local=LocalCache(maxsize=1024, ttl=60))
+    await local_tier.set(user)
+    await timed("local tier", lambda: local_tier.get(user.email), args.iterations)
+
+    auth_service.cache = local_tier
+    await timed("get_current_user (local)", lambda: auth_service.get_current_user(token, None), args.iterations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20_000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,106 @@
+"""
+Avatar uploads into the local storage, offline: uploads/s and the latency of an unrelated endpoint (GET /) while
+they run. --latency adds a sleep to every save to stand in for the round trip to Cloudinary.
+
+    python -m benchmarks.avatars --uploads 100 --concurrency 10 --latency 0.05
+    python -m benchmarks.avatars --inline   # resize and save on the event loop, as before the thread pool
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import tempfile
+import time
+from time import perf_counter
+from unittest.mock import patch
+
+import httpx
+from PIL import Image
+
+from benchmarks.auth import MemoryRedis
+from benchmarks.load import override_dependencies, prepare
+from main import app
+from src.routes import users
+from src.services.avatars import AvatarStorage, LocalStorage
+from src.services.user_cache import user_cache
+
+
+class RemoteStorage(LocalStorage):
+    def __init__(self, latency: float, *args):
+        super().__init__(*args)
+        self.latency = latency
+
+    def save(self, name, file):
+        time.sleep(self.latency)
+        return super().save(name, file)
+
+
+async def store_inline(self, name, file):
+    return self._store(name, file)
+
+
+def photo(width: int, height: int) -> bytes:
+    data = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert("RGB").save(data, "JPEG", quality=90)
+    return data.getvalue()
+
+
+async def main(args):
+    directory = tempfile.mkdtemp()
+    engine, session_maker, user = await prepare(f"sqlite:///{os.path.join(directory, 'bench.db')}", 0)
+    override_dependencies(session_maker, user)
+    storage = RemoteStorage(args.latency, os.path.join(directory, "avatars"), "/avatars", 250, 85, args.workers)
+    image = photo(args.width, args.height)
+    done = asyncio.Event()
+    latencies = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        uploads = iter(range(args.uploads))
+
+        async def upload_worker():
+            for _ in uploads:
+                response = await client.patch("/api/users/avatar", files={"file": ("photo.jpg", image, "image/jpeg")})
+                response.raise_for_status()
+
+        async def probe():
+            while not done.is_set():
+                started = perf_counter()
+                (await client.get("/")).raise_for_status()
+                latencies.append(perf_counter() - started)
+                await asyncio.sleep(0.005)
+
+        with patch.object(users, "avatar_storage", storage):
+            prober = asyncio.create_task(probe())
+            started = perf_counter()
+            await asyncio.gather(*(upload_worker() for _ in range(args.concurrency)))
+            elapsed = perf_counter() - started
+            done.set()
+            await prober
+
+    stored = os.path.getsize(os.path.join(storage.directory, f"{user.username}.jpg"))
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    mode = "inline" if args.inline else f"pool({args.workers} workers)"
+    print(f"{mode}: {len(image)} -> {stored} bytes, {args.uploads / elapsed:6.1f} uploads/s, "
+          f"GET / p50={quantiles[49] * 1000:7.1f} ms p99={quantiles[98] * 1000:7.1f} ms "
+          f"max={max(latencies) * 1000:7.1f} ms")
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every save")
+    parser.add_argument("--width", type=int, default=2000)
+    parser.add_argument("--height", type=int, default=1500)
+    parser.add_argument("--inline", action="store_true", help="resize and save on the event loop")
+    args = parser.parse_args()
+    with patch.object(user_cache, "redis", MemoryRedis()):
+        if args.inline:
+            with patch.object(AvatarStorage, "store", store_inline):
+                asyncio.run(main(args))
+        else:
+            asyncio.run(main(args))
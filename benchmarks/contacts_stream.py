@@ -0,0 +1,105 @@
+"""
+Peak memory and time-to-first-byte of GET /api/contact/all (the full JSON list versus the NDJSON stream)
+and of the GET /api/contact/export formats.
+
+Each mode runs in its own process so the peak RSS of one does not hide the other:
+
+    python -m benchmarks.contacts_stream --contacts 100000
+    python -m benchmarks.contacts_stream --contacts 1000000 --modes export-csv export-vcard export-csv-gz
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from benchmarks.load import override_dependencies, prepare
+from main import app
+from src.database.connect import to_async_url
+from src.database.models import User
+
+MODES = {"json": "/api/contact/all", "ndjson": "/api/contact/all?format=ndjson",
+         "export-csv": "/api/contact/export?format=csv", "export-ndjson": "/api/contact/export?format=ndjson",
+         "export-vcard": "/api/contact/export?format=vcard",
+         "export-csv-gz": "/api/contact/export?format=csv&gzip=true"}
+
+
+async def asgi_get(path: str) -> tuple[float, float, int]:
+    """
+    The asgi_get function calls the ASGI app directly, so the time of the first body chunk is observed
+    exactly instead of after an HTTP client has buffered the response.
+
+    :param path: str: Path with query string
+    :return: Time to first byte, total time and the number of body bytes
+    """
+    path, _, query = path.partition("?")
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+             "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1), "server": ("bench", 80)}
+    state = {"first": None, "size": 0, "requested": False}
+    disconnected = asyncio.Event()
+
+    async def receive():
+        if not state["requested"]:
+            state["requested"] = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            if state["first"] is None:
+                state["first"] = perf_counter()
+            state["size"] += len(message.get("body", b""))
+
+    started = perf_counter()
+    await app(scope, receive, send)
+    finished = perf_counter()
+    disconnected.set()
+    return state["first"] - started, finished - started, state["size"]
+
+
+async def seed(args):
+    engine, _, _ = await prepare(f"sqlite:///{args.database}", args.contacts)
+    await engine.dispose()
+
+
+async def run_mode(args):
+    engine = create_async_engine(to_async_url(f"sqlite:///{args.database}"))
+    session_maker = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_maker() as db:
+        user = (await db.execute(select(User))).scalars().first()
+    override_dependencies(session_maker, user)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    ttfb, total, size = await asgi_get(MODES[args.mode])
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{args.mode:<13} ttfb={ttfb * 1000:9.1f} ms  total={total * 1000:9.1f} ms  "
+          f"body={size / 1024 / 1024:7.1f} MiB  peak_rss_growth={(peak - baseline) / 1024:7.1f} MiB")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--mode", choices=MODES)
+    parser.add_argument("--modes", choices=MODES, nargs="+", default=list(MODES))
+    parser.add_argument("--database", default=None)
+    args = parser.parse_args()
+    if args.mode:
+        asyncio.run(run_mode(args))
+        return
+    args.database = os.path.join(tempfile.mkdtemp(), "bench.db")
+    asyncio.run(seed(args))
+    command = [sys.executable, "-m", "benchmarks.contacts_stream", "--database", args.database]
+    for mode in args.modes:
+        subprocess.run(command + ["--mode", mode], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Messages/sec of the confirmation email against a local aiosmtpd server: the old path (a new FastMail and a new
+SMTP connection per message, as the BackgroundTasks of signup did) versus the batches of the email worker, which
+send over the kept-alive connections of a MailClient pool:
+
+    python -m benchmarks.email --messages 2000 --batch-sizes 1 10 50 --pool-sizes 1 2 4
+"""
+import argparse
+import asyncio
+from time import perf_counter
+
+import aiosmtplib
+from aiosmtpd.controller import Controller
+from fastapi_mail import ConnectionConfig, FastMail, MessageSchema, MessageType
+
+from src.services.email import MailClient, conf, send_emails
+
+
+class Sink:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+def jobs(count: int) -> list[dict]:
+    return [{"email": f"user{i}@example.com", "username": f"user{i}", "host": "http://bench/"} for i in range(count)]
+
+
+async def per_message(port: int, count: int) -> float:
+    local = ConnectionConfig(**{**conf.model_dump(), "MAIL_SERVER": "127.0.0.1", "MAIL_PORT": port,
+                                "MAIL_SSL_TLS": False, "USE_CREDENTIALS": False})
+    started = perf_counter()
+    for job in jobs(count):
+        message = MessageSchema(subject="Confirm your email ", recipients=[job["email"]],
+                                template_body={"host": job["host"], "username": job["username"], "token": "x"},
+                                subtype=MessageType.html)
+        await FastMail(local).send_message(message, template_name="email_template.html")
+    return count / (perf_counter() - started)
+
+
+async def batched(port: int, count: int, batch_size: int, pool_size: int) -> tuple[float, int]:
+    def client():
+        return aiosmtplib.SMTP(hostname="127.0.0.1", port=port, start_tls=False)
+
+    pool = MailClient(client, pool_size=pool_size, messages_per_connection=count)
+    items = jobs(count)
+    started = perf_counter()
+    for start in range(0, count, batch_size):
+        errors = await send_emails(items[start:start + batch_size], pool)
+        assert not any(errors), errors
+    rate = count / (perf_counter() - started)
+    await pool.close()
+    return rate, pool.connects
+
+
+async def main(args):
+    sink = Sink()
+    controller = Controller(sink, hostname="127.0.0.1", port=args.port)
+    controller.start()
+    try:
+        print(f"messages={args.messages}")
+        print(f"{'FastMail per message':<24} {await per_message(args.port, args.messages):9.1f} msg/s")
+        for batch_size in args.batch_sizes:
+            for pool_size in args.pool_sizes:
+                rate, connects = await batched(args.port, args.messages, batch_size, pool_size)
+                print(f"{f'batch={batch_size} pool={pool_size}':<24} {rate:9.1f} msg/s  {connects} connections")
+    finally:
+        controller.stop()
+    assert sink.received == args.messages * (1 + len(args.batch_sizes) * len(args.pool_sizes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--port", type=int, default=8025)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,59 @@
+"""
+Bandwidth and latency of polling GET /api/contact/all while nothing changes: full responses versus
+conditional requests with If-None-Match. Redis is replaced by the in-memory stand-in of benchmarks.auth
+and authentication is overridden as in benchmarks.load:
+
+    python -m benchmarks.etag --contacts 1000 --polls 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+from time import perf_counter
+
+import httpx
+
+from benchmarks.auth import MemoryRedis
+from benchmarks.load import override_dependencies, prepare
+from main import app
+from src.services.contact_versions import contact_versions
+
+
+async def poll(client: httpx.AsyncClient, path: str, polls: int, conditional: bool) -> tuple[list[float], int]:
+    timings, received, tag = [], 0, None
+    for _ in range(polls):
+        headers = {"If-None-Match": tag} if conditional and tag else {}
+        started = perf_counter()
+        response = await client.get(path, headers=headers)
+        timings.append(perf_counter() - started)
+        assert response.status_code in (200, 304), response.text
+        received += len(response.content)
+        tag = response.headers.get("ETag", tag)
+    return timings, received
+
+
+async def main(args):
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine, session_maker, user = await prepare(database_url, args.contacts)
+    override_dependencies(session_maker, user)
+    contact_versions.redis = MemoryRedis()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{args.path}  contacts={args.contacts}  polls={args.polls}")
+        for name, conditional in (("full", False), ("if-none-match", True)):
+            timings, received = await poll(client, args.path, args.polls, conditional)
+            quantiles = statistics.quantiles(timings, n=100, method="inclusive")
+            print(f"{name:<14} p50={quantiles[49] * 1000:7.2f} ms  p95={quantiles[94] * 1000:7.2f} ms  "
+                  f"body/poll={received / args.polls / 1024:9.1f} KiB")
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument("--path", default="/api/contact/all")
+    parser.add_argument("--contacts", type=int, default=1000)
+    parser.add_argument("--polls", type=int, default=500)
+    asyncio.run(main(parser.parse_args()))
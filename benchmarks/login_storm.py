@@ -0,0 +1,84 @@
+"""
+Latency of an unrelated endpoint (GET /) while a storm of logins runs bcrypt in the same worker.
+
+    python -m benchmarks.login_storm --logins 200 --concurrency 20
+    python -m benchmarks.login_storm --inline   # bcrypt on the event loop, as before the worker pool
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+from time import perf_counter
+from unittest.mock import patch
+
+import httpx
+
+from benchmarks.auth import MemoryRedis
+from benchmarks.load import override_dependencies, prepare
+from main import app
+from src.services.auth import auth_service
+from src.services.passwords import PasswordHasher
+from src.services.user_cache import user_cache
+
+PASSWORD = "123456789"
+
+
+async def run_inline(self, func, *args):
+    return func(*args)
+
+
+async def main(args):
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine, session_maker, user = await prepare(database_url, 0)
+    async with session_maker() as db:
+        user.password = auth_service.pwd_context.hash(PASSWORD)
+        db.add(user)
+        await db.commit()
+    override_dependencies(session_maker, user)
+    form = {"username": user.email, "password": PASSWORD}
+    done = asyncio.Event()
+    latencies = []
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        logins = iter(range(args.logins))
+
+        async def login_worker():
+            for _ in logins:
+                response = await client.post("/api/auth/login", data=form)
+                response.raise_for_status()
+
+        async def probe():
+            while not done.is_set():
+                started = perf_counter()
+                (await client.get("/")).raise_for_status()
+                latencies.append(perf_counter() - started)
+                await asyncio.sleep(0.005)
+
+        prober = asyncio.create_task(probe())
+        started = perf_counter()
+        await asyncio.gather(*(login_worker() for _ in range(args.concurrency)))
+        elapsed = perf_counter() - started
+        done.set()
+        await prober
+
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    mode = "inline" if args.inline else f"pool({auth_service.hasher.executor._max_workers} workers)"
+    print(f"{mode}: {args.logins / elapsed:6.1f} logins/s, GET / p50={quantiles[49] * 1000:7.1f} ms "
+          f"p99={quantiles[98] * 1000:7.1f} ms max={max(latencies) * 1000:7.1f} ms")
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--inline", action="store_true", help="hash on the event loop")
+    args = parser.parse_args()
+    with patch.object(user_cache, "redis", MemoryRedis()):
+        if args.inline:
+            with patch.object(PasswordHasher, "_run", run_inline):
+                asyncio.run(main(args))
+        else:
+            asyncio.run(main(args))
@@ -0,0 +1,47 @@
+"""
+Fixtures of the pytest-benchmark micro-benchmarks: one event loop for the session and a temporary SQLite
+database of synthetic users and contacts (benchmarks.load). Run them with
+
+    pytest benchmarks/micro --benchmark-autosave
+    pytest benchmarks/micro --benchmark-compare --benchmark-compare-fail=mean:10%
+
+and point BENCH_DATABASE_URL at PostgreSQL to measure the production dialect.
+"""
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.auth import MemoryRedis
+from benchmarks.load import prepare_users
+from src.services.contact_versions import contact_versions
+
+USERS = int(os.environ.get("BENCH_USERS", 2))
+CONTACTS = int(os.environ.get("BENCH_CONTACTS", 2000))
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def database(loop):
+    url = os.environ.get("BENCH_DATABASE_URL") or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine, session_maker, users = loop.run_until_complete(prepare_users(url, USERS, CONTACTS))
+    contact_versions.redis = MemoryRedis()
+    yield session_maker, users
+    loop.run_until_complete(engine.dispose())
+
+
+@pytest.fixture
+def run(loop, benchmark):
+    """Benchmarks an async function: run(func, *args) times loop.run_until_complete(func(*args))."""
+
+    def run(func, *args):
+        return benchmark(lambda: loop.run_until_complete(func(*args)))
+
+    return run
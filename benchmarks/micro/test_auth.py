@@ -0,0 +1,47 @@
+import pytest
+from passlib.context import CryptContext
+
+from benchmarks.auth import MemoryRedis, make_user
+from src.services.auth import auth_service
+from src.services.passwords import PasswordHasher
+
+
+@pytest.fixture(scope="module")
+def access_token(loop):
+    return loop.run_until_complete(auth_service.create_access_token({"sub": "benchmark@example.com"}))
+
+
+def test_create_access_token(run):
+    run(auth_service.create_access_token, {"sub": "benchmark@example.com"})
+
+
+def test_decode_token(benchmark, access_token):
+    benchmark(auth_service.codec.decode, access_token)
+
+
+def test_decode_token_cached(benchmark, access_token):
+    benchmark(auth_service.codec.decode_cached, access_token)
+
+
+def test_get_current_user_cache_hit(run, loop, access_token, monkeypatch):
+    monkeypatch.setattr(auth_service.cache, "redis", MemoryRedis())
+    loop.run_until_complete(auth_service.cache.set(make_user()))
+    user = run(auth_service.get_current_user, access_token, None)
+    assert user.email == "benchmark@example.com"
+
+
+def test_get_current_user_redis_hit(run, loop, access_token, monkeypatch):
+    monkeypatch.setattr(auth_service.cache, "redis", MemoryRedis())
+    loop.run_until_complete(auth_service.cache.set(make_user()))
+
+    async def without_local_tier(token):
+        auth_service.cache.local.clear()
+        return await auth_service.get_current_user(token, None)
+
+    run(without_local_tier, access_token)
+
+
+def test_hash_password(run):
+    # few rounds, so the benchmark shows the overhead around bcrypt rather than bcrypt itself
+    hasher = PasswordHasher(CryptContext(schemes=["bcrypt"], bcrypt__rounds=4), workers=1, queue_size=1)
+    run(hasher.hash, "123456789")
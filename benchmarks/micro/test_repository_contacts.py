@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.repository import contacts as repository_contacts
+
+
+@pytest.fixture
+def db(loop, database):
+    session_maker, users = database
+    session = session_maker()
+    yield session, users[0]
+    loop.run_until_complete(session.close())
+
+
+def test_get_contacts_page(run, db):
+    session, user = db
+    rows = run(repository_contacts.get_contacts, user, session, 100, None)
+    assert len(rows) == 100
+
+
+def test_get_contacts_all(run, db):
+    session, user = db
+    rows = run(repository_contacts.get_contacts, user, session)
+    assert rows
+
+
+def test_get_contact(run, loop, db):
+    session, user = db
+    contact_id = loop.run_until_complete(repository_contacts.get_contacts(user, session, 1))[0].id
+    assert run(repository_contacts.get_contact, contact_id, user, session) is not None
+
+
+def test_search_contact(run, db):
+    session, user = db
+    run(repository_contacts.search_contact, "olena", user, session)
+
+
+def test_birthdays_per_weak(run, db):
+    session, user = db
+    run(repository_contacts.birthdays_per_weak, user, session, 7)
+
+
+def test_get_changes(run, db):
+    session, user = db
+    since = (datetime.utcnow() - timedelta(days=1), 0)
+    run(repository_contacts.get_changes, user, session, since, 1000, 0)
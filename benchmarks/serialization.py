@@ -0,0 +1,77 @@
+"""
+Cost of turning 10k contacts into a JSON response body, split into fetching and encoding:
+
+- orm + response_model: ORM objects validated through List[ResponseContact] and encoded with the stdlib json
+  (the previous list endpoints)
+- orm + response_model + orjson: the same with ORJSONResponse, the new default response class
+- rows + orjson: CONTACT_COLUMNS rows turned into dicts by contact_row_to_dict (the list endpoints now)
+
+    python -m benchmarks.serialization --contacts 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+from time import perf_counter
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import select
+
+from benchmarks.load import prepare
+from src.database.models import Contact
+from src.repository.contacts import get_contacts
+from src.schemas import ResponseContact
+from src.services.serializers import contact_row_to_dict
+
+FIELD = create_response_field(name="Response_get_contacts", type_=List[ResponseContact], mode="serialization")
+
+
+async def orm_fetch(db, user):
+    return (await db.execute(select(Contact).where(Contact.user_id == user.id).order_by(Contact.id))).scalars().all()
+
+
+async def validated(contacts, response_class) -> bytes:
+    content = await serialize_response(field=FIELD, response_content=contacts)
+    return response_class(content).body
+
+
+async def rows_to_json(rows, response_class) -> bytes:
+    return response_class([contact_row_to_dict(row) for row in rows]).body
+
+
+MODES = {
+    "orm + response_model": (orm_fetch, validated, JSONResponse),
+    "orm + response_model + orjson": (orm_fetch, validated, ORJSONResponse),
+    "rows + orjson": (lambda db, user: get_contacts(user, db), rows_to_json, ORJSONResponse),
+}
+
+
+async def main(args):
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    engine, session_maker, user = await prepare(database_url, args.contacts)
+    print(f"{engine.dialect.name}  contacts={args.contacts}  repeat={args.repeat}")
+    for name, (fetch, encode, response_class) in MODES.items():
+        fetch_times, encode_times = [], []
+        for _ in range(args.repeat):
+            async with session_maker() as db:
+                started = perf_counter()
+                contacts = await fetch(db, user)
+                fetched = perf_counter()
+                body = await encode(contacts, response_class)
+                fetch_times.append(fetched - started)
+                encode_times.append(perf_counter() - fetched)
+        print(f"{name:<30} fetch={statistics.median(fetch_times) * 1000:8.1f} ms  "
+              f"encode={statistics.median(encode_times) * 1000:8.1f} ms  body={len(body) / 1024:8.0f} KiB")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument("--contacts", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,52 @@
+"""
+Access tokens verified per second on one core: python-jose with the raw secret (the old code path), the
+TokenCodec backends with their prepared keys, and TokenCodec.decode_cached on a warm cache.
+
+    python -m benchmarks.tokens --tokens 1000 --rounds 20
+"""
+import argparse
+import importlib.util
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from jose import jwt
+
+from src.conf.config import settings
+from src.services.token_codec import TokenCodec
+
+
+def make_tokens(codec: TokenCodec, count: int) -> list[str]:
+    now = datetime.utcnow()
+    return [codec.encode({"sub": f"user{i}@example.com", "iat": now, "exp": now + timedelta(minutes=15),
+                          "scope": "access_token"}) for i in range(count)]
+
+
+def rate(verify, tokens: list[str], rounds: int) -> float:
+    started = perf_counter()
+    for _ in range(rounds):
+        for token in tokens:
+            verify(token)
+    return len(tokens) * rounds / (perf_counter() - started)
+
+
+def main(args):
+    secret, algorithm = settings.secret_key_jwt, settings.algorithm
+    jose = TokenCodec(secret, algorithm, cache_size=args.tokens)
+    tokens = make_tokens(jose, args.tokens)
+    print(f"{algorithm}  tokens={args.tokens}  rounds={args.rounds}")
+    results = {"jose, raw secret": rate(lambda token: jwt.decode(token, secret, algorithms=[algorithm]),
+                                        tokens, args.rounds),
+               "jose, prepared key": rate(jose.decode, tokens, args.rounds)}
+    if importlib.util.find_spec("jwt"):
+        results["pyjwt"] = rate(TokenCodec(secret, algorithm, backend="pyjwt").decode, tokens, args.rounds)
+    rate(jose.decode_cached, tokens, 1)  # warm up
+    results["decode_cached"] = rate(jose.decode_cached, tokens, args.rounds)
+    for name, value in results.items():
+        print(f"{name:<20} {value:12.0f} tokens/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=1000, help="distinct tokens, all of them fit in the cache")
+    parser.add_argument("--rounds", type=int, default=20)
+    main(parser.parse_args())
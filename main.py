@@ -1,16 +1,30 @@
+import logging
+
 import redis.asyncio as redis
 import uvicorn
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi_limiter import FastAPILimiter
 
 from src.conf.config import settings
-from src.database.connect import get_db
-from src.routes import contacts, auth, users
+from src.database.connect import get_db, engine
+from src.database.pool import pool_metrics, pool_status
+from src.database.redis import get_redis, close_redis
+from src.routes import contacts, auth, users, debug
+from src.services.auth import auth_service
+from src.services.contact_cache import contact_cache
+from src.services.contact_versions import contact_versions
+from src.services.email_queue import email_queue
+from src.services.metrics import MetricsMiddleware, metrics
+from src.services.profiler import ProfilerMiddleware, sql_profiler
+
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 origins = [
     "http://localhost:3000"
@@ -22,46 +36,111 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # response headers the browser frontend reads: the keyset cursor of /all, the validator for If-None-Match
+    # and the SQL profile summary
+    expose_headers=["X-Next-Cursor", "ETag", "X-SQL-Profile"],
 )
+app.add_middleware(ProfilerMiddleware, profiler=sql_profiler)
+# outermost, so the measured time includes the other middleware
+app.add_middleware(MetricsMiddleware, metrics=metrics)
 
 
 @app.on_event("startup")
 async def startup():
-    r = await redis.Redis(
-        host=settings.redis_host,
-        port=settings.redis_port,
-        password=settings.redis_password,
-        db=0,
-        encoding="utf-8",
-        decode_responses=True
-    )
+    # one connection pool per worker, shared by the rate limiter and the Redis-backed services; injected on every
+    # startup because shutdown closes the client and a second startup (reload, lifespan in tests) creates a new one
+    r = get_redis()
+    for service in (auth_service.cache, contact_cache, contact_versions, email_queue):
+        service.redis = r
     await FastAPILimiter.init(r)
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    await close_redis()
+
+
 @app.get("/")
 def root():
     return {"message": "Welcome to FastAPI!"}
 
 
 @app.get("/api/healthchecker")
-def healthchecker(db: Session = Depends(get_db)):
+async def healthchecker(db: AsyncSession = Depends(get_db)):
     try:
         # Make request
-        result = db.execute(text("SELECT 1")).fetchone()
-        print(result)
+        result = (await db.execute(text("SELECT 1"))).fetchone()
         if result is None:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                                 detail="Database is not configured correctly")
         return {"message": "Welcome to FastAPI!"}
-    except Exception as e:
-        print(e)
+    except Exception:
+        logger.exception("database health check failed")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail="Error connecting to the database")
 
 
+@app.get("/api/healthchecker/pool")
+def pool_stats():
+    """
+    The pool_stats function reports the state of the database connection pool: connections in use,
+    overflow, checkout timeouts and a histogram of the time requests waited for a connection.
+
+    :return: The pool status
+    """
+    return pool_status(engine.pool)
+
+
+@app.get("/api/healthchecker/cache")
+def cache_stats():
+    """
+    The cache_stats function reports the hits, misses, Redis errors and coalesced loads of the contact cache
+    since the worker started.
+
+    :return: The counters
+    """
+    return contact_cache.stats()
+
+
+@app.get("/api/healthchecker/email")
+async def email_stats():
+    """
+    The email_stats function reports the email queue: jobs waiting, retries scheduled, dead jobs and the number
+    of emails the workers sent, retried and gave up on. Sample it twice to get the messages per second.
+
+    :return: The numbers
+    """
+    try:
+        return await email_queue.stats()
+    except redis.RedisError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Email queue unavailable")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    The prometheus_metrics function exposes the metrics of this worker in the Prometheus text format:
+    requests, latencies and SQL time per route, requests in flight, Redis and bcrypt timings, the connection pool
+    and the contact cache. Every worker process keeps its own metrics, so scrape each of them.
+
+    :return: The exposition text
+    """
+    pool = pool_status(engine.pool)
+    gauges = {name: value for name, value in pool.items() if isinstance(value, int)}
+    extra = [(f"db_pool_{name}", "gauge", f"Connection pool {name}", {(): value}) for name, value in gauges.items()]
+    extra.append(("db_pool_wait_duration_seconds", "histogram", "Time spent waiting for a pooled connection",
+                  {(): pool_metrics.wait_time}))
+    extra.extend((f"contact_cache_{name}_total", "counter", f"Contact cache {name}", {(): value})
+                 for name, value in contact_cache.stats().items())
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4")
+
+
 app.include_router(auth.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
+app.include_router(debug.router, prefix='/api')
+if settings.avatar_storage == "local":
+    app.mount(settings.avatar_base_url, StaticFiles(directory=settings.avatar_directory), name="avatars")
 
 if __name__ == '__main__':
     uvicorn.run(app="main:app", reload=True)
@@ -22,6 +22,14 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 config.set_main_option("sqlalchemy.url", url_to_db)
+
+# full-text search structures are created with raw DDL (src/database/search.py), not declared on the models
+SEARCH_OBJECTS = {"search_vector", "ix_contacts_search_vector", "contacts_fts"}
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    return not (name in SEARCH_OBJECTS or (name or "").startswith("contacts_fts"))
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -46,6 +54,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -67,7 +76,7 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_object=include_object
         )
 
         with context.begin_transaction():
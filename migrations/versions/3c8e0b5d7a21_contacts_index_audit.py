@@ -0,0 +1,39 @@
+"""Contacts index audit
+
+Revision ID: 3c8e0b5d7a21
+Revises: 59f27643605c
+Create Date: 2026-10-17 13:40:05.219876
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c8e0b5d7a21'
+down_revision: Union[str, None] = '59f27643605c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# single-column indexes of the init migration: ix_contacts_id duplicates the primary key, the others are
+# never used alone (queries filter by user_id first, text search goes through the search index)
+SINGLE_COLUMN = ('birthday', 'description', 'email', 'firstname', 'id', 'lastname', 'phone')
+
+
+def upgrade() -> None:
+    op.create_index('ix_contacts_user_id_id', 'contacts', ['user_id', 'id'], unique=False)
+    op.create_index('ix_contacts_user_id_lastname_firstname', 'contacts', ['user_id', 'lastname', 'firstname'],
+                    unique=False)
+    op.create_index('ix_contacts_user_id_email', 'contacts', ['user_id', 'email'], unique=False)
+    for column in SINGLE_COLUMN:
+        op.drop_index(op.f(f'ix_contacts_{column}'), table_name='contacts')
+
+
+def downgrade() -> None:
+    for column in SINGLE_COLUMN:
+        op.create_index(op.f(f'ix_contacts_{column}'), 'contacts', [column], unique=False)
+    op.drop_index('ix_contacts_user_id_email', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_lastname_firstname', table_name='contacts')
+    op.drop_index('ix_contacts_user_id_id', table_name='contacts')
@@ -0,0 +1,50 @@
+"""Contacts search
+
+Revision ID: 59f27643605c
+Revises: e41e693c2dcb
+Create Date: 2026-10-17 11:02:17.604711
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '59f27643605c'
+down_revision: Union[str, None] = 'e41e693c2dcb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = 'firstname, lastname, email, phone, description'
+NEW = 'new.firstname, new.lastname, new.email, new.phone, new.description'
+OLD = 'old.firstname, old.lastname, old.email, old.phone, old.description'
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute(f"CREATE VIRTUAL TABLE contacts_fts USING fts5({COLUMNS}, content='contacts', content_rowid='id')")
+        op.execute(f"CREATE TRIGGER contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+                   f"INSERT INTO contacts_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW}); END")
+        op.execute(f"CREATE TRIGGER contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+                   f"INSERT INTO contacts_fts(contacts_fts, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD}); END")
+        op.execute(f"CREATE TRIGGER contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+                   f"INSERT INTO contacts_fts(contacts_fts, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD}); "
+                   f"INSERT INTO contacts_fts(rowid, {COLUMNS}) VALUES (new.id, {NEW}); END")
+        op.execute("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')")
+    else:
+        op.execute("ALTER TABLE contacts ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', "
+                   f"regexp_replace(concat_ws(' ', {COLUMNS}), '[^[:alnum:]]+', ' ', 'g'))) STORED")
+        op.create_index('ix_contacts_search_vector', 'contacts', ['search_vector'], unique=False,
+                        postgresql_using='gin')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in ('contacts_fts_ai', 'contacts_fts_ad', 'contacts_fts_au'):
+            op.execute(f"DROP TRIGGER {trigger}")
+        op.execute("DROP TABLE contacts_fts")
+    else:
+        op.drop_index('ix_contacts_search_vector', table_name='contacts')
+        op.drop_column('contacts', 'search_vector')
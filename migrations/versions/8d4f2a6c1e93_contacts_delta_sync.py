@@ -0,0 +1,34 @@
+"""Contacts delta sync
+
+Revision ID: 8d4f2a6c1e93
+Revises: 3c8e0b5d7a21
+Create Date: 2026-10-17 14:25:48.730115
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4f2a6c1e93'
+down_revision: Union[str, None] = '3c8e0b5d7a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.add_column('contacts', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("UPDATE contacts SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', 'now')")
+    else:
+        op.execute("UPDATE contacts SET updated_at = timezone('utc', now())")
+    op.create_index('ix_contacts_user_id_updated_at', 'contacts', ['user_id', 'updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_updated_at', table_name='contacts')
+    op.drop_column('contacts', 'deleted_at')
+    op.drop_column('contacts', 'updated_at')
@@ -0,0 +1,33 @@
+"""Birthday window
+
+Revision ID: e41e693c2dcb
+Revises: 1afd01807c25
+Create Date: 2026-10-17 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41e693c2dcb'
+down_revision: Union[str, None] = '1afd01807c25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birth_md', sa.Integer(), nullable=True))
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute("UPDATE contacts SET birth_md = CAST(strftime('%m%d', birthday) AS INTEGER)")
+    else:
+        op.execute("UPDATE contacts SET birth_md = "
+                   "CAST(EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday) AS INTEGER)")
+    op.create_index('ix_contacts_user_id_birth_md', 'contacts', ['user_id', 'birth_md'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birth_md', table_name='contacts')
+    op.drop_column('contacts', 'birth_md')
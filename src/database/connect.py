@@ -1,18 +1,56 @@
-from sqlalchemy.engine import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from src.conf.config import settings
+from src.database.pool import InstrumentedQueuePool, pool_metrics
+from src.services.metrics import metrics
+from src.services.profiler import sql_profiler
 
 url_to_db = SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
 
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
 
-engine = create_engine(url_to_db, echo=True)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def to_async_url(url: str) -> str:
+    """
+    The to_async_url function swaps the DBAPI driver of a database url for its asyncio counterpart,
+    so the same setting can be shared by the application (asyncpg / aiosqlite) and Alembic (psycopg2 / pysqlite).
 
-def get_db():
-    db = SessionLocal()
-    try:
+    :param url: str: Database url as it is written in the settings
+    :return: The database url with an async driver
+    """
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        return url
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+
+def engine_options(url: str) -> dict:
+    """
+    The engine_options function builds the keyword arguments for create_async_engine from the settings.
+    SQLite keeps the pool SQLAlchemy picks for it, every other backend gets a sized, instrumented queue pool.
+
+    :param url: str: Database url the engine is created for
+    :return: Keyword arguments for create_async_engine
+    """
+    options = {"echo": settings.db_echo, "pool_pre_ping": settings.db_pool_pre_ping}
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(poolclass=InstrumentedQueuePool, pool_size=settings.db_pool_size,
+                       max_overflow=settings.db_max_overflow, pool_timeout=settings.db_pool_timeout,
+                       pool_recycle=settings.db_pool_recycle)
+    return options
+
+
+async_url_to_db = to_async_url(url_to_db)
+
+engine = create_async_engine(async_url_to_db, **engine_options(async_url_to_db))
+pool_metrics.attach(engine.sync_engine.pool)
+metrics.attach(engine.sync_engine)
+sql_profiler.attach(engine.sync_engine)
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
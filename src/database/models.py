@@ -1,23 +1,44 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey, Boolean
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime, func, ForeignKey, Boolean, Index
 from sqlalchemy.orm import declarative_base, relationship
 
 from src.database.connect import engine
+from src.database.search import attach_search_ddl
 
 Base = declarative_base()
 
 
 class Contact(Base):
     __tablename__ = "contacts"
-    id = Column(Integer, primary_key=True, index=True)
-    firstname = Column(String, index=True)
-    lastname = Column(String, index=True)
-    email = Column(String, index=True)
-    phone = Column(String, index=True)
-    birthday = Column(DateTime, index=True)
-    description = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    firstname = Column(String)
+    lastname = Column(String)
+    email = Column(String)
+    phone = Column(String)
+    birthday = Column(DateTime)
+    description = Column(String)
+    # month * 100 + day of the birthday, e.g. 1030 for October 30, kept in sync by the repository
+    birth_md = Column(Integer)
+    # UTC time of the last change, set by the application so it is precise and comparable with the sync cursor
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # set instead of deleting the row, so delta sync can report the deletion
+    deleted_at = Column(DateTime)
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="contacts")
 
+    # every query is per user, so every index starts with user_id; free text is served by the search index
+    __table_args__ = (
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_lastname_firstname', 'user_id', 'lastname', 'firstname'),
+        Index('ix_contacts_user_id_email', 'user_id', 'email'),
+        Index('ix_contacts_user_id_birth_md', 'user_id', 'birth_md'),
+        Index('ix_contacts_user_id_updated_at', 'user_id', 'updated_at'),
+    )
+
+
+attach_search_ddl(Contact.__table__)
+
 
 class User(Base):
     __tablename__ = "users"
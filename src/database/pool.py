@@ -0,0 +1,74 @@
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+from src.services.metrics import Histogram
+
+
+class PoolMetrics:
+    """
+    Counters for the connection pool of the application engine: how long requests wait for a connection,
+    how many connections were opened and how many checkouts timed out because the pool was exhausted.
+    """
+
+    def __init__(self):
+        self.wait_time = Histogram()
+        self.connects = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.invalidated = 0
+
+    def attach(self, pool: Pool) -> None:
+        event.listen(pool, "connect", self._on_connect)
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidated += 1
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    The default asyncio queue pool, timing every checkout so the time spent waiting for a free connection
+    ends up in pool_metrics.wait_time.
+    """
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.wait_time.observe(perf_counter() - started)
+
+
+def pool_status(pool: Pool) -> dict:
+    """
+    The pool_status function collects the current state of a connection pool together with the counters
+    gathered by pool_metrics.
+
+    :param pool: Pool: The pool of the engine
+    :return: A dict that can be returned from a route as is
+    """
+    status = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if method is not None:
+            status[name] = method()
+    status.update(connects=pool_metrics.connects, checkouts=pool_metrics.checkouts,
+                  timeouts=pool_metrics.timeouts, invalidated=pool_metrics.invalidated,
+                  wait_time=pool_metrics.wait_time.snapshot())
+    return status
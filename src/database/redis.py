@@ -0,0 +1,52 @@
+import redis.asyncio as redis
+
+from src.conf.config import settings
+
+_client: redis.Redis | None = None
+
+
+def create_redis(socket_timeout: float | None = settings.redis_socket_timeout) -> redis.Redis:
+    """
+    The create_redis function creates an asyncio Redis client on top of a bounded connection pool configured
+    from the settings. When every connection is busy a command waits up to redis_pool_timeout for a free one.
+
+    :param socket_timeout: float | None: Seconds to wait for a reply; blocking commands need more than they block
+    :return: A Redis client
+    """
+    pool = redis.BlockingConnectionPool(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        password=settings.redis_password,
+        db=0,
+        max_connections=settings.redis_max_connections,
+        timeout=settings.redis_pool_timeout,
+        socket_timeout=socket_timeout,
+        socket_connect_timeout=settings.redis_connect_timeout,
+        health_check_interval=settings.redis_health_check_interval,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+def get_redis() -> redis.Redis:
+    """
+    The get_redis function returns the Redis client shared by the whole process (user cache, rate limiter, ...).
+    The client does not connect until the first command, so it can be created at import time.
+
+    :return: The shared Redis client
+    """
+    global _client
+    if _client is None:
+        _client = create_redis()
+    return _client
+
+
+async def close_redis() -> None:
+    """
+    The close_redis function closes the shared client and disconnects its pool; called on application shutdown.
+
+    :return: Nothing
+    """
+    global _client
+    if _client is not None:
+        await _client.close(close_connection_pool=True)
+        _client = None
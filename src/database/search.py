@@ -0,0 +1,44 @@
+from sqlalchemy import DDL, Table, event
+
+SEARCH_COLUMNS = ("firstname", "lastname", "email", "phone", "description")
+
+_columns = ", ".join(SEARCH_COLUMNS)
+_new = ", ".join(f"new.{name}" for name in SEARCH_COLUMNS)
+_old = ", ".join(f"old.{name}" for name in SEARCH_COLUMNS)
+
+# Postgres: a generated tsvector over the searchable columns, punctuation turned into spaces so that
+# the parts of an email address or a phone number are separate lexemes, indexed with GIN.
+POSTGRES_DDL = (
+    "ALTER TABLE contacts ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (to_tsvector('simple', "
+    f"regexp_replace(concat_ws(' ', {_columns}), '[^[:alnum:]]+', ' ', 'g'))) STORED",
+    "CREATE INDEX ix_contacts_search_vector ON contacts USING gin (search_vector)",
+)
+
+# SQLite: an external-content FTS5 table kept in sync with contacts by triggers.
+SQLITE_INSERT_TRIGGER = (f"CREATE TRIGGER contacts_fts_ai AFTER INSERT ON contacts BEGIN "
+                         f"INSERT INTO contacts_fts(rowid, {_columns}) VALUES (new.id, {_new}); END")
+SQLITE_DDL = (
+    f"CREATE VIRTUAL TABLE contacts_fts USING fts5({_columns}, content='contacts', content_rowid='id')",
+    SQLITE_INSERT_TRIGGER,
+    f"CREATE TRIGGER contacts_fts_ad AFTER DELETE ON contacts BEGIN "
+    f"INSERT INTO contacts_fts(contacts_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old}); END",
+    f"CREATE TRIGGER contacts_fts_au AFTER UPDATE ON contacts BEGIN "
+    f"INSERT INTO contacts_fts(contacts_fts, rowid, {_columns}) VALUES ('delete', old.id, {_old}); "
+    f"INSERT INTO contacts_fts(rowid, {_columns}) VALUES (new.id, {_new}); END",
+)
+
+
+def attach_search_ddl(table: Table) -> None:
+    """
+    The attach_search_ddl function makes metadata.create_all / drop_all build and remove the full-text search
+    structures of the contacts table, so databases created without Alembic (tests, benchmarks) can search too.
+    The Alembic migration creates the same structures for deployed databases.
+
+    :param table: Table: The contacts table
+    :return: Nothing
+    """
+    for statement in POSTGRES_DDL:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+    for statement in SQLITE_DDL:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    event.listen(table, "before_drop", DDL("DROP TABLE IF EXISTS contacts_fts").execute_if(dialect="sqlite"))
@@ -1,52 +1,184 @@
-from datetime import datetime
+import re
+from datetime import date, datetime, time, timedelta
 
-from sqlalchemy import or_, and_
-from sqlalchemy.orm import Session
+from sqlalchemy import or_, and_, select, case, func, literal_column, table, column, insert, update, false, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Contact, User
-from src.schemas import ContactModel
+from src.schemas import ContactFilter, ContactModel, ContactUpdateModel
+from src.services.contact_versions import contact_versions
 
 
-async def get_contacts(user: User, db: Session):
+CONTACT_COLUMNS = (Contact.id, Contact.firstname, Contact.lastname, Contact.email, Contact.phone, Contact.birthday,
+                   Contact.description)
+MAX_ID = 2 ** 31 - 1  # largest value of an INTEGER column on Postgres
+
+
+def _live(user: User):
+    """
+    The _live function is the condition every read and write starts from: contacts of the user that are not
+    deleted. Deleted contacts stay in the table as tombstones for get_changes.
+
+    :param user: User: Owner of the contacts
+    :return: A SQL expression
+    """
+    return and_(Contact.user_id == user.id, Contact.deleted_at.is_(None))
+
+
+def _contacts_page(user: User, after_id: int | None = None, limit: int | None = None):
+    """
+    The _contacts_page function builds the keyset-paginated query shared by get_contacts and stream_contacts.
+    Rows are ordered by id, so the id of the last row of a page is the cursor of the next one.
+
+    :param user: User: Owner of the contacts
+    :param after_id: int | None: Only return contacts with a greater id
+    :param limit: int | None: Maximum number of contacts, None for all of them
+    :return: A select statement
+    """
+    stmt = select(Contact).where(_live(user)).order_by(Contact.id)
+    if after_id is not None:
+        stmt = stmt.where(Contact.id > after_id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+async def get_contacts(user: User, db: AsyncSession, limit: int | None = None, after_id: int | None = None):
     """
     The get_contacts function returns a list of contacts for the user.
         Args:
             user (User): The User object to get contacts from.
-            db (Session): A database session to use when querying the database.
+            db (AsyncSession): A database session to use when querying the database.
+            limit (int | None): Page size, all contacts are returned when it is None.
+            after_id (int | None): Keyset cursor, the id of the last contact of the previous page.
 
     :param user: User: Get the user id of the current logged in user
-    :param db: Session: Pass the database session to the function
-    :return: A list of contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param limit: int | None: Limit the number of contacts returned
+    :param after_id: int | None: Start after the contact with this id
+    :return: A list of contact rows with the CONTACT_COLUMNS fields, ordered by id
     :doc-author: Trelent
     """
-    contacts = db.query(Contact).filter(Contact.user_id == user.id).all()
-    return contacts
+    result = await db.execute(_contacts_page(user, after_id, limit).with_only_columns(*CONTACT_COLUMNS))
+    return result.all()
 
 
-async def birthdays_per_weak(user: User, db: Session):
+async def stream_contacts(user: User, db: AsyncSession, limit: int | None = None, after_id: int | None = None,
+                          chunk_size: int = 1000):
+    """
+    The stream_contacts function yields the contacts of the user as plain rows, fetched from a server-side cursor
+    chunk_size rows at a time, so memory stays flat however many contacts the user has.
+
+    :param user: User: Owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param limit: int | None: Limit the number of contacts returned
+    :param after_id: int | None: Start after the contact with this id
+    :param chunk_size: int: Number of rows fetched per round-trip
+    :return: An async iterator of rows with the CONTACT_COLUMNS fields
+    """
+    stmt = _contacts_page(user, after_id, limit).with_only_columns(*CONTACT_COLUMNS)
+    result = await db.stream(stmt.execution_options(yield_per=chunk_size))
+    async for row in result:
+        yield row
+
+
+def sync_cursor(updated_at: datetime, contact_id: int) -> str:
+    """
+    The sync_cursor function encodes the position of a change, the sort key of get_changes, as an opaque string.
+
+    :param updated_at: datetime: Time of the change
+    :param contact_id: int: Id of the changed contact
+    :return: The cursor
+    """
+    return f"{updated_at.isoformat()},{contact_id}"
+
+
+def parse_sync_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    The parse_sync_cursor function decodes a cursor made by sync_cursor.
+
+    :param cursor: str: The cursor
+    :return: The time of the change and the id of the contact
+    :raises ValueError: if the cursor is malformed
+    """
+    updated_at, _, contact_id = cursor.partition(",")
+    updated_at, contact_id = datetime.fromisoformat(updated_at), int(contact_id)
+    # updated_at is a naive UTC column and id an INTEGER one; anything else would fail in the query
+    if updated_at.tzinfo is not None:
+        raise ValueError("cursor time must not have a timezone")
+    if not 0 <= contact_id <= MAX_ID:
+        raise ValueError("cursor id out of range")
+    return updated_at, contact_id
+
+
+async def get_changes(user: User, db: AsyncSession, since: tuple[datetime, int] | None, limit: int,
+                      settle: float = 1.0):
+    """
+    The get_changes function returns the contacts of the user changed or deleted after the since cursor, ordered
+    by (updated_at, id) over the (user_id, updated_at) index. Without a cursor it returns every live contact.
+
+    Changes younger than settle seconds are left for the next call: a write that started before the cursor was
+    taken may commit a little later with an older updated_at, and would be skipped if the cursor had moved past it.
+
+    :param user: User: Owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param since: tuple[datetime, int] | None: Position of the last change the client has
+    :param limit: int: Maximum number of changes
+    :param settle: float: Age in seconds a change must reach before it is returned
+    :return: Rows with the CONTACT_COLUMNS fields plus updated_at and deleted_at
+    """
+    stmt = select(*CONTACT_COLUMNS, Contact.updated_at, Contact.deleted_at) \
+        .where(Contact.user_id == user.id, Contact.updated_at <= datetime.utcnow() - timedelta(seconds=settle))
+    if since is None:
+        stmt = stmt.where(Contact.deleted_at.is_(None))
+    else:
+        stmt = stmt.where(tuple_(Contact.updated_at, Contact.id) > tuple_(*since))
+    result = await db.execute(stmt.order_by(Contact.updated_at, Contact.id).limit(limit))
+    return result.all()
+
+
+def birth_md(birthday: date) -> int:
+    """
+    The birth_md function encodes the month and day of a date as month * 100 + day, the value stored in
+    Contact.birth_md. The encoding sorts like the calendar, so February 29 falls between February 28 and March 1.
+
+    :param birthday: date: The birthday
+    :return: The encoded month and day
+    """
+    return birthday.month * 100 + birthday.day
+
+
+async def birthdays_per_weak(user: User, db: AsyncSession, days: int = 7):
     """
     The birthdays_per_weak function returns a list of contacts that have their birthday in the next 7 days.
         Args:
             user (User): The user whose contacts are being queried.
-            db (Session): A database session to query from.
+            db (AsyncSession): A database session to query from.
+            days (int): Length of the window, today is day 0.
+
+    The window is a range over the (user_id, birth_md) index; a window that crosses the end of the year
+    is split into its December and January parts. Contacts are ordered by how soon their birthday comes.
 
     :param user: User: Get the user id from the database
-    :param db: Session: Pass the database session to the function
-    :return: A list of contacts with their birthday in the next week
+    :param db: AsyncSession: Pass the database session to the function
+    :param days: int: Number of days after today to look ahead
+    :return: A list of contact rows with their birthday in the next week
     :doc-author: Trelent
     """
-    contacts = db.query(Contact).filter(Contact.user_id == user.id).all()
-    today = datetime.now()
-    result = list()
-    for contact in contacts:
-        birthday = contact.birthday.replace(year=today.year)
-        diff = birthday - today
-        if 8 > diff.days >= 0:
-            result.append(contact)
-    return result
+    today = date.today()
+    start, end = birth_md(today), birth_md(today + timedelta(days=days))
+    stmt = select(*CONTACT_COLUMNS).where(_live(user))
+    if days < 365:
+        if start <= end:
+            stmt = stmt.where(Contact.birth_md.between(start, end))
+        else:
+            stmt = stmt.where(or_(Contact.birth_md >= start, Contact.birth_md <= end))
+    stmt = stmt.order_by(case((Contact.birth_md >= start, 0), else_=1), Contact.birth_md)
+    result = await db.execute(stmt)
+    return result.all()
 
 
-async def get_contact(contact_id: int, user: User, db: Session):
+async def get_contact(contact_id: int, user: User, db: AsyncSession):
     """
     The get_contact function takes in a contact_id and user, and returns the contact with that id.
         Args:
@@ -55,35 +187,82 @@ async def get_contact(contact_id: int, user: User, db: Session):
 
     :param contact_id: int: Find the contact in the database
     :param user: User: Get the user_id from the database
-    :param db: Session: Pass in the database session
+    :param db: AsyncSession: Pass in the database session
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
-    return contact
+    result = await db.execute(select(Contact).where(Contact.id == contact_id, _live(user)))
+    return result.scalars().first()
+
+
+def search_terms(value: str) -> list[str]:
+    """
+    The search_terms function splits a search string into the words that are matched as prefixes.
+    Punctuation separates words, the same way the search index splits emails and phone numbers.
 
+    :param value: str: The search string as typed by the user
+    :return: A list of lowercase words
+    """
+    return [term.lower() for term in re.findall(r"[^\W_]+", value)]
+
+
+def _search_statement(terms: list[str], user: User, dialect: str):
+    """
+    The _search_statement function builds the ranked search query for the database in use: the tsvector/GIN index
+    on Postgres, the FTS5 table on SQLite and a prefix LIKE on anything else. Every term has to match the start
+    of a word in the firstname, lastname, email, phone or description.
 
-async def search_contact(value: str, user: User, db: Session):
+    :param terms: list[str]: Words from search_terms
+    :param user: User: Owner of the contacts
+    :param dialect: str: Name of the database dialect
+    :return: A select statement
+    """
+    stmt = select(Contact).where(_live(user))
+    if dialect == "postgresql":
+        search_vector = literal_column("contacts.search_vector")
+        query = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        return stmt.where(search_vector.op("@@")(query)).order_by(func.ts_rank(search_vector, query).desc(),
+                                                                   Contact.id)
+    if dialect == "sqlite":
+        fts = table("contacts_fts", column("rowid"), column("rank"))
+        query = " ".join(f'"{term}"*' for term in terms)
+        return stmt.join(fts, fts.c.rowid == Contact.id) \
+            .where(literal_column("contacts_fts").op("MATCH")(query)).order_by(fts.c.rank, Contact.id)
+    columns = (Contact.firstname, Contact.lastname, Contact.email, Contact.phone, Contact.description)
+    for term in terms:
+        stmt = stmt.where(or_(*(col.ilike(f"{term}%") for col in columns)))
+    return stmt.order_by(Contact.id)
+
+
+async def search_contact(value: str, user: User, db: AsyncSession, limit: int = 50, offset: int = 0):
     """
     The search_contact function searches for a contact in the database.
         Args:
             value (str): The search term to look for.
             user (User): The user who is searching for the contact.
+            limit (int): Page size.
+            offset (int): Number of results to skip.
+
+    Every word of the value is matched as a prefix (type-ahead) against the full-text index, best matches first.
 
-    :param value: str: Search for a contact by firstname, lastname or email
+    :param value: str: Search for a contact by firstname, lastname, email, phone or description
     :param user: User: Get the user id from the user object
-    :param db: Session: Pass the database session to the function
-    :return: A list of contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param limit: int: Limit the number of contacts returned
+    :param offset: int: Skip this many contacts
+    :return: A list of contact rows with the CONTACT_COLUMNS fields
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter(
-        and_(Contact.user_id == user.id,
-             or_(Contact.firstname == str(value), Contact.lastname == str(value), Contact.email == str(value)))
-    ).all()
-    return contact
+    terms = search_terms(str(value))
+    if not terms:
+        return []
+    stmt = _search_statement(terms, user, db.get_bind().dialect.name).with_only_columns(*CONTACT_COLUMNS) \
+        .limit(limit).offset(offset)
+    result = await db.execute(stmt)
+    return result.all()
 
 
-async def create_contact(body: ContactModel, user: User, db: Session):
+async def create_contact(body: ContactModel, user: User, db: AsyncSession):
     """
     The create_contact function creates a new contact in the database.
         Args:
@@ -92,19 +271,76 @@ async def create_contact(body: ContactModel, user: User, db: Session):
 
     :param body: ContactModel: Pass the contact data to the function
     :param user: User: Get the user id of the logged in user
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The contact object that was created
     :doc-author: Trelent
     """
-    contact = Contact(firstname=body.firstname, lastname=body.lastname, email=body.email, phone=body.phone,
-                      birthday=body.birthday, description=body.description, user_id=user.id)
+    contact = Contact(**contact_values(body, user))
     db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    await db.commit()
+    await contact_versions.bump(user.id)
+    await db.refresh(contact)
+    return contact
+
+
+COPY_COLUMNS = ("firstname", "lastname", "email", "phone", "birthday", "birth_md", "description", "user_id",
+                "updated_at")
+
+
+def contact_values(body: ContactModel, user: User) -> dict:
+    """
+    The contact_values function turns a validated contact into the column values of a new contacts row.
+
+    :param body: ContactModel: The contact
+    :param user: User: Owner of the contact
+    :return: A dict of column values
+    """
+    return {"firstname": body.firstname, "lastname": body.lastname, "email": body.email, "phone": body.phone,
+            "birthday": body.birthday, "birth_md": birth_md(body.birthday), "description": body.description,
+            "user_id": user.id}
+
+
+async def create_contacts(bodies: list[ContactModel], user: User, db: AsyncSession) -> int:
+    """
+    The create_contacts function inserts a batch of contacts in one transaction: with COPY when the database
+    is Postgres behind asyncpg, otherwise with a single executemany INSERT.
+
+    :param bodies: list[ContactModel]: Validated contacts
+    :param user: User: Owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The number of contacts inserted
+    """
+    if not bodies:
+        return 0
+    rows = [contact_values(body, user) for body in bodies]
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql" and bind.dialect.driver == "asyncpg":
+        connection = await db.connection()
+        raw = await connection.get_raw_connection()
+        # COPY skips the column defaults, so updated_at is filled in here
+        updated_at = datetime.utcnow()
+        records = [tuple(datetime.combine(row[name], time()) if name == "birthday" else row[name]
+                         for name in COPY_COLUMNS[:-1]) + (updated_at,) for row in rows]
+        await raw.driver_connection.copy_records_to_table("contacts", records=records, columns=COPY_COLUMNS)
+    else:
+        await db.execute(insert(Contact), rows)
+    await db.commit()
+    await contact_versions.bump(user.id)
+    return len(rows)
+
+
+async def _update_contact(values: dict, contact_id: int, user: User, db: AsyncSession):
+    stmt = update(Contact).where(Contact.id == contact_id, _live(user)).values(**values) \
+        .returning(Contact)
+    result = await db.execute(stmt, execution_options={"synchronize_session": False})
+    contact = result.scalars().first()
+    await db.commit()
+    if contact:
+        await contact_versions.bump(user.id)
     return contact
 
 
-async def update_contact(body: ContactModel, contact_id: int, user: User, db: Session):
+async def update_contact(body: ContactModel, contact_id: int, user: User, db: AsyncSession):
     """
     The update_contact function updates a contact in the database.
         Args:
@@ -112,39 +348,140 @@ async def update_contact(body: ContactModel, contact_id: int, user: User, db: Se
             contact_id (int): The id of the contact to update.
             user (User): The current logged-in user, used for authorization purposes.
 
+    The update is a single UPDATE ... RETURNING scoped by the id and the owner of the contact.
+
     :param body: ContactModel: Pass the contact information that is being updated
     :param contact_id: int: Identify which contact to update
-    :param user: User: Check if the user is logged in
-    :param db: Session: Access the database
-    :return: The updated contact
+    :param user: User: Only contacts of this user are updated
+    :param db: AsyncSession: Access the database
+    :return: The updated contact or None if the user has no such contact
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter_by(id=contact_id).first()
-    if contact:
-        contact.firstname = body.firstname
-        contact.lastname = body.lastname
-        contact.email = body.email
-        contact.phone = body.phone
-        contact.birthday = body.birthday
-        contact.description = body.description
-        db.commit()
-    return contact
+    values = body.model_dump()
+    values["birth_md"] = birth_md(body.birthday)
+    return await _update_contact(values, contact_id, user, db)
+
+
+async def patch_contact(body: ContactUpdateModel, contact_id: int, user: User, db: AsyncSession):
+    """
+    The patch_contact function is a partial update_contact: only the fields set in the body are written.
+
+    :param body: ContactUpdateModel: The fields to change
+    :param contact_id: int: Identify which contact to update
+    :param user: User: Only contacts of this user are updated
+    :param db: AsyncSession: Access the database
+    :return: The updated contact or None if the user has no such contact
+    """
+    values = contact_changes(body)
+    if not values:
+        return await get_contact(contact_id, user, db)
+    return await _update_contact(values, contact_id, user, db)
 
 
-async def remove_contact(contact_id: int, user: User, db: Session):
+async def remove_contact(contact_id: int, user: User, db: AsyncSession):
     """
     The remove_contact function removes a contact from the database. Args: contact_id (int): The id of the contact to
     be removed. user (User): The user who is removing the contact. This is used to ensure that only contacts
     belonging to this user are deleted, and not contacts belonging to other users with similar IDs.
+    The contact is soft-deleted (deleted_at is set) with a single UPDATE ... RETURNING statement.
 
     :param contact_id: int: Specify the contact to be removed
     :param user: User: Identify the user that is logged in
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The contact that was deleted
     :doc-author: Trelent
     """
-    contact = db.query(Contact).filter(and_(Contact.id == contact_id, Contact.user_id == user.id)).first()
+    stmt = update(Contact).where(Contact.id == contact_id, _live(user)).values(deleted_at=datetime.utcnow()) \
+        .returning(Contact)
+    result = await db.execute(stmt, execution_options={"synchronize_session": False})
+    contact = result.scalars().first()
+    await db.commit()
     if contact:
-        db.delete(contact)
-        db.commit()
+        await contact_versions.bump(user.id)
     return contact
+
+
+def _batch_condition(user: User, ids: list[int] | None, filter: ContactFilter | None, dialect: str):
+    """
+    The _batch_condition function builds the WHERE clause of a batch update or delete: the contacts of the user
+    with the given ids, or the contacts of the user that match the filter.
+
+    :param user: User: Owner of the contacts
+    :param ids: list[int] | None: Ids of the contacts
+    :param filter: ContactFilter | None: Search words and/or a birthday range
+    :param dialect: str: Name of the database dialect
+    :return: A SQL expression
+    """
+    condition = _live(user)
+    if ids is not None:
+        return and_(condition, Contact.id.in_(ids))
+    if filter.value is not None:
+        terms = search_terms(filter.value)
+        if not terms:
+            return false()
+        matched = _search_statement(terms, user, dialect).with_only_columns(Contact.id).order_by(None)
+        condition = and_(condition, Contact.id.in_(matched))
+    # birthday is a DateTime column: compare with datetimes, and end the range at the start of the next day
+    if filter.birthday_from is not None:
+        condition = and_(condition, Contact.birthday >= datetime.combine(filter.birthday_from, time()))
+    if filter.birthday_to is not None:
+        condition = and_(condition, Contact.birthday < datetime.combine(filter.birthday_to + timedelta(days=1), time()))
+    return condition
+
+
+def contact_changes(body: ContactUpdateModel) -> dict:
+    """
+    The contact_changes function returns the column values a partial update writes: the fields that are set
+    (an explicit null included), plus birth_md when the birthday changes.
+
+    :param body: ContactUpdateModel: The changes
+    :return: A dict of column values
+    """
+    values = body.model_dump(exclude_unset=True)
+    if "birthday" in values:
+        values["birth_md"] = birth_md(values["birthday"])
+    return values
+
+
+async def update_contacts(body: ContactUpdateModel, user: User, db: AsyncSession, ids: list[int] | None = None,
+                          filter: ContactFilter | None = None) -> list[int]:
+    """
+    The update_contacts function applies the same changes to many contacts of the user with a single
+    UPDATE ... RETURNING statement.
+
+    :param body: ContactUpdateModel: The fields to change
+    :param user: User: Owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param ids: list[int] | None: Ids of the contacts to update
+    :param filter: ContactFilter | None: Update the contacts that match instead
+    :return: The ids of the updated contacts
+    """
+    stmt = update(Contact).where(_batch_condition(user, ids, filter, db.get_bind().dialect.name)) \
+        .values(**contact_changes(body)).returning(Contact.id)
+    result = await db.execute(stmt, execution_options={"synchronize_session": False})
+    updated = result.scalars().all()
+    await db.commit()
+    if updated:
+        await contact_versions.bump(user.id)
+    return updated
+
+
+async def remove_contacts(user: User, db: AsyncSession, ids: list[int] | None = None,
+                          filter: ContactFilter | None = None) -> list[int]:
+    """
+    The remove_contacts function soft-deletes many contacts of the user with a single UPDATE ... RETURNING statement.
+
+    :param user: User: Owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param ids: list[int] | None: Ids of the contacts to delete
+    :param filter: ContactFilter | None: Delete the contacts that match instead
+    :return: The ids of the deleted contacts
+    """
+    stmt = update(Contact).where(_batch_condition(user, ids, filter, db.get_bind().dialect.name)) \
+        .values(deleted_at=datetime.utcnow()).returning(Contact.id)
+    result = await db.execute(stmt, execution_options={"synchronize_session": False})
+    removed = result.scalars().all()
+    await db.commit()
+    if removed:
+        await contact_versions.bump(user.id)
+    return removed
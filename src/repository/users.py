@@ -1,30 +1,33 @@
 from libgravatar import Gravatar
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel
+from src.services.user_cache import user_cache
 
 
-async def get_user_by_email(email: str, db: Session) -> User:
+async def get_user_by_email(email: str, db: AsyncSession) -> User:
     """
     The get_user_by_email function takes in an email and a database session,
     and returns the user associated with that email. If no such user exists,
     it will return None.
 
     :param email: str: Specify the type of parameter that is expected
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A user object
     :doc-author: Trelent
     """
-    return db.query(User).filter(User.email == email).first()
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(body: UserModel, db: AsyncSession) -> User:
     """
     The create_user function creates a new user in the database.
 
     :param body: UserModel: Create a new user
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A user object
     :doc-author: Trelent
     """
@@ -36,52 +39,68 @@ async def create_user(body: UserModel, db: Session) -> User:
         print(e)
     new_user = User(**body.dict(), avatar=avatar)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return new_user
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+async def update_token(user: User, token: str | None, db: AsyncSession) -> None:
     """
     The update_token function updates the refresh token for a user.
 
     :param user: User: Get the user's id
     :param token: str | None: Specify that the token parameter can be either a string or none
-    :param db: Session: Connect to the database and update the user's refresh token
+    :param db: AsyncSession: Connect to the database and update the user's refresh token
     :return: Nothing
     :doc-author: Trelent
     """
     user.refresh_token = token
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(user.email)
 
 
-async def confirmed_email(email: str, db: Session) -> None:
+async def update_password(user: User, password: str, db: AsyncSession) -> None:
+    """
+    The update_password function replaces the password hash of a user.
+
+    :param user: User: The user to update
+    :param password: str: The new password hash
+    :param db: AsyncSession: Pass the database session to the function
+    :return: Nothing
+    """
+    user.password = password
+    await db.commit()
+
+
+async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
     The confirmed_email function takes in an email and a database session,
     and sets the confirmed_email field of the user with that email to True.
 
 
     :param email: str: Get the email of the user
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: Nothing
     :doc-author: Trelent
     """
     user = await get_user_by_email(email, db)
     user.confirmed_email = True
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
 
 
-async def update_avatar(email, url: str, db: Session) -> User:
+async def update_avatar(email, url: str, db: AsyncSession) -> User:
     """
     The update_avatar function updates the avatar of a user.
 
     :param email: Find the user in the database
     :param url: str: Specify the type of data that is expected to be passed in
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The updated user object
     :doc-author: Trelent
     """
     user = await get_user_by_email(email, db)
     user.avatar = url
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(email)
     return user
@@ -1,21 +1,43 @@
+import logging
 from typing import List
 
+import redis.asyncio as redis
 from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.connect import get_db
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail
 from src.repository import users as repository_users
 from src.services.auth import auth_service
 from src.services.email import send_email
+from src.services.email_queue import email_queue
 
 router = APIRouter(prefix='/auth', tags=["auth"])
 security = HTTPBearer()
+logger = logging.getLogger(__name__)
+
+
+async def queue_confirmation_email(email: str, username: str | None, host: str, background_tasks: BackgroundTasks):
+    """
+    The queue_confirmation_email function hands the confirmation email to the email workers. If the queue is
+    unavailable, the email is sent from this process after the response, as before the queue existed.
+
+    :param email: str: Address of the user
+    :param username: str | None: Name used in the greeting
+    :param host: str: Base url of the application
+    :param background_tasks: BackgroundTasks: Tasks of the current request
+    :return: Nothing
+    """
+    try:
+        await email_queue.enqueue(email, username, str(host))
+    except redis.RedisError as err:
+        logger.warning("email queue unavailable, sending from the web worker: %s", err)
+        background_tasks.add_task(send_email, email, username, host)
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The signup function creates a new user in the database.
         It takes a UserModel object as input, which is validated by pydantic.
@@ -26,28 +48,29 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Re
     :param body: UserModel: Get the user's email and password from the request body
     :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the server
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: A user object, but it also returns a detail string
     :doc-author: Trelent
     """
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
+    await queue_confirmation_email(new_user.email, new_user.username, request.base_url, background_tasks)
     return {"user": new_user, "detail": "User successfully created. Check your email for confirmation."}
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     The login function is used to authenticate a user.
         It takes in the username and password of the user, verifies them against
         what's stored in the database, and returns an access token if successful.
+        A password hash made with outdated settings is replaced by a fresh one.
 
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :return: A token, but what does the refresh function return?
     :doc-author: Trelent
     """
@@ -56,8 +79,11 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed_email:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    valid, new_hash = await auth_service.verify_and_update_password(body.password, user.password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    if new_hash:
+        await repository_users.update_password(user, new_hash, db)
     # Generate JWT
     access_token = await auth_service.create_access_token(data={"sub": user.email})
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
@@ -66,14 +92,14 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: AsyncSession = Depends(get_db)):
     """
     The refresh_token function is used to refresh the access token.
         The function takes in a refresh token and returns an access_token, a new refresh_token, and the type of token.
         If the user's current refresh_token does not match what was passed into this function then it will return an error.
 
     :param credentials: HTTPAuthorizationCredentials: Get the token from the request header
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :return: A new access_token and refresh_token
     :doc-author: Trelent
     """
@@ -91,7 +117,7 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
 
 
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     The confirmed_email function is used to confirm a user's email address.
         It takes the token from the URL and uses it to get the user's email address.
@@ -101,7 +127,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
         we return an appropriate message; otherwise we update their account status in our database.
 
     :param token: str: Get the token from the url
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A message saying that the email is confirmed
     :doc-author: Trelent
     """
@@ -117,7 +143,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 
 @router.post('/request_email')
 async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+                        db: AsyncSession = Depends(get_db)):
     """
     The request_email function is used to send an email to the user with a link that will allow them
     to confirm their email address. The function takes in a RequestEmail object, which contains the
@@ -128,7 +154,7 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     :param body: RequestEmail: Get the email from the request body
     :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the application
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A message
     :doc-author: Trelent
     """
@@ -137,5 +163,5 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     if user.confirmed_email:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, request.base_url)
+        await queue_confirmation_email(user.email, user.username, request.base_url, background_tasks)
     return {"message": "Check your email for confirmation."}
@@ -1,102 +1,252 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status, Path, Query
+from datetime import date
+
+import orjson
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Path, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.datastructures import UploadFile
 from fastapi_limiter.depends import RateLimiter
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.connect import get_db
 from src.database.models import User
-from src.schemas import ContactModel, ResponseContact
+from src.conf.config import settings
+from src.schemas import (BatchDelete, BatchResult, BatchUpdate, ContactChanges, ContactModel, ContactUpdateModel,
+                         ImportResult, ResponseContact)
 from src.repository import contacts as repository_contacts
+from src.services import exporter, importer
 from src.services.auth import auth_service
+from src.services.contact_cache import contact_cache
+from src.services.contact_versions import contact_versions, etag, etag_matches
+from src.services.serializers import contact_row_to_dict, contacts_json, to_ndjson_line
 
 router = APIRouter(prefix='/contact', tags=['contacts'])
 
 
+def contacts_response(rows, headers: dict | None = None) -> ORJSONResponse:
+    """
+    The contacts_response function encodes contact rows straight into the ResponseContact shape.
+    The rows come from the database, so FastAPI's response_model validation (EmailStr included) is skipped;
+    response_model stays on the routes for the OpenAPI schema.
+
+    :param rows: Rows with the CONTACT_COLUMNS fields
+    :param headers: dict | None: Extra response headers
+    :return: A JSON response
+    """
+    return ORJSONResponse([contact_row_to_dict(row) for row in rows], headers=headers)
+
+
+async def contacts_etag(user: User, variant: str,
+                        if_none_match: str | None) -> tuple[int | None, dict, Response | None]:
+    """
+    The contacts_etag function handles conditional GETs of responses built from the user's contacts.
+    It returns the contacts version, the validator headers for the response and, when the client's copy
+    is current, the 304 response to send instead, decided without querying the contacts table.
+
+    :param user: User: Owner of the contacts
+    :param variant: str: Everything besides the contacts that shapes the response
+    :param if_none_match: str | None: The If-None-Match header
+    :return: The version and the ETag headers (None and empty if Redis is unavailable) and the 304 response or None
+    """
+    version = await contact_versions.get(user.id)
+    if version is None:
+        return None, {}, None
+    headers = {'ETag': etag(version, user.id, variant), 'Cache-Control': 'private, no-cache'}
+    if etag_matches(if_none_match, headers['ETag']):
+        return version, headers, Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return version, headers, None
+
+
 @router.get("/all", response_model=List[ResponseContact])
-async def get_contacts(db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def get_contacts(limit: int | None = Query(None, ge=1, le=1000, description='Page size, all contacts if omitted'),
+                       cursor: int | None = Query(None, ge=0, description='X-Next-Cursor of the previous page'),
+                       format: str = Query('json', pattern='^(json|ndjson)$', description='ndjson streams the rows'),
+                       if_none_match: str | None = Header(None),
+                       db: AsyncSession = Depends(get_db),
+                       current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contacts function returns a list of contacts for the current user.
+        Contacts are ordered by id. With a limit the response is one page and, if there may be more,
+        the X-Next-Cursor header holds the cursor of the next page. With format=ndjson the contacts
+        are streamed one JSON object per line straight from a server-side cursor.
+        The response carries an ETag; while the contacts do not change, If-None-Match gets 304.
+        JSON pages are served from the contact cache.
 
-    :param db: Session: Get the database session
+    :param limit: int | None: Page size
+    :param cursor: int | None: Id of the last contact of the previous page
+    :param format: str: json for a list, ndjson for a stream
+    :param if_none_match: str | None: ETag of the copy the client has
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user from the database
     :return: A list of users
     :doc-author: Trelent
     """
-    users = await repository_contacts.get_contacts(current_user, db)
-    if users is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
-    return users
+    version, headers, not_modified = await contacts_etag(current_user, f'all:{limit}:{cursor}:{format}',
+                                                         if_none_match)
+    if not_modified:
+        return not_modified
+    if format == 'ndjson':
+        rows = repository_contacts.stream_contacts(current_user, db, limit, cursor)
+        return StreamingResponse((to_ndjson_line(contact_row_to_dict(row)) async for row in rows),
+                                 media_type='application/x-ndjson', headers=headers)
+
+    async def load() -> bytes:
+        # cached as the X-Next-Cursor value (empty on the last page), a newline and the body
+        users = await repository_contacts.get_contacts(current_user, db, limit, cursor)
+        next_cursor = str(users[-1].id) if limit is not None and len(users) == limit else ''
+        return next_cursor.encode() + b'\n' + contacts_json(users)
+
+    next_cursor, _, body = (await contact_cache.get(current_user.id, version, f'all:{limit}:{cursor}', load)) \
+        .partition(b'\n')
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor.decode()
+    return Response(body, media_type='application/json', headers=headers)
 
 
 @router.get("/birthdays", response_model=List[ResponseContact])
             # dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def birthdays(db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def birthdays(days: int = Query(7, ge=0, le=366, description='Number of days to look ahead'),
+                    if_none_match: str | None = Header(None),
+                    db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
     """
     The birthdays function returns a list of users with birthdays in the current week.
         The function is called by sending a GET request to /birthdays.
+        The window starts today and is 7 days long unless the days query parameter says otherwise.
 
 
-    :param db: Session: Get the database session
+    :param days: int: Length of the window in days
+    :param if_none_match: str | None: ETag of the copy the client has, 304 if it is current
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user from the database
     :return: A list of users with their birthdays in the next week
     :doc-author: Trelent
     """
-    users = await repository_contacts.birthdays_per_weak(current_user, db)
-    if users is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
-    return users
+    # the window moves every day, so the date is part of the tag and of the cache key
+    variant = f'birthdays:{days}:{date.today()}'
+    version, headers, not_modified = await contacts_etag(current_user, variant, if_none_match)
+    if not_modified:
+        return not_modified
+
+    async def load() -> bytes:
+        return contacts_json(await repository_contacts.birthdays_per_weak(current_user, db, days))
+
+    body = await contact_cache.get(current_user.id, version, variant, load)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+@router.get("/changes", response_model=ContactChanges)
+async def get_changes(since: str | None = Query(None, description='Cursor of the previous response'),
+                      limit: int = Query(1000, ge=1, le=5000),
+                      db: AsyncSession = Depends(get_db),
+                      current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_changes function is the delta sync of the address book.
+        Without since it returns every contact; with the cursor of the previous response it returns only
+        the contacts created or updated since then (changed) and the ids of the deleted ones (deleted).
+        While has_more is true the client should call again with the new cursor right away.
+
+    :param since: str | None: Cursor of the previous response
+    :param limit: int: Maximum number of changes per response
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user
+    :return: The changes and the cursor to continue from
+    """
+    try:
+        position = repository_contacts.parse_sync_cursor(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid cursor")
+    rows = await repository_contacts.get_changes(current_user, db, position, limit, settings.sync_settle_seconds)
+    cursor = repository_contacts.sync_cursor(rows[-1].updated_at, rows[-1].id) if rows else since
+    return ORJSONResponse({'changed': [contact_row_to_dict(row) for row in rows if row.deleted_at is None],
+                           'deleted': [row.id for row in rows if row.deleted_at is not None],
+                           'cursor': cursor, 'has_more': len(rows) == limit})
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_contacts(format: str = Query('csv', pattern='^(csv|ndjson|vcard)$'),
+                          gzip: bool = Query(False, description='Compress the stream with Content-Encoding: gzip'),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The export_contacts function downloads all contacts of the current user as CSV, NDJSON or vCard.
+        Contacts are read from a server-side cursor and encoded as they arrive, so memory use does not
+        grow with the number of contacts; the body is sent with chunked transfer encoding.
+
+    :param format: str: csv, ndjson or vcard
+    :param gzip: bool: Compress the body
+    :param db: AsyncSession: Get the database session
+    :param current_user: User: Get the current user
+    :return: A streaming response
+    """
+    media_type, extension, _, _ = exporter.EXPORT_FORMATS[format]
+    chunks = exporter.export_chunks(repository_contacts.stream_contacts(current_user, db), format)
+    headers = {'Content-Disposition': f'attachment; filename="contacts.{extension}"'}
+    if gzip:
+        chunks = exporter.gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
 
 
 @router.get("/{contact_id}", response_model=ResponseContact)
-async def get_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def get_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                       current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_contact function returns a single contact from the database.
         The function takes an integer as its only argument, which is the ID of the contact to be returned.
         If no such contact exists in the database, then a 404 error is raised.
+        Contacts are served from the contact cache.
 
     :param contact_id: int: Get the contact id from the url
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Get the current user
     :return: A contact object
     :doc-author: Trelent
     """
-    user = await repository_contacts.get_contact(contact_id, current_user, db)
-    if user is None:
+    async def load() -> bytes:
+        contact = await repository_contacts.get_contact(contact_id, current_user, db)
+        return orjson.dumps(contact_row_to_dict(contact) if contact else None)
+
+    version = await contact_versions.get(current_user.id)
+    body = await contact_cache.get(current_user.id, version, f'contact:{contact_id}', load)
+    if body == b'null':
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
-    return user
+    return Response(body, media_type='application/json')
 
 
 @router.get("/search/", response_model=List[ResponseContact])
-async def search_contact(value: str = Query(..., description='Searching contact'), db: Session = Depends(get_db),
+async def search_contact(value: str = Query(..., description='Searching contact'),
+                         limit: int = Query(50, ge=1, le=200), offset: int = Query(0, ge=0),
+                         db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The search_contact function is used to search for a contact in the database.
         The function takes in a string value and returns the user object if found.
+        Every word of the value matches the beginning of a word in the name, email, phone or description;
+        the best matches come first.
 
     :param value: str: Search for a contact in the database
     :param description: Describe the parameter in the swagger documentation
-    :param db: Session: Get the database session
+    :param limit: int: Page size
+    :param offset: int: Number of results to skip
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user
     :return: A list of contacts
     :doc-author: Trelent
     """
-    user = await repository_contacts.search_contact(value, current_user, db)
-    if user is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
-    return user
+    contacts = await repository_contacts.search_contact(value, current_user, db, limit, offset)
+    return contacts_response(contacts)
 
 
 @router.post("/", response_model=ResponseContact, status_code=status.HTTP_201_CREATED)
              # dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def create_contact(body: ContactModel, db: Session = Depends(get_db),
+async def create_contact(body: ContactModel, db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The create_contact function creates a new contact in the database.
 
     :param body: ContactModel: Pass in the contact information to be added
-    :param db: Session: Pass the database session to the repository layer
+    :param db: AsyncSession: Pass the database session to the repository layer
     :param current_user: User: Get the current user
     :return: A contactmodel object
     :doc-author: Trelent
@@ -105,8 +255,82 @@ async def create_contact(body: ContactModel, db: Session = Depends(get_db),
     return user
 
 
+@router.post("/import", response_model=ImportResult)
+async def import_contacts(request: Request,
+                          format: str | None = Query(None, pattern='^(json|ndjson|csv)$',
+                                                     description='Overrides the format taken from the Content-Type'),
+                          db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The import_contacts function creates many contacts in one request.
+        The body is a JSON array (application/json), one contact per line (application/x-ndjson),
+        a CSV file with a header row (text/csv) or a multipart form with the file in the "file" field.
+        Rows are validated like POST /contact/ and written in batches of settings.import_batch_size,
+        each batch in its own transaction. Invalid rows are skipped and reported by row number.
+
+    :param request: Request: Read the body as a stream
+    :param format: str | None: json, ndjson or csv
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :param current_user: User: Get the current user
+    :return: The numbers of imported and failed rows and the row errors
+    """
+    content_type = request.headers.get('content-type', '')
+    if content_type.startswith('multipart/form-data'):
+        form = await request.form()
+        upload = form.get('file')
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Missing file field")
+        file = upload.file
+        format = format or importer.detect_format(upload.content_type, upload.filename)
+    else:
+        file = await importer.spool_body(request, settings.import_spool_size)
+        format = format or importer.detect_format(content_type)
+    if format is None:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Expected JSON, NDJSON or CSV")
+    try:
+        return await importer.import_contacts(importer.iter_records(file, format), current_user, db,
+                                              settings.import_batch_size, settings.import_max_errors)
+    finally:
+        file.close()
+
+
+@router.patch("/batch", response_model=BatchResult)
+async def update_contacts(body: BatchUpdate, db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The update_contacts function applies the same changes to many contacts at once.
+        The contacts are given by their ids or by a filter; only the fields set in changes are written,
+        in one UPDATE statement and one transaction.
+
+    :param body: BatchUpdate: The ids or the filter and the changes
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :param current_user: User: Get the current user
+    :return: The number and the ids of the updated contacts
+    """
+    ids = await repository_contacts.update_contacts(body.changes, current_user, db, body.ids, body.filter)
+    return BatchResult(count=len(ids), ids=ids)
+
+
+@router.delete("/batch", response_model=BatchResult)
+async def remove_contacts(body: BatchDelete, db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The remove_contacts function deletes many contacts at once, given by their ids or by a filter,
+    in one transaction. They are soft-deleted with one UPDATE ... SET deleted_at ... RETURNING statement
+    and stay as tombstones for GET /changes.
+
+    :param body: BatchDelete: The ids or the filter
+    :param db: AsyncSession: Pass the database session to the repository layer
+    :param current_user: User: Get the current user
+    :return: The number and the ids of the deleted contacts
+    """
+    ids = await repository_contacts.remove_contacts(current_user, db, body.ids, body.filter)
+    return BatchResult(count=len(ids), ids=ids)
+
+
 @router.put("/{contact_id}", response_model=ResponseContact)
-async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The update_contact function updates a contact in the database.
@@ -115,7 +339,7 @@ async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: S
 
     :param body: ContactModel: Get the data from the request body
     :param contact_id: int: Get the contact id from the url
-    :param db: Session: Pass the database connection to the function
+    :param db: AsyncSession: Pass the database connection to the function
     :param current_user: User: Get the user_id from the token
     :return: The user object
     :doc-author: Trelent
@@ -126,9 +350,29 @@ async def update_contact(body: ContactModel, contact_id: int = Path(ge=1), db: S
     return user
 
 
+@router.patch("/{contact_id}", response_model=ResponseContact)
+async def patch_contact(body: ContactUpdateModel, contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
+                        current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The patch_contact function updates some fields of a contact.
+        Only the fields present in the body are written; if no contact with that id
+        belongs to the user, it returns 404 Not Found.
+
+    :param body: ContactUpdateModel: The fields to change
+    :param contact_id: int: Get the contact id from the url
+    :param db: AsyncSession: Pass the database connection to the function
+    :param current_user: User: Get the user_id from the token
+    :return: The updated contact
+    """
+    contact = await repository_contacts.patch_contact(body, contact_id, current_user, db)
+    if contact is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return contact
+
+
 @router.delete("/{contact_id}", status_code=status.HTTP_204_NO_CONTENT)
                # dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def remove_contact(contact_id: int = Path(ge=1), db: Session = Depends(get_db),
+async def remove_contact(contact_id: int = Path(ge=1), db: AsyncSession = Depends(get_db),
                          current_user: User = Depends(auth_service.get_current_user)):
     """
     The remove_contact function removes a contact from the database.
@@ -136,7 +380,7 @@ async def remove_contact(contact_id: int = Path(ge=1), db: Session = Depends(get
         and returns a User object with all of its contacts.
 
     :param contact_id: int: Specify the contact to be removed
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user from the database
     :return: A user object
     :doc-author: Trelent
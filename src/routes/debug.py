@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException, status
+
+from src.services.profiler import sql_profiler
+
+router = APIRouter(prefix="/debug", tags=["debug"])
+
+
+@router.get("/profile/{request_id}")
+async def read_profile(request_id: str):
+    """
+    The read_profile function returns the SQL profile of a recent request: every statement with its duration and
+    call site, the slow statements and the statements repeated often enough to look like an N+1 pattern.
+    The id comes from the X-SQL-Profile response header. Profiling is off unless settings.sql_profiler or
+    settings.sql_profiler_header enables it, and then the route is not found either.
+
+    :param request_id: str: Id of the profile
+    :return: The profile summary
+    """
+    profile = sql_profiler.get(request_id) if sql_profiler.available else None
+    if profile is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return profile
@@ -1,12 +1,11 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.connect import get_db
 from src.database.models import User
 from src.repository import users as repository_users
 from src.services.auth import auth_service
+from src.services.avatars import InvalidImage, avatar_storage
 from src.conf.config import settings
 from src.schemas import UserDb
 
@@ -28,27 +27,25 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 
 @router.patch('/avatar', response_model=UserDb)
 async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: AsyncSession = Depends(get_db)):
     """
     The update_avatar_user function is used to update the avatar of a user.
-        The function takes in an UploadFile object, which contains the file that will be uploaded to Cloudinary.
-        It also takes in a User object and Session object as parameters, which are both provided by Depends().
+        The function takes in an UploadFile object, which contains the file that will be resized and stored by
+        the avatar storage (Cloudinary or a local directory, see settings.avatar_storage).
+        It also takes in a User object and AsyncSession object as parameters, which are both provided by Depends().
 
     :param file: UploadFile: Get the file from the request body
     :param current_user: User: Get the user from the database
-    :param db: Session: Create a connection to the database
+    :param db: AsyncSession: Create a connection to the database
     :return: The updated user
     :doc-author: Trelent
     """
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-
-    u = cloudinary.uploader.upload(file.file, public_id=f'REST_App/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'NotesApp/{current_user.username}')\
-                        .build_url(width=250, height=250, crop='fill', version=u.get('version'))
+    if file.size is not None and file.size > settings.avatar_max_size:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Image is too large")
+    try:
+        # resized and uploaded in a worker thread, streamed from the spooled upload
+        src_url = await avatar_storage.store(current_user.username, file.file)
+    except InvalidImage:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Not a supported image")
     user = await repository_users.update_avatar(current_user.email, src_url, db)
     return user
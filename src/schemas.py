@@ -1,6 +1,6 @@
 from datetime import date, datetime
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, model_validator
 
 
 class ContactModel(BaseModel):
@@ -12,6 +12,54 @@ class ContactModel(BaseModel):
     description: str = Field()
 
 
+class ContactUpdateModel(BaseModel):
+    # a field left out is not changed; the columns behind these fields are never empty, so null is rejected
+    firstname: str = Field(None, min_length=2, max_length=20)
+    lastname: str = Field(None, min_length=2, max_length=20)
+    email: EmailStr = None
+    phone: str = Field(None, min_length=8, max_length=16)
+    birthday: date = None
+    description: str = None
+
+
+class ContactFilter(BaseModel):
+    value: str | None = Field(None, description='Words matched as prefixes, like /contact/search/')
+    birthday_from: date | None = None
+    birthday_to: date | None = None
+
+    @model_validator(mode='after')
+    def not_empty(self):
+        if self.value is None and self.birthday_from is None and self.birthday_to is None:
+            raise ValueError('filter needs at least one condition')
+        return self
+
+
+class BatchDelete(BaseModel):
+    ids: list[int] | None = Field(None, min_length=1, max_length=10000)
+    filter: ContactFilter | None = None
+
+    @model_validator(mode='after')
+    def ids_or_filter(self):
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError('expected either ids or filter')
+        return self
+
+
+class BatchUpdate(BatchDelete):
+    changes: ContactUpdateModel
+
+    @model_validator(mode='after')
+    def has_changes(self):
+        if not self.changes.model_fields_set:
+            raise ValueError('changes must set at least one field')
+        return self
+
+
+class BatchResult(BaseModel):
+    count: int
+    ids: list[int]
+
+
 class ResponseContact(BaseModel):
     id: int = 1
     firstname: str
@@ -25,6 +73,24 @@ class ResponseContact(BaseModel):
         from_attributes = True
 
 
+class ImportRowError(BaseModel):
+    row: int
+    errors: list[dict]
+
+
+class ImportResult(BaseModel):
+    imported: int = 0
+    failed: int = 0
+    errors: list[ImportRowError] = []
+
+
+class ContactChanges(BaseModel):
+    changed: list[ResponseContact]
+    deleted: list[int]
+    cursor: str | None = Field(description='Pass as since to get the next changes')
+    has_more: bool
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=5, max_length=16)
     email: EmailStr
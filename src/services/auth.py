@@ -1,36 +1,48 @@
-import pickle
 from typing import Optional
 
-import redis
-from jose import JWTError, jwt
+from jose import JWTError
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.conf.config import settings
 from src.database.connect import get_db
 from src.repository import users as repository_users
+from src.services.passwords import PasswordHasher
+from src.services.token_codec import TokenCodec
+from src.services.user_cache import user_cache
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.password_bcrypt_rounds)
+    hasher = PasswordHasher(pwd_context, settings.password_hash_workers, settings.password_hash_queue)
     SECRET_KEY = settings.secret_key_jwt
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(
-        host=settings.redis_host,
-        port=settings.redis_port,
-        password=settings.redis_password,
-        db=0
-    )
+    codec = TokenCodec(SECRET_KEY, ALGORITHM, settings.jwt_backend, settings.jwt_cache_size)
+    cache = user_cache
 
-    def verify_password(self, plain_password, hashed_password):
-        return self.pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(self, plain_password, hashed_password):
+        return await self.hasher.verify(plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
-        return self.pwd_context.hash(password)
+    async def verify_and_update_password(self, plain_password, hashed_password):
+        """
+        The verify_and_update_password function checks a password like verify_password and also returns
+        a new hash when settings.password_rehash_on_login is on and the stored hash needs an upgrade.
+
+        :param self: Represent the instance of the class
+        :param plain_password: Password from the login form
+        :param hashed_password: Hash stored for the user
+        :return: A tuple of the check result and the new hash or None
+        """
+        if not settings.password_rehash_on_login:
+            return await self.verify_password(plain_password, hashed_password), None
+        return await self.hasher.verify_and_update(plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str):
+        return await self.hasher.hash(password)
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -48,13 +60,9 @@ class Auth:
         :doc-author: Trelent
 
         """
-        to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.utcnow() + timedelta(seconds=expires_delta)
-        else:
-            expire = datetime.utcnow() + timedelta(minutes=15)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
-        encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        now = datetime.utcnow()
+        expire = now + (timedelta(seconds=expires_delta) if expires_delta else timedelta(minutes=15))
+        encoded_access_token = self.codec.encode({**data, "iat": now, "exp": expire, "scope": "access_token"})
         return encoded_access_token
 
     # define a function to generate a new refresh token
@@ -71,13 +79,9 @@ class Auth:
         :return: A refresh token
         :doc-author: Trelent
         """
-        to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.utcnow() + timedelta(seconds=expires_delta)
-        else:
-            expire = datetime.utcnow() + timedelta(days=7)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "refresh_token"})
-        encoded_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        now = datetime.utcnow()
+        expire = now + (timedelta(seconds=expires_delta) if expires_delta else timedelta(days=7))
+        encoded_refresh_token = self.codec.encode({**data, "iat": now, "exp": expire, "scope": "refresh_token"})
         return encoded_refresh_token
 
     def create_email_token(self, data: dict):
@@ -91,10 +95,8 @@ class Auth:
         :return: A token that is encoded with the data passed in as a parameter
         :doc-author: Trelent
         """
-        to_encode = data.copy()
-        expire = datetime.utcnow() + timedelta(days=1)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "email_token"})
-        token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
+        now = datetime.utcnow()
+        token = self.codec.encode({**data, "iat": now, "exp": now + timedelta(days=1), "scope": "email_token"})
         return token
 
     async def get_email_from_token(self, token: str):
@@ -110,7 +112,7 @@ class Auth:
         :doc-author: Trelent
         """
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.codec.decode(token)
             if payload['scope'] == 'email_token':
                 email = payload["sub"]
                 return email
@@ -133,7 +135,7 @@ class Auth:
         :doc-author: Trelent
         """
         try:
-            payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            payload = self.codec.decode(refresh_token)
             if payload['scope'] == 'refresh_token':
                 email = payload['sub']
                 return email
@@ -141,16 +143,18 @@ class Auth:
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be called by the FastAPI
         dependency injection system to get the current user. It will use the token in
         the Authorization header (that was added by OAuth2) to retrieve it from the database.
+        The user is returned as a CachedUser projection (no password hash, no refresh token)
+        and served from the user cache when possible.
 
         :param self: Access the class attributes
         :param token: str: Get the token from the authorization header
-        :param db: Session: Get the database session
-        :return: A user object from the database
+        :param db: AsyncSession: Get the database session
+        :return: The current user
         :doc-author: Trelent
         """
         credentials_exception = HTTPException(
@@ -160,8 +164,8 @@ class Auth:
         )
 
         try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+            # Decode JWT, verified claims are cached until the token expires
+            payload = self.codec.decode_cached(token)
             if payload['scope'] == 'access_token':
                 email = payload["sub"]
                 if email is None:
@@ -171,15 +175,12 @@ class Auth:
         except JWTError as e:
             raise credentials_exception
 
-        user = self.r.get(f"user:{email}")
-        if not user:
+        user = await self.cache.get(email)
+        if user is None:
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
                 raise credentials_exception
-            self.r.set(f"user:{email}", pickle.dumps(user))
-            self.r.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
+            user = await self.cache.set(user)
         return user
 
 
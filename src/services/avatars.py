@@ -0,0 +1,141 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO
+from urllib.parse import quote
+
+import cloudinary
+import cloudinary.uploader
+from PIL import Image, ImageOps
+
+from src.conf.config import settings
+
+BACKENDS = ("cloudinary", "local")
+CHUNK_SIZE = 64 * 1024
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def shrink(file: BinaryIO, size: int, quality: int) -> BinaryIO:
+    """
+    The shrink function crops the image to a square and scales it down to size x size, then encodes it as JPEG,
+    so the storage receives a few tens of kilobytes instead of the original photo.
+
+    :param file: BinaryIO: The uploaded image, read from its start
+    :param size: int: Width and height of the avatar in pixels
+    :param quality: int: JPEG quality, 1-95
+    :return: A file with the avatar, read from its start
+    """
+    try:
+        with Image.open(file) as image:
+            image.draft("RGB", (size, size))  # JPEG decodes straight to a smaller scale
+            avatar = ImageOps.fit(ImageOps.exif_transpose(image).convert("RGB"), (size, size))
+    except (OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e)) from e
+    # spills to disk beyond max_size, like the UploadFile itself
+    output = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    avatar.save(output, "JPEG", quality=quality, optimize=True)
+    output.seek(0)
+    return output
+
+
+class AvatarStorage(ABC):
+    """
+    Where avatars are stored. Uploads are blocking (a file on disk, an HTTPS request), so store prepares and
+    writes the file in a small thread pool and the event loop keeps serving other requests meanwhile.
+    """
+
+    def __init__(self, size: int, quality: int, workers: int):
+        self.size = size
+        self.quality = quality
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="avatar-upload")
+
+    @abstractmethod
+    def save(self, name: str, file: BinaryIO) -> str:
+        """
+        The save function writes the avatar; it runs in a worker thread.
+
+        :param name: str: Name of the avatar
+        :param file: BinaryIO: The resized image, read from its start
+        :return: The URL of the avatar
+        """
+
+    def _store(self, name: str, file: BinaryIO) -> str:
+        file.seek(0)
+        with shrink(file, self.size, self.quality) as avatar:
+            return self.save(name, avatar)
+
+    async def store(self, name: str, file: BinaryIO) -> str:
+        """
+        The store function resizes the image and saves it as the avatar called name, off the event loop.
+
+        :param name: str: Name of the avatar, e.g. the username
+        :param file: BinaryIO: The uploaded image (UploadFile.file); it is read in chunks, never as a whole
+        :return: The URL of the avatar
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._store, name, file)
+
+
+class CloudinaryStorage(AvatarStorage):
+    """
+    Avatars in Cloudinary. The account is configured once; the image is sent in chunks of chunk_size bytes.
+    """
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str, folder: str, size: int, quality: int,
+                 workers: int, chunk_size: int):
+        super().__init__(size, quality, workers)
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+        self.folder = folder
+        self.chunk_size = chunk_size
+
+    def save(self, name: str, file: BinaryIO) -> str:
+        public_id = f"{self.folder}/{name}"
+        result = cloudinary.uploader.upload_large(file, public_id=public_id, overwrite=True,
+                                                  chunk_size=self.chunk_size)
+        return cloudinary.CloudinaryImage(public_id).build_url(width=self.size, height=self.size, crop="fill",
+                                                               version=result.get("version"))
+
+
+class LocalStorage(AvatarStorage):
+    """
+    Avatars as files in directory, served under base_url. Meant for development and offline load tests.
+    """
+
+    def __init__(self, directory: str, base_url: str, size: int, quality: int, workers: int):
+        super().__init__(size, quality, workers)
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, name: str, file: BinaryIO) -> str:
+        name = quote(name, safe="")  # a username must not reach outside the directory
+        path = os.path.join(self.directory, f"{name}.jpg")
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as output:
+            try:
+                shutil.copyfileobj(file, output, CHUNK_SIZE)
+            except BaseException:
+                os.unlink(output.name)
+                raise
+        # readers see the old avatar or the new one, never a partly written file
+        os.replace(output.name, path)
+        return f"{self.base_url}/{name}.jpg?v={time.time_ns()}"
+
+
+def avatar_storage_from_settings() -> AvatarStorage:
+    if settings.avatar_storage not in BACKENDS:
+        raise ValueError(f"Unknown avatar storage {settings.avatar_storage!r}, expected one of {BACKENDS}")
+    if settings.avatar_storage == "local":
+        return LocalStorage(settings.avatar_directory, settings.avatar_base_url, settings.avatar_size,
+                            settings.avatar_quality, settings.avatar_upload_workers)
+    return CloudinaryStorage(settings.cloudinary_name, settings.cloudinary_api_key, settings.cloudinary_api_secret,
+                             settings.cloudinary_folder, settings.avatar_size, settings.avatar_quality,
+                             settings.avatar_upload_workers, settings.avatar_chunk_size)
+
+
+avatar_storage = avatar_storage_from_settings()
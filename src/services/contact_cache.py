@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import redis.asyncio as redis
+
+from src.conf.config import settings
+from src.database.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class ContactCache:
+    """
+    Read-through cache of encoded contact responses in Redis. Keys carry the user's contacts version
+    (src.services.contact_versions), so a write makes every cached entry of that user unreachable at once and the
+    stale ones simply expire after ttl seconds. Concurrent misses on the same key in this process share one load.
+    """
+
+    def __init__(self, client: redis.Redis, ttl: int):
+        self.redis = client
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.coalesced = 0
+        self._loading: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def key(user_id: int, version: int, variant: str) -> str:
+        return f"contacts:{user_id}:{version:x}:{variant}"
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors, "coalesced": self.coalesced}
+
+    async def get(self, user_id: int, version: int | None, variant: str,
+                  load: Callable[[], Awaitable[bytes]]) -> bytes:
+        """
+        The get function returns the cached entry for the variant of the user's contacts, calling load on a miss.
+        Without a version (Redis is unavailable) nothing is cached.
+
+        :param user_id: int: Owner of the contacts
+        :param version: int | None: Current contacts version of the user
+        :param variant: str: What is cached, e.g. the page or the contact id
+        :param load: Callable[[], Awaitable[bytes]]: Reads and encodes the entry from the database
+        :return: The encoded entry
+        """
+        if version is None:
+            return await load()
+        key = self.key(user_id, version, variant)
+        try:
+            data = await self.redis.get(key)
+        except redis.RedisError as err:
+            self.errors += 1
+            logger.warning("contact cache unavailable: %s", err)
+            return await load()
+        if data is not None:
+            self.hits += 1
+            return data
+        self.misses += 1
+        loading = self._loading.get(key)
+        if loading is not None:
+            self.coalesced += 1
+            return await asyncio.shield(loading)
+        loading = self._loading[key] = asyncio.get_running_loop().create_future()
+        try:
+            data = await load()
+        except BaseException as err:
+            if isinstance(err, Exception):
+                loading.set_exception(err)
+                loading.exception()  # waiters re-raise it; do not log it again as never retrieved
+            else:
+                loading.cancel()
+            raise
+        else:
+            loading.set_result(data)
+        finally:
+            del self._loading[key]
+        try:
+            await self.redis.set(key, data, ex=self.ttl)
+        except redis.RedisError as err:
+            self.errors += 1
+            logger.warning("contact cache unavailable: %s", err)
+        return data
+
+
+contact_cache = ContactCache(get_redis(), ttl=settings.contact_cache_ttl)
@@ -0,0 +1,102 @@
+import logging
+import zlib
+from time import time_ns
+
+import redis.asyncio as redis
+
+from src.database.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+class ContactVersions:
+    """
+    A per-user version of the address book, kept in Redis and bumped by every write to the user's contacts.
+    A missing version starts at the current time in nanoseconds, so it keeps growing even if Redis loses the key
+    and a tag issued before that can never come back. Redis errors are logged; reads then have no version.
+    """
+
+    def __init__(self, client: redis.Redis):
+        self.redis = client
+        # users whose version could be neither bumped nor deleted after a write; never served until it is deleted
+        self.stale: set[int] = set()
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f"contacts:version:{user_id}"
+
+    async def get(self, user_id: int) -> int | None:
+        """
+        The get function returns the current contacts version of a user, creating it if needed.
+
+        :param user_id: int: Owner of the contacts
+        :return: The version or None if Redis is unavailable
+        """
+        key = self.key(user_id)
+        try:
+            if user_id in self.stale:
+                await self.redis.delete(key)
+                self.stale.discard(user_id)
+            version = await self.redis.get(key)
+            if version is None:
+                await self.redis.set(key, time_ns(), nx=True)
+                version = await self.redis.get(key)
+        except redis.RedisError as err:
+            logger.warning("contact versions unavailable: %s", err)
+            return None
+        return int(version)
+
+    async def bump(self, user_id: int) -> None:
+        """
+        The bump function moves the contacts version of a user forward; called after every committed write.
+        The data has changed by then, so if the bump fails the old version must not be served again: the key
+        is deleted (the next get starts a new, larger version) or, failing that too, the user is marked stale
+        and gets no version until the delete succeeds.
+
+        :param user_id: int: Owner of the contacts
+        :return: Nothing
+        """
+        key = self.key(user_id)
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.set(key, time_ns(), nx=True)
+            pipe.incr(key)
+            await pipe.execute()
+            return
+        except redis.RedisError as err:
+            logger.warning("contact versions unavailable: %s", err)
+        try:
+            await self.redis.delete(key)
+        except redis.RedisError as err:
+            logger.warning("contact versions unavailable: %s", err)
+            self.stale.add(user_id)
+
+
+def etag(version: int, user_id: int, variant: str) -> str:
+    """
+    The etag function builds the strong ETag of a response derived from the contacts of a user: the version
+    plus a checksum of whatever else the body depends on (query parameters, today's date, ...).
+
+    :param version: int: Contacts version of the user
+    :param user_id: int: Owner of the contacts
+    :param variant: str: Everything besides the contacts that shapes the response
+    :return: A quoted entity tag
+    """
+    return f'"{version:x}-{zlib.crc32(f"{user_id}:{variant}".encode()):08x}"'
+
+
+def etag_matches(if_none_match: str | None, tag: str | None) -> bool:
+    """
+    The etag_matches function checks an If-None-Match header against the current ETag.
+
+    :param if_none_match: str | None: The header value, a list of tags or *
+    :param tag: str | None: The current tag
+    :return: True if the client already has the current representation
+    """
+    if not if_none_match or tag is None:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return tag in candidates or "*" in candidates
+
+
+contact_versions = ContactVersions(get_redis())
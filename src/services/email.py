@@ -1,7 +1,13 @@
+import asyncio
+import logging
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
+from time import monotonic
+from typing import Callable
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from fastapi_mail import ConnectionConfig
 from pydantic import EmailStr
 
 from src.conf.config import settings
@@ -21,6 +27,165 @@ conf = ConnectionConfig(
     TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
 )
 
+logger = logging.getLogger(__name__)
+
+
+# compiled once per process instead of once per message
+template = conf.template_engine().get_template("email_template.html")
+
+
+def smtp_client() -> aiosmtplib.SMTP:
+    """
+    The smtp_client function creates an SMTP client for the server of the settings, configured like conf.
+
+    :return: A client that is not connected yet
+    """
+    return aiosmtplib.SMTP(hostname=conf.MAIL_SERVER, port=conf.MAIL_PORT, username=conf.MAIL_USERNAME,
+                           password=conf.MAIL_PASSWORD, use_tls=conf.MAIL_SSL_TLS, start_tls=conf.MAIL_STARTTLS,
+                           validate_certs=conf.VALIDATE_CERTS, timeout=settings.mail_timeout)
+
+
+class MailClient:
+    """
+    A long-lived pool of SMTP connections. A connection is opened (TCP, TLS, login) when a send needs one and
+    no idle connection is left. It is kept for the following sends until it has carried messages_per_connection
+    messages, which is the session limit many servers enforce. A connection idle for more than keepalive
+    seconds is checked with NOOP before reuse, because servers drop idle sessions. At most pool_size
+    connections are open at a time.
+    """
+
+    def __init__(self, client_factory: Callable[[], aiosmtplib.SMTP] = smtp_client, pool_size: int = 2,
+                 keepalive: float = 30, messages_per_connection: int = 100):
+        self.client_factory = client_factory
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.messages_per_connection = messages_per_connection
+        self.connects = 0
+        self._idle: list[tuple[aiosmtplib.SMTP, float, int]] = []
+        self._slots = asyncio.Semaphore(pool_size)
+
+    async def _acquire(self) -> tuple[aiosmtplib.SMTP, int]:
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                client, last_used, sent = self._idle.pop()
+                if monotonic() - last_used < self.keepalive:
+                    return client, sent
+                try:
+                    await client.noop()
+                    return client, sent
+                except aiosmtplib.SMTPException:
+                    client.close()
+            client = self.client_factory()
+            await client.connect()
+            self.connects += 1
+            return client, 0
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _release(self, client: aiosmtplib.SMTP, sent: int, reusable: bool) -> None:
+        try:
+            if reusable and client.is_connected and sent < self.messages_per_connection:
+                self._idle.append((client, monotonic(), sent))
+            elif client.is_connected:
+                try:
+                    await client.quit()
+                except aiosmtplib.SMTPException:
+                    client.close()
+        finally:
+            self._slots.release()
+
+    async def send_many(self, messages: list[EmailMessage]) -> list:
+        """
+        The send_many function sends messages over up to pool_size connections in parallel. Each
+        connection carries messages back to back until none are left.
+
+        :param messages: list[EmailMessage]: The messages
+        :return: None for every delivered message, otherwise the exception it failed with, in the same order
+        """
+        results = [None] * len(messages)
+        pending = iter(range(len(messages)))
+
+        async def lane():
+            for index in pending:
+                try:
+                    client, sent = await self._acquire()
+                except (aiosmtplib.SMTPException, OSError) as err:
+                    logger.warning("SMTP server unavailable: %s", err)
+                    # the server refuses connections, so fail what is left instead of trying it message by message
+                    results[index] = err
+                    for rest in pending:
+                        results[rest] = err
+                    return
+                reusable = True
+                try:
+                    while True:
+                        try:
+                            await client.send_message(messages[index])
+                            sent += 1
+                        except aiosmtplib.SMTPServerDisconnected as err:
+                            results[index] = err
+                            reusable = False
+                            break
+                        except aiosmtplib.SMTPException as err:
+                            results[index] = err
+                        if sent >= self.messages_per_connection:
+                            break
+                        index = next(pending, None)
+                        if index is None:
+                            return
+                finally:
+                    await self._release(client, sent, reusable)
+
+        await asyncio.gather(*(lane() for _ in range(min(self.pool_size, len(messages)))))
+        return results
+
+    async def send(self, message: EmailMessage) -> None:
+        error = (await self.send_many([message]))[0]
+        if error is not None:
+            raise error
+
+    async def close(self) -> None:
+        while self._idle:
+            client, _, _ = self._idle.pop()
+            try:
+                await client.quit()
+            except aiosmtplib.SMTPException:
+                client.close()
+
+
+mail_client = MailClient(pool_size=settings.mail_pool_size, keepalive=settings.mail_keepalive,
+                         messages_per_connection=settings.mail_messages_per_connection)
+
+
+def confirmation_message(job: dict) -> EmailMessage:
+    """
+    The confirmation_message function builds the email that asks a user to confirm their address.
+
+    :param job: dict: The email job with the email, username and host of the user
+    :return: The message
+    """
+    message = EmailMessage()
+    message["From"] = formataddr((conf.MAIL_FROM_NAME, conf.MAIL_FROM))
+    message["To"] = job["email"]
+    message["Subject"] = "Confirm your email "
+    token = auth_service.create_email_token({"sub": job["email"]})
+    message.set_content(template.render(host=job["host"], username=job["username"], token=token), subtype="html")
+    return message
+
+
+async def send_emails(jobs: list[dict], client: MailClient = mail_client) -> list:
+    """
+    The send_emails function sends the confirmation emails of a batch of jobs over the pooled connections
+    of client.
+
+    :param jobs: list[dict]: Email jobs with the email, username and host of each user
+    :param client: MailClient: The connection pool
+    :return: None for every delivered message, otherwise the exception it failed with, in the order of jobs
+    """
+    return await client.send_many([confirmation_message(job) for job in jobs])
+
 
 async def send_email(email: EmailStr, username: str, host: str):
     """
@@ -36,16 +201,6 @@ async def send_email(email: EmailStr, username: str, host: str):
     :return: A coroutine object
     :doc-author: Trelent
     """
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    error = (await send_emails([{"email": email, "username": username, "host": str(host)}]))[0]
+    if error is not None:
+        logger.warning("confirmation email to %s failed: %s", email, error)
@@ -0,0 +1,197 @@
+import logging
+import random
+import time
+import uuid
+
+import orjson
+import redis.asyncio as redis
+
+from src.conf.config import settings
+from src.database.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# moves the jobs whose retry time has come from the delayed set back to the ready list, atomically
+PROMOTE_DUE = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('LPUSH', KEYS[2], job)
+end
+return #due
+"""
+
+
+class EmailQueue:
+    """
+    A durable queue of email jobs in Redis, consumed by src.services.email_worker processes.
+
+    Jobs wait in a list. A worker moves a batch into its own processing list (BLMOVE), so a job is never
+    only in the memory of a worker. The worker removes jobs from that list once they are delivered or
+    rescheduled. A failed job goes to a sorted set, scored by the time of its next attempt. The wait grows
+    exponentially with jitter up to max_backoff. After max_attempts the job ends up in the dead list.
+
+    Workers keep a heartbeat key alive. The processing list of a worker whose heartbeat expired is put
+    back on the queue, so a crashed or restarted worker loses nothing. The price is at-least-once
+    delivery: a worker that dies after sending a message but before acknowledging it sends that message
+    again.
+    """
+
+    def __init__(self, client: redis.Redis, prefix: str = "email", max_attempts: int = 6, backoff: float = 5,
+                 max_backoff: float = 900, heartbeat_ttl: int = 300):
+        self.redis = client
+        self.prefix = prefix
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.heartbeat_ttl = heartbeat_ttl
+        self.ready = f"{prefix}:ready"
+        self.delayed = f"{prefix}:delayed"
+        self.dead = f"{prefix}:dead"
+        self.counters = f"{prefix}:stats"
+
+    def processing(self, worker_id: str) -> str:
+        return f"{self.prefix}:processing:{worker_id}"
+
+    def heartbeat_key(self, worker_id: str) -> str:
+        return f"{self.prefix}:worker:{worker_id}"
+
+    async def enqueue(self, email: str, username: str | None, host: str) -> str:
+        """
+        The enqueue function adds a confirmation email to the queue.
+
+        :param email: str: Address of the user
+        :param username: str | None: Name used in the greeting
+        :param host: str: Base url of the application for the confirmation link
+        :return: The id of the job
+        """
+        job = {"id": uuid.uuid4().hex, "email": email, "username": username, "host": str(host), "attempts": 0}
+        await self.redis.lpush(self.ready, orjson.dumps(job))
+        return job["id"]
+
+    def block_timeout(self, timeout: float) -> float:
+        """
+        The block_timeout function limits how long a blocking command may wait, so Redis always answers before
+        the client gives up on the socket. A client that times out drops the connection, and a job Redis moves
+        at that moment would sit in the processing list until the next recover.
+
+        :param timeout: float: Seconds the caller wants to wait
+        :return: Seconds to pass to Redis
+        """
+        socket_timeout = self.redis.connection_pool.connection_kwargs.get("socket_timeout")
+        if not isinstance(socket_timeout, (int, float)):
+            return timeout
+        return min(timeout, max(socket_timeout - 1, socket_timeout / 2))
+
+    async def take(self, worker_id: str, batch_size: int, timeout: float) -> list[bytes]:
+        """
+        The take function moves up to batch_size jobs into the processing list of the worker, waiting up to
+        timeout seconds for the first one.
+
+        :param worker_id: str: The worker
+        :param batch_size: int: Most jobs to take
+        :param timeout: float: Seconds to wait for a job; cut to stay below the socket timeout of the client
+        :return: The raw jobs, oldest first, or an empty list
+        """
+        processing = self.processing(worker_id)
+        first = await self.redis.blmove(self.ready, processing, self.block_timeout(timeout), "RIGHT", "LEFT")
+        if first is None:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        for _ in range(batch_size - 1):
+            pipe.lmove(self.ready, processing, "RIGHT", "LEFT")
+        return [first] + [job for job in await pipe.execute() if job is not None]
+
+    def retry_delay(self, attempts: int) -> float:
+        return min(self.max_backoff, self.backoff * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+    async def finish(self, worker_id: str, jobs: list[bytes], errors: list) -> dict:
+        """
+        The finish function acknowledges a batch: delivered jobs are dropped. Failed jobs are scheduled for
+        another attempt, or sent to the dead list after max_attempts. All of it happens in one transaction.
+
+        :param worker_id: str: The worker that took the jobs
+        :param jobs: list[bytes]: The raw jobs as returned by take
+        :param errors: list: None or the exception of each job
+        :return: How many jobs were sent, retried and failed for good
+        """
+        processing = self.processing(worker_id)
+        counts = {"sent": 0, "retried": 0, "failed": 0}
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=True)
+        for raw, error in zip(jobs, errors):
+            pipe.lrem(processing, 1, raw)
+            if error is None:
+                counts["sent"] += 1
+                continue
+            job = orjson.loads(raw)
+            job["attempts"] += 1
+            job["error"] = str(error)[:200]
+            if job["attempts"] >= self.max_attempts:
+                counts["failed"] += 1
+                pipe.lpush(self.dead, orjson.dumps(job))
+                logger.error("email %s to %s failed %d times: %s", job["id"], job["email"], job["attempts"], error)
+            else:
+                counts["retried"] += 1
+                pipe.zadd(self.delayed, {orjson.dumps(job): now + self.retry_delay(job["attempts"])})
+        for name, count in counts.items():
+            if count:
+                pipe.hincrby(self.counters, name, count)
+        await pipe.execute()
+        return counts
+
+    async def promote_due(self, limit: int = 1000) -> int:
+        """
+        The promote_due function puts the failed jobs whose retry time has come back on the queue.
+
+        :param limit: int: Most jobs to move at once
+        :return: The number of jobs moved
+        """
+        return await self.redis.eval(PROMOTE_DUE, 2, self.delayed, self.ready, time.time(), limit)
+
+    async def heartbeat(self, worker_id: str) -> None:
+        await self.redis.set(self.heartbeat_key(worker_id), 1, ex=self.heartbeat_ttl)
+
+    async def recover(self, worker_id: str | None = None) -> int:
+        """
+        The recover function puts the jobs of dead workers back on the queue: the processing lists whose worker
+        has no heartbeat, plus the list of worker_id, a worker starting again under its old id.
+
+        :param worker_id: str | None: The id of the calling worker
+        :return: The number of jobs put back
+        """
+        recovered = 0
+        async for key in self.redis.scan_iter(match=self.processing("*")):
+            owner = (key.decode() if isinstance(key, bytes) else key).rsplit(":", 1)[1]
+            if owner != worker_id and await self.redis.exists(self.heartbeat_key(owner)):
+                continue
+            while await self.redis.lmove(key, self.ready, "LEFT", "RIGHT") is not None:
+                recovered += 1
+        if recovered:
+            logger.warning("put %d unfinished email jobs back on the queue", recovered)
+        return recovered
+
+    async def stats(self) -> dict:
+        """
+        The stats function reports the length of the queue, the scheduled retries and the dead jobs, and the
+        counters of sent, retried and failed jobs of all workers.
+
+        :return: The numbers
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.llen(self.ready)
+        pipe.zcard(self.delayed)
+        pipe.llen(self.dead)
+        pipe.hgetall(self.counters)
+        ready, delayed, dead, counters = await pipe.execute()
+        totals = {(name.decode() if isinstance(name, bytes) else name): int(value) for name, value in counters.items()}
+        return {"ready": ready, "delayed": delayed, "dead": dead,
+                **{name: totals.get(name, 0) for name in ("sent", "retried", "failed")}}
+
+
+def email_queue_from_settings(client: redis.Redis) -> EmailQueue:
+    return EmailQueue(client, max_attempts=settings.email_queue_max_attempts, backoff=settings.email_queue_backoff,
+                      max_backoff=settings.email_queue_max_backoff, heartbeat_ttl=settings.email_worker_heartbeat_ttl)
+
+
+email_queue = email_queue_from_settings(get_redis())
@@ -0,0 +1,114 @@
+"""
+Worker process that sends the queued emails (src.services.email_queue); run as many as the SMTP server allows:
+
+    python -m src.services.email_worker
+    python -m src.services.email_worker --batch-size 100 --worker-id mail-1
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+from time import perf_counter
+from typing import Awaitable, Callable
+
+import orjson
+import redis.asyncio as redis
+
+from src.conf.config import settings
+from src.database.redis import create_redis
+from src.services.email import mail_client, send_emails
+from src.services.email_queue import EmailQueue, email_queue_from_settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmailWorker:
+    """
+    Takes batches of jobs from the queue and sends each batch with one call of send (over the pooled SMTP
+    connections of src.services.email.mail_client), then acknowledges the batch. Throughput is logged every stats_interval seconds.
+    """
+
+    def __init__(self, queue: EmailQueue, send: Callable[[list[dict]], Awaitable[list]], worker_id: str,
+                 batch_size: int, poll_timeout: float = 5, stats_interval: float = 60, recover_interval: float = 60):
+        self.queue = queue
+        self.send = send
+        self.worker_id = worker_id
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.stats_interval = stats_interval
+        self.recover_interval = recover_interval
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.stopping = asyncio.Event()
+
+    async def run_once(self) -> int:
+        """
+        The run_once function handles one batch: promote due retries, take a batch, send it and acknowledge it.
+
+        :return: The number of jobs handled
+        """
+        await self.queue.heartbeat(self.worker_id)
+        await self.queue.promote_due()
+        raw_jobs = await self.queue.take(self.worker_id, self.batch_size, self.poll_timeout)
+        if not raw_jobs:
+            return 0
+        errors = await self.send([orjson.loads(raw) for raw in raw_jobs])
+        counts = await self.queue.finish(self.worker_id, raw_jobs, errors)
+        self.sent += counts["sent"]
+        self.retried += counts["retried"]
+        self.failed += counts["failed"]
+        return len(raw_jobs)
+
+    async def run(self) -> None:
+        await self.queue.recover(self.worker_id)
+        logger.info("email worker %s started", self.worker_id)
+        started = last_report = last_recover = perf_counter()
+        reported = 0
+        while not self.stopping.is_set():
+            try:
+                if perf_counter() - last_recover >= self.recover_interval:
+                    # between batches the own processing list is empty unless a dropped connection left jobs there;
+                    # this also picks up the jobs of workers that died since
+                    await self.queue.recover(self.worker_id)
+                    last_recover = perf_counter()
+                await self.run_once()
+            except redis.RedisError as err:
+                logger.warning("email queue unavailable: %s", err)
+                await asyncio.sleep(1)
+            now = perf_counter()
+            if now - last_report >= self.stats_interval:
+                logger.info("sent %d emails in %.0f s (%.1f msg/s), %d retried, %d failed",
+                            self.sent - reported, now - last_report, (self.sent - reported) / (now - last_report),
+                            self.retried, self.failed)
+                last_report, reported = now, self.sent
+        logger.info("email worker %s stopped after %.0f s, %d sent", self.worker_id, perf_counter() - started,
+                    self.sent)
+
+
+async def main(args) -> None:
+    # a client of its own: BLMOVE blocks for the poll timeout, longer than the socket timeout of the shared client
+    client = create_redis(socket_timeout=settings.email_worker_socket_timeout)
+    worker = EmailWorker(email_queue_from_settings(client), send_emails, args.worker_id, args.batch_size,
+                         poll_timeout=settings.email_worker_poll_timeout,
+                         recover_interval=settings.email_worker_recover_interval)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        # finish and acknowledge the current batch, then exit
+        loop.add_signal_handler(signum, worker.stopping.set)
+    try:
+        await worker.run()
+    finally:
+        await mail_client.close()
+        await client.close(close_connection_pool=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--worker-id", default=os.environ.get("DYNO") or f"{socket.gethostname()}-{os.getpid()}",
+                        help="a stable id lets a restarted worker take back its unfinished batch at once")
+    parser.add_argument("--batch-size", type=int, default=settings.email_queue_batch_size)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+import csv
+import io
+import zlib
+from typing import AsyncIterator, Callable
+
+from src.services.serializers import contact_row_to_dict, to_ndjson_line
+
+CSV_FIELDS = ("id", "firstname", "lastname", "email", "phone", "birthday", "description")
+
+
+class CsvEncoder:
+    """Encodes contacts as CSV rows through one reusable csv.writer."""
+
+    header = (",".join(CSV_FIELDS) + "\r\n").encode()
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer, lineterminator="\r\n")
+
+    def __call__(self, item: dict) -> bytes:
+        self.writer.writerow([item[name] for name in CSV_FIELDS])
+        data = self.buffer.getvalue().encode()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+def _vcard_text(value) -> str:
+    return str(value or "").replace("\\", "\\\\").replace("\n", "\\n").replace(",", "\\,").replace(";", "\\;")
+
+
+def to_vcard(item: dict) -> bytes:
+    """
+    The to_vcard function encodes one contact as a vCard 3.0 entry.
+
+    :param item: dict: The contact as returned by contact_row_to_dict
+    :return: The encoded entry, CRLF line endings included
+    """
+    firstname, lastname = _vcard_text(item["firstname"]), _vcard_text(item["lastname"])
+    lines = ["BEGIN:VCARD", "VERSION:3.0", f"N:{lastname};{firstname};;;", f"FN:{firstname} {lastname}",
+             f"EMAIL;TYPE=INTERNET:{_vcard_text(item['email'])}", f"TEL:{_vcard_text(item['phone'])}"]
+    if item["birthday"]:
+        lines.append(f"BDAY:{item['birthday'].isoformat()}")
+    if item["description"]:
+        lines.append(f"NOTE:{_vcard_text(item['description'])}")
+    lines.append("END:VCARD")
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+# format: (media type, file extension, leading bytes, factory of the per-row encoder)
+EXPORT_FORMATS: dict[str, tuple[str, str, bytes, Callable[[], Callable[[dict], bytes]]]] = {
+    "csv": ("text/csv; charset=utf-8", "csv", CsvEncoder.header, CsvEncoder),
+    "ndjson": ("application/x-ndjson", "ndjson", b"", lambda: to_ndjson_line),
+    "vcard": ("text/vcard; charset=utf-8", "vcf", b"", lambda: to_vcard),
+}
+
+
+async def export_chunks(rows: AsyncIterator, format: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """
+    The export_chunks function encodes contact rows in the given format and groups the output into chunks of
+    about chunk_size bytes, so the response is sent in a few large writes rather than one per contact.
+
+    :param rows: AsyncIterator: Rows from repository_contacts.stream_contacts
+    :param format: str: csv, ndjson or vcard
+    :param chunk_size: int: Bytes per chunk
+    :return: An async iterator of encoded chunks
+    """
+    _, _, header, factory = EXPORT_FORMATS[format]
+    encode = factory()
+    parts, size = [header], len(header)
+    async for row in rows:
+        data = encode(contact_row_to_dict(row))
+        parts.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b"".join(parts)
+            parts, size = [], 0
+    if parts:
+        yield b"".join(parts)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """
+    The gzip_chunks function compresses a stream of chunks into a single gzip member as it goes.
+
+    :param chunks: AsyncIterator[bytes]: The uncompressed stream
+    :param level: int: zlib compression level
+    :return: An async iterator of compressed chunks
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,142 @@
+import csv
+import io
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Iterator
+
+import orjson
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel, ImportResult, ImportRowError
+
+FORMATS = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/jsonlines": "ndjson",
+    "text/csv": "csv",
+}
+EXTENSIONS = {"json": "json", "ndjson": "ndjson", "jsonl": "ndjson", "csv": "csv"}
+
+
+def detect_format(content_type: str | None, filename: str | None = None) -> str | None:
+    """
+    The detect_format function maps a media type, or failing that a file extension, to one of the import
+    formats: json (an array of contacts), ndjson (one contact per line) or csv (a header row with the
+    ContactModel field names).
+
+    :param content_type: str | None: Content-Type of the body or of the uploaded file
+    :param filename: str | None: Name of the uploaded file
+    :return: json, ndjson, csv or None if the format is unknown
+    """
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in FORMATS:
+        return FORMATS[media_type]
+    if filename and "." in filename:
+        return EXTENSIONS.get(filename.rsplit(".", 1)[1].lower())
+    return None
+
+
+async def spool_body(request: Request, max_size: int) -> SpooledTemporaryFile:
+    """
+    The spool_body function copies the request body into a temporary file that stays in memory up to
+    max_size bytes and moves to disk beyond that, so a large import is never held in memory twice.
+
+    :param request: Request: The incoming request
+    :param max_size: int: Bytes kept in memory
+    :return: The spooled body, rewound
+    """
+    spool = SpooledTemporaryFile(max_size=max_size)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+def iter_records(file: BinaryIO, format: str) -> Iterator[tuple[int, dict | bytes]]:
+    """
+    The iter_records function reads the raw records of an import file without validating them.
+    NDJSON lines are yielded as bytes so Pydantic can parse and validate them in one step.
+
+    :param file: BinaryIO: The import file
+    :param format: str: json, ndjson or csv
+    :return: An iterator of (row number, record) pairs, rows are numbered from 1
+    """
+    if format == "json":
+        try:
+            records = orjson.loads(file.read())
+        except orjson.JSONDecodeError as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Invalid JSON: {e}")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                detail="Expected a JSON array of contacts")
+        yield from enumerate(records, 1)
+    elif format == "ndjson":
+        row = 0
+        for line in file:
+            if line.strip():
+                row += 1
+                yield row, line
+    else:
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        try:
+            yield from enumerate(csv.DictReader(text), 1)
+        finally:
+            text.detach()
+
+
+def validate_record(record: dict | bytes) -> ContactModel:
+    if isinstance(record, bytes):
+        return ContactModel.model_validate_json(record)
+    return ContactModel.model_validate(record)
+
+
+async def import_contacts(records: Iterator[tuple[int, dict | bytes]], user: User, db: AsyncSession,
+                          batch_size: int, max_errors: int) -> ImportResult:
+    """
+    The import_contacts function validates the records with ContactModel and inserts the valid ones
+    batch_size at a time, one transaction per batch. Invalid rows are skipped and reported; only the
+    first max_errors of them are described in the result, but all of them are counted. A CSV file that
+    cannot be decoded or parsed stops the import: with nothing committed yet it is rejected with 422,
+    otherwise the rows read so far are imported and the row where reading stopped is reported.
+
+    :param records: Iterator[tuple[int, dict | bytes]]: Records from iter_records
+    :param user: User: Owner of the contacts
+    :param db: AsyncSession: Pass the database session to the function
+    :param batch_size: int: Contacts per INSERT / COPY
+    :param max_errors: int: Maximum number of row errors in the result
+    :return: The numbers of imported and failed rows and the row errors
+    """
+    result = ImportResult()
+    batch = []
+    row = 0
+    while True:
+        try:
+            row, record = next(records)
+        except StopIteration:
+            break
+        except (UnicodeDecodeError, csv.Error) as e:
+            # the rest of the file cannot be read; keep what was committed and say where reading stopped
+            if not result.imported:
+                raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                    detail=f"Unreadable CSV after row {row}: {e}")
+            result.failed += 1
+            result.errors.append(ImportRowError(row=row + 1, errors=[{"loc": [], "msg": f"Unreadable CSV: {e}"}]))
+            break
+        try:
+            batch.append(validate_record(record))
+        except ValidationError as e:
+            result.failed += 1
+            if len(result.errors) < max_errors:
+                errors = e.errors(include_url=False, include_context=False, include_input=False)
+                result.errors.append(ImportRowError(row=row, errors=[{"loc": list(error["loc"]), "msg": error["msg"]}
+                                                                     for error in errors]))
+            continue
+        if len(batch) >= batch_size:
+            result.imported += await repository_contacts.create_contacts(batch, user, db)
+            batch = []
+    result.imported += await repository_contacts.create_contacts(batch, user, db)
+    return result
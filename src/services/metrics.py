@@ -0,0 +1,209 @@
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Iterable, Sequence
+
+from sqlalchemy import Engine, event
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    A fixed-bucket histogram of observed durations (in seconds).
+
+    Observing a value is a binary search and two additions, so it is cheap enough to stay enabled in production.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        """
+        The snapshot function returns the histogram as cumulative bucket counts, the way Prometheus exposes them.
+
+        :return: A dict with the cumulative buckets, the number of observations and their sum
+        """
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {"buckets": buckets, "count": self.count, "sum": self.sum}
+
+
+class RequestStats:
+    """
+    Database work done while serving one request, collected by the engine events of Metrics.
+    """
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+_request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+class Metrics:
+    """
+    Process-wide application metrics in the Prometheus data model: request counts and latency histograms per route
+    template, requests in flight, SQL statements (count and time, overall and per request), Redis command time
+    and bcrypt time. Everything is plain counters and Histogram objects updated on the event loop, so collecting
+    costs a few dict lookups per request and per statement; render turns the current values into the text format.
+    """
+
+    def __init__(self):
+        self.requests: defaultdict[tuple[str, str, int], int] = defaultdict(int)
+        self.latency: defaultdict[tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.request_queries: defaultdict[tuple[str, str], int] = defaultdict(int)
+        self.request_db_time: defaultdict[tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.in_flight = 0
+        self.queries = 0
+        self.query_time = Histogram()
+        self.redis_time: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.bcrypt_time: defaultdict[str, Histogram] = defaultdict(Histogram)
+
+    def attach(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - conn.info["query_started"].pop()
+        self.queries += 1
+        self.query_time.observe(elapsed)
+        # the async engine runs the events in a greenlet that shares the context of the calling task
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+    @contextmanager
+    def time_redis(self, command: str):
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.redis_time[command].observe(perf_counter() - started)
+
+    def render(self, extra: Iterable[tuple[str, str, str, dict]] = ()) -> str:
+        """
+        The render function writes the metrics in the Prometheus text exposition format (version 0.0.4).
+
+        :param extra: Iterable[tuple[str, str, str, dict]]: Metrics kept elsewhere (pool, caches) as
+            (name, type, help, {labels: value or Histogram}), labels being a tuple of (name, value) pairs
+        :return: The exposition text
+        """
+        lines = []
+        family(lines, "http_requests_total", "counter", "HTTP requests by route template and status code",
+               {(("method", m), ("route", r), ("status", s)): n for (m, r, s), n in self.requests.items()})
+        histograms(lines, "http_request_duration_seconds", "Time to complete an HTTP request",
+                   {(("method", m), ("route", r)): h for (m, r), h in self.latency.items()})
+        family(lines, "http_requests_in_flight", "gauge", "HTTP requests being served", {(): self.in_flight})
+        family(lines, "http_request_db_queries_total", "counter", "SQL statements executed while serving requests",
+               {(("method", m), ("route", r)): n for (m, r), n in self.request_queries.items()})
+        histograms(lines, "http_request_db_duration_seconds", "Time spent in SQL statements per request",
+                   {(("method", m), ("route", r)): h for (m, r), h in self.request_db_time.items()})
+        family(lines, "db_queries_total", "counter", "SQL statements executed", {(): self.queries})
+        histograms(lines, "db_query_duration_seconds", "Time to execute one SQL statement", {(): self.query_time})
+        histograms(lines, "redis_command_duration_seconds", "Time of Redis calls",
+                   {(("command", c),): h for c, h in self.redis_time.items()})
+        histograms(lines, "bcrypt_duration_seconds", "Time bcrypt took in the password hasher threads",
+                   {(("operation", o),): h for o, h in self.bcrypt_time.items()})
+        for name, kind, help_text, samples in extra:
+            if kind == "histogram":
+                histograms(lines, name, help_text, samples)
+            else:
+                family(lines, name, kind, help_text, samples)
+        lines.append("")
+        return "\n".join(lines)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def family(lines: list[str], name: str, kind: str, help_text: str, samples: dict) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples.items():
+        lines.append(f"{name}{_labels(labels)} {value}")
+
+
+def histograms(lines: list[str], name: str, help_text: str, samples: dict[tuple, Histogram]) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, histogram in samples.items():
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware that counts and times every HTTP request by its route template (/api/contact/{contact_id},
+    not the concrete path, so the number of series stays bounded) and collects the SQL statements it ran.
+    The time covers the whole response, including streamed bodies.
+    """
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metrics = self.metrics
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        metrics.in_flight += 1
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = perf_counter() - started
+            metrics.in_flight -= 1
+            _request_stats.reset(token)
+            route = scope.get("route")
+            key = (scope["method"], route.path if route is not None else "<unmatched>")
+            metrics.requests[key + (status,)] += 1
+            metrics.latency[key].observe(elapsed)
+            metrics.request_queries[key] += stats.queries
+            metrics.request_db_time[key].observe(stats.db_time)
+
+
+metrics = Metrics()
@@ -0,0 +1,59 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from src.services.metrics import metrics
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt off the event loop. Hashes are computed by a fixed number of worker threads (bcrypt releases
+    the GIL) and at most queue_size more calls may wait for a thread; beyond that new calls are rejected with
+    503 instead of piling up behind a login storm.
+    """
+
+    def __init__(self, context: CryptContext, workers: int, queue_size: int):
+        self.context = context
+        self.limit = workers + queue_size
+        self.pending = 0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hasher")
+
+    @staticmethod
+    def _timed(func, *args):
+        started = perf_counter()
+        result = func(*args)
+        return result, perf_counter() - started
+
+    async def _run(self, operation: str, func, *args):
+        if self.pending >= self.limit:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                detail="Too many concurrent logins, try again later",
+                                headers={"Retry-After": "1"})
+        self.pending += 1
+        try:
+            result, elapsed = await asyncio.get_running_loop().run_in_executor(self.executor, self._timed, func, *args)
+        finally:
+            self.pending -= 1
+        # observed here rather than in the thread, so the histogram is only ever updated from the event loop
+        metrics.bcrypt_time[operation].observe(elapsed)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        return await self._run("verify", self.context.verify, password, password_hash)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> tuple[bool, str | None]:
+        """
+        The verify_and_update function checks a password and, if the stored hash uses outdated settings
+        (e.g. fewer bcrypt rounds than configured), also returns a new hash of the password.
+
+        :param password: str: Plain password
+        :param password_hash: str: Stored hash
+        :return: Whether the password is valid and the replacement hash or None
+        """
+        return await self._run("verify_and_update", self.context.verify_and_update, password, password_hash)
@@ -0,0 +1,174 @@
+import os
+import sys
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from time import perf_counter
+
+from greenlet import getcurrent
+from sqlalchemy import Engine, event
+
+from src.conf.config import settings
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PROFILE_HEADER = "x-sql-profile"
+
+
+class Profile:
+    """
+    The SQL statements one request executed: text, duration and the line of application code that issued each.
+    """
+
+    def __init__(self, request_id: str, method: str, path: str):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.statements: list[tuple[str, float, str | None]] = []
+
+    def summary(self, slow: float, repeated: int) -> dict:
+        """
+        The summary function reports the statements of the request with the slow ones and the likely N+1 patterns:
+        the same statement text executed at least repeated times, which is what loading related rows one parent
+        at a time looks like.
+
+        :param slow: float: Statements running at least this many seconds are reported as slow
+        :param repeated: int: How many executions of one statement count as an N+1 pattern
+        :return: A dict that can be returned from a route as is
+        """
+        counts = Counter(statement for statement, _, _ in self.statements)
+        sites = {}
+        for statement, _, site in self.statements:
+            sites.setdefault(statement, site)
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "queries": len(self.statements),
+            "db_time": sum(duration for _, duration, _ in self.statements),
+            "slow": [{"statement": statement, "duration": duration, "site": site}
+                     for statement, duration, site in self.statements if duration >= slow],
+            "n_plus_one": [{"statement": statement, "count": count, "site": sites[statement]}
+                           for statement, count in counts.items() if count >= repeated],
+            "statements": [{"statement": statement, "duration": duration, "site": site}
+                           for statement, duration, site in self.statements],
+        }
+
+    def header(self, slow: float, repeated: int) -> str:
+        counts = Counter(statement for statement, _, _ in self.statements)
+        return (f"id={self.request_id}; queries={len(self.statements)}; "
+                f"time={sum(duration for _, duration, _ in self.statements) * 1000:.1f}ms; "
+                f"slow={sum(duration >= slow for _, duration, _ in self.statements)}; "
+                f"n+1={sum(count >= repeated for count in counts.values())}")
+
+
+_profile: ContextVar[Profile | None] = ContextVar("sql_profile", default=None)
+
+
+def call_site() -> str | None:
+    """
+    The call_site function finds the innermost frame of application code (outside site-packages and this module)
+    on the stack of a cursor event. The async engine runs the statement in a greenlet, so when the greenlet's own
+    frames are all SQLAlchemy the search continues on the frames of the task that awaited it.
+
+    :return: "path:line in function" relative to the project, or None
+    """
+    frame = sys._getframe(1)
+    while True:
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(PROJECT_ROOT) and "site-packages" not in filename and filename != __file__:
+                return f"{os.path.relpath(filename, PROJECT_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+            frame = frame.f_back
+        parent = getcurrent().parent
+        if parent is None:
+            return None
+        frame = parent.gr_frame
+
+
+class SqlProfiler:
+    """
+    Opt-in profiler of the SQL statements of single requests. A request is profiled when the profiler is on for
+    every request (settings.sql_profiler) or when it asks for it with the X-SQL-Profile header and the header is
+    allowed (settings.sql_profiler_header). The last keep profiles are kept in memory and served by
+    /api/debug/profile/{request_id}; unprofiled requests pay one context variable lookup per statement.
+    """
+
+    def __init__(self, enabled: bool, allow_header: bool, slow: float, repeated: int, keep: int):
+        self.enabled = enabled
+        self.allow_header = allow_header
+        self.slow = slow
+        self.repeated = repeated
+        self.keep = keep
+        self.profiles: OrderedDict[str, Profile] = OrderedDict()
+
+    @property
+    def available(self) -> bool:
+        return self.enabled or self.allow_header
+
+    def attach(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _profile.get() is not None:
+            conn.info.setdefault("profile_started", []).append((perf_counter(), call_site()))
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _profile.get()
+        if profile is not None:
+            started, site = conn.info["profile_started"].pop()
+            profile.statements.append((statement, perf_counter() - started, site))
+
+    def wanted(self, scope) -> bool:
+        if self.enabled:
+            return True
+        if not self.allow_header:
+            return False
+        return any(name == PROFILE_HEADER.encode() and value not in (b"", b"0") for name, value in scope["headers"])
+
+    def store(self, profile: Profile) -> None:
+        self.profiles[profile.request_id] = profile
+        if len(self.profiles) > self.keep:
+            self.profiles.popitem(last=False)
+
+    def get(self, request_id: str) -> dict | None:
+        profile = self.profiles.get(request_id)
+        return None if profile is None else profile.summary(self.slow, self.repeated)
+
+
+class ProfilerMiddleware:
+    """
+    Pure ASGI middleware that profiles the requests SqlProfiler wants and adds the X-SQL-Profile response header
+    with the id of the profile and a summary of the statements executed before the response started.
+    """
+
+    def __init__(self, app, profiler: SqlProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        if scope["type"] != "http" or not profiler.wanted(scope):
+            await self.app(scope, receive, send)
+            return
+        profile = Profile(uuid.uuid4().hex, scope["method"], scope["path"])
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_HEADER.encode(), profile.header(profiler.slow, profiler.repeated).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _profile.set(profile)
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            _profile.reset(token)
+            profiler.store(profile)
+
+
+sql_profiler = SqlProfiler(settings.sql_profiler, settings.sql_profiler_header, settings.sql_profiler_slow,
+                           settings.sql_profiler_repeated, settings.sql_profiler_keep)
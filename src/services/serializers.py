@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import orjson
+
+
+def contact_row_to_dict(row) -> dict:
+    """
+    The contact_row_to_dict function turns a contact row (or ORM object) into the ResponseContact shape
+    without going through Pydantic validation.
+
+    :param row: A row or object with the ResponseContact fields
+    :return: A dict ready to be encoded
+    """
+    birthday = row.birthday
+    if isinstance(birthday, datetime):
+        birthday = birthday.date()
+    return {"id": row.id, "firstname": row.firstname, "lastname": row.lastname, "email": row.email,
+            "phone": row.phone, "birthday": birthday, "description": row.description}
+
+
+def to_ndjson_line(item: dict) -> bytes:
+    """
+    The to_ndjson_line function encodes one record as a line of newline-delimited JSON.
+
+    :param item: dict: The record to encode
+    :return: The encoded line, including the trailing newline
+    """
+    return orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE)
+
+
+def contacts_json(rows) -> bytes:
+    """
+    The contacts_json function encodes contact rows as a JSON array in the ResponseContact shape.
+
+    :param rows: Rows or objects with the ResponseContact fields
+    :return: The encoded array
+    """
+    return orjson.dumps([contact_row_to_dict(row) for row in rows])
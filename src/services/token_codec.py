@@ -0,0 +1,71 @@
+import hashlib
+import time
+
+from jose import JWTError, jwk, jwt
+
+from src.services.user_cache import LocalCache
+
+BACKENDS = ("jose", "pyjwt")
+
+
+class TokenCodec:
+    """
+    Signs and verifies JWTs with a key prepared once, through python-jose or, if installed, PyJWT.
+    Both backends raise jose's JWTError, so callers handle failures the same way.
+
+    decode_cached memoizes the claims of verified tokens in an LRU keyed by the SHA-256 of the token until the
+    token expires, so a client that sends the same access token on every request pays for the signature check once.
+    """
+
+    def __init__(self, secret: str, algorithm: str, backend: str = "jose", cache_size: int = 4096):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown JWT backend {backend!r}, expected one of {BACKENDS}")
+        self.algorithm = algorithm
+        self.backend = backend
+        self.cache = LocalCache(cache_size, ttl=0)
+        if backend == "pyjwt":
+            try:
+                import jwt as pyjwt
+            except ImportError as e:
+                raise RuntimeError("jwt_backend='pyjwt' needs the PyJWT package (pip install pyjwt)") from e
+            self._pyjwt = pyjwt
+            self.key = secret
+        else:
+            self.key = jwk.construct(secret, algorithm)
+
+    def encode(self, claims: dict) -> str:
+        if self.backend == "pyjwt":
+            return self._pyjwt.encode(claims, self.key, algorithm=self.algorithm)
+        return jwt.encode(claims, self.key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        """
+        The decode function verifies the signature and the registered claims (exp, iat, nbf) of a token.
+
+        :param token: str: The encoded token
+        :return: The claims
+        """
+        if self.backend == "pyjwt":
+            try:
+                return self._pyjwt.decode(token, self.key, algorithms=[self.algorithm])
+            except self._pyjwt.PyJWTError as e:
+                raise JWTError(str(e)) from e
+        return jwt.decode(token, self.key, algorithms=[self.algorithm])
+
+    def decode_cached(self, token: str) -> dict:
+        """
+        The decode_cached function is decode with a cache of the verified tokens. Only tokens that pass
+        verification are cached, each until its exp claim; tokens without exp are not cached.
+        The returned dict is shared between calls and must not be modified.
+
+        :param token: str: The encoded token
+        :return: The claims
+        """
+        key = hashlib.sha256(token.encode()).digest()
+        claims = self.cache.get(key)
+        if claims is None:
+            claims = self.decode(token)
+            exp = claims.get("exp")
+            if isinstance(exp, (int, float)) and exp > time.time():
+                self.cache.set(key, claims, ttl=exp - time.time())
+        return claims
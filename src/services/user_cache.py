@@ -0,0 +1,148 @@
+import logging
+from collections import OrderedDict
+from dataclasses import astuple, dataclass
+from datetime import datetime
+from time import monotonic
+
+import orjson
+import redis.asyncio as redis
+
+from src.conf.config import settings
+from src.database.models import User
+from src.database.redis import get_redis
+from src.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class CachedUser:
+    """
+    The fields of a user that authenticated routes read from the current user.
+    The password hash and the refresh token never leave the database.
+    """
+    id: int
+    username: str | None
+    email: str
+    avatar: str | None
+    created_at: datetime | None
+    confirmed_email: bool | None
+
+    @classmethod
+    def from_user(cls, user: User) -> "CachedUser":
+        return cls(user.id, user.username, user.email, user.avatar, user.created_at, user.confirmed_email)
+
+
+class LocalCache:
+    """
+    A small in-process LRU cache whose entries expire after ttl seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        self._data[key] = (monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class UserCache:
+    """
+    Two-tier cache of the current user for Auth.get_current_user: an in-process LRU in front of Redis.
+    Only a CachedUser projection is stored, in Redis as a compact JSON array. The repository invalidates an entry
+    whenever it changes the user; the local tier of other workers catches up within user_cache_local_ttl.
+    """
+
+    def __init__(self, client: redis.Redis, ttl: int, local: LocalCache):
+        self.redis = client
+        self.ttl = ttl
+        self.local = local
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f"user:{email}"
+
+    @staticmethod
+    def dumps(user: CachedUser) -> bytes:
+        return orjson.dumps(astuple(user))
+
+    @staticmethod
+    def loads(data: bytes) -> CachedUser:
+        user_id, username, email, avatar, created_at, confirmed = orjson.loads(data)
+        created_at = datetime.fromisoformat(created_at) if created_at else None
+        return CachedUser(user_id, username, email, avatar, created_at, confirmed)
+
+    async def get(self, email: str) -> CachedUser | None:
+        """
+        The get function returns the cached projection of a user, or None on a miss.
+        Redis errors are logged and treated as a miss.
+
+        :param email: str: Email of the user
+        :return: The cached user or None
+        """
+        user = self.local.get(email)
+        if user is None:
+            try:
+                with metrics.time_redis("user_cache_get"):
+                    data = await self.redis.get(self.key(email))
+            except redis.RedisError as err:
+                logger.warning("user cache unavailable: %s", err)
+                return None
+            if data is None:
+                return None
+            user = self.loads(data)
+            self.local.set(email, user)
+        return user
+
+    async def set(self, user: User | CachedUser) -> CachedUser:
+        """
+        The set function stores the projection of a user in both tiers.
+
+        :param user: User | CachedUser: The user, usually just loaded from the database
+        :return: The stored projection
+        """
+        if not isinstance(user, CachedUser):
+            user = CachedUser.from_user(user)
+        data = self.dumps(user)
+        self.local.set(user.email, user)
+        try:
+            with metrics.time_redis("user_cache_set"):
+                await self.redis.set(self.key(user.email), data, ex=self.ttl)
+        except redis.RedisError as err:
+            logger.warning("user cache unavailable: %s", err)
+        return user
+
+    async def invalidate(self, email: str) -> None:
+        self.local.pop(email)
+        try:
+            await self.redis.delete(self.key(email))
+        except redis.RedisError as err:
+            logger.warning("user cache unavailable: %s", err)
+
+
+user_cache = UserCache(
+    get_redis(),
+    ttl=settings.user_cache_ttl,
+    local=LocalCache(settings.user_cache_local_size, settings.user_cache_local_ttl),
+)
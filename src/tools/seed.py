@@ -0,0 +1,278 @@
+"""
+Fill a database with deterministic synthetic users and contacts for load tests and benchmarks.
+
+Names follow a Zipf-like popularity, birthdays an age pyramid with every day of the year possible, so search,
+birthday and pagination queries see realistic selectivity. The same --seed always produces the same rows.
+Rows are bulk-loaded with COPY on Postgres (asyncpg) and with batched executemany elsewhere:
+
+    python -m src.tools.seed --users 1000 --contacts 1000
+    python -m src.tools.seed --database-url sqlite:///./bench.db --users 10 --contacts 100000 --create
+"""
+import argparse
+import asyncio
+import random
+from contextlib import asynccontextmanager, nullcontext
+from dataclasses import dataclass
+from datetime import date, datetime, time
+from itertools import accumulate
+from time import perf_counter
+from typing import Iterator
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+from src.conf.config import settings
+from src.database.connect import to_async_url
+from src.database.models import Base, Contact, User
+from src.database.search import SQLITE_INSERT_TRIGGER
+from src.repository.contacts import birth_md
+from src.services.auth import auth_service
+
+FIRSTNAMES = ("Oleksandr", "Olena", "Andrii", "Iryna", "Serhii", "Nataliia", "Dmytro", "Tetiana", "Volodymyr",
+              "Oksana", "Mykola", "Yuliia", "Ivan", "Mariia", "Oleh", "Svitlana", "Yurii", "Kateryna", "Vasyl",
+              "Anna", "Petro", "Liudmyla", "Taras", "Halyna", "Bohdan", "Viktoriia", "Maksym", "Sofiia", "Roman",
+              "Anastasiia", "Artem", "Daryna", "Denys", "Khrystyna", "Ihor", "Larysa", "Vitalii", "Nadiia",
+              "Stepan", "Zoriana")
+LASTNAMES = ("Melnyk", "Shevchenko", "Boiko", "Kovalenko", "Bondarenko", "Tkachenko", "Kovalchuk", "Kravchenko",
+             "Oliinyk", "Shevchuk", "Koval", "Polishchuk", "Bondar", "Tkachuk", "Moroz", "Marchenko", "Lysenko",
+             "Rudenko", "Savchenko", "Petrenko", "Klymenko", "Pavlenko", "Savchuk", "Kuzmenko", "Levchenko",
+             "Kharchenko", "Karpenko", "Honcharenko", "Ponomarenko", "Vasylenko", "Romanenko", "Sydorenko",
+             "Ishchenko", "Bikov", "Galitskiy", "Fedorenko", "Hrytsenko", "Zinchenko", "Prykhodko", "Demchenko")
+DOMAINS = ("gmail.com", "ukr.net", "i.ua", "meta.ua", "outlook.com", "yahoo.com", "icloud.com", "example.com")
+OPERATORS = ("50", "63", "66", "67", "68", "73", "93", "95", "96", "97", "98", "99")
+WORDS = ("developer", "friend", "colleague", "family", "school", "gym", "doctor", "neighbour", "client", "football",
+         "university", "dentist", "plumber", "manager", "cousin", "teacher", "book club", "conference")
+
+CONTACT_COLUMNS = ("firstname", "lastname", "email", "phone", "birthday", "birth_md", "description", "user_id",
+                   "updated_at")
+USER_COLUMNS = ("id", "username", "email", "password", "crated_at", "confirmed_email")
+
+
+def zipf_weights(count: int, exponent: float = 1.0) -> list[float]:
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+FIRSTNAME_WEIGHTS = zipf_weights(len(FIRSTNAMES))
+LASTNAME_WEIGHTS = zipf_weights(len(LASTNAMES), 0.8)
+DOMAIN_WEIGHTS = zipf_weights(len(DOMAINS), 1.2)
+# an age pyramid: flat up to 45, thinning out to almost nobody at 90
+AGES = range(5, 91)
+AGE_WEIGHTS = list(accumulate(1.0 if age <= 45 else max(0.05, 1 - (age - 45) / 50) for age in AGES))
+
+
+@dataclass
+class SeedResult:
+    users: int
+    contacts: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return (self.users + self.contacts) / self.seconds if self.seconds else 0.0
+
+
+def contact_batches(user_id: int, count: int, seed: int = 0, batch_size: int = 50_000,
+                    today: date | None = None) -> Iterator[list[tuple]]:
+    """
+    The contact_batches function generates the contacts of one user as row tuples in CONTACT_COLUMNS order.
+    The rows depend only on the arguments, so any user's contacts can be regenerated. Columns are drawn a batch at
+    a time, which keeps generation ahead of the bulk load.
+
+    :param user_id: int: Owner of the contacts
+    :param count: int: Number of contacts
+    :param seed: int: Seed of the dataset
+    :param batch_size: int: Rows per yielded batch
+    :param today: date | None: Reference date of the ages, today by default
+    :return: An iterator over lists of row tuples
+    """
+    rnd = random.Random(seed * 1_000_003 + user_id)
+    this_year = (today or date.today()).year
+    years = {}
+    for age in AGES:
+        year = this_year - age
+        first_day = date(year, 1, 1).toordinal()
+        years[year] = (first_day, date(year + 1, 1, 1).toordinal() - first_day)
+    updated_at = datetime.utcnow()
+    for start in range(0, count, batch_size):
+        size = min(batch_size, count - start)
+        firstnames = rnd.choices(FIRSTNAMES, cum_weights=FIRSTNAME_WEIGHTS, k=size)
+        lastnames = rnd.choices(LASTNAMES, cum_weights=LASTNAME_WEIGHTS, k=size)
+        domains = rnd.choices(DOMAINS, cum_weights=DOMAIN_WEIGHTS, k=size)
+        ages = rnd.choices(AGES, cum_weights=AGE_WEIGHTS, k=size)
+        operators = rnd.choices(OPERATORS, k=size)
+        words = rnd.choices(WORDS, k=2 * size)
+        random_ = rnd.random
+        batch = []
+        for i, firstname, lastname, domain, age, operator in zip(range(start, start + size), firstnames, lastnames,
+                                                                 domains, ages, operators):
+            first_day, days = years[this_year - age]
+            birthday = date.fromordinal(first_day + int(random_() * days))
+            n = 2 * (i - start)
+            batch.append((firstname, lastname, f"{firstname}.{lastname}{i}@{domain}".lower(),
+                          f"+380{operator}{int(random_() * 10_000_000):07d}", datetime.combine(birthday, time()),
+                          birth_md(birthday), f"{words[n]} {words[n + 1]}", user_id, updated_at))
+        yield batch
+
+
+def user_rows(first_id: int, count: int, password_hash: str) -> list[tuple]:
+    now = datetime.utcnow()
+    return [(user_id, f"user{user_id}", f"user{user_id}@example.com", password_hash, now, True)
+            for user_id in range(first_id, first_id + count)]
+
+
+def _memoized(process):
+    cache = {}
+
+    def convert(value):
+        result = cache.get(value)
+        if result is None:
+            result = cache[value] = process(value)
+        return result
+
+    return convert
+
+
+async def load_rows(conn: AsyncConnection, table: str, columns: tuple[str, ...], rows: list[tuple]) -> None:
+    """
+    The load_rows function bulk-inserts row tuples: COPY when the connection is Postgres behind asyncpg,
+    otherwise (SQLite) one executemany of a plain INSERT on the driver connection, with the values converted by the
+    column types the way SQLAlchemy would.
+
+    :param conn: AsyncConnection: Connection in a transaction
+    :param table: str: Name of the table
+    :param columns: tuple[str, ...]: Columns of the row tuples
+    :param rows: list[tuple]: Rows to insert
+    :return: Nothing
+    """
+    dialect = conn.dialect
+    raw = await conn.get_raw_connection()
+    if dialect.name == "postgresql" and dialect.driver == "asyncpg":
+        await raw.driver_connection.copy_records_to_table(table, records=rows, columns=columns)
+        return
+    processors = [Base.metadata.tables[table].c[name].type.dialect_impl(dialect).bind_processor(dialect)
+                  for name in columns]
+    if any(processors):
+        # generated values repeat a lot (birthdays, the batch's updated_at), so each is converted once
+        converters = [None if process is None else _memoized(process) for process in processors]
+        rows = [tuple(value if convert is None or value is None else convert(value)
+                      for convert, value in zip(converters, row)) for row in rows]
+    await raw.driver_connection.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+
+
+@asynccontextmanager
+async def deferred_indexes(engine: AsyncEngine):
+    """
+    The deferred_indexes function drops the secondary indexes of the contacts table for the duration of a bulk
+    load and builds them again afterwards, sorting the keys once instead of updating every B-tree on every row.
+    On SQLite the trigger that copies each new contact into the full-text index is suspended the same way and the
+    index is rebuilt in one pass (Postgres computes its search vector as a generated column during COPY).
+
+    :param engine: AsyncEngine: Database being loaded
+    :return: A context manager around the load
+    """
+    indexes = sorted(Contact.__table__.indexes, key=lambda index: index.name)
+    trigger = None
+    async with engine.begin() as conn:
+        for index in indexes:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        if conn.dialect.name == "sqlite":
+            trigger = (await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger' "
+                                               "AND name = 'contacts_fts_ai'"))).scalar()
+            if trigger is not None:
+                await conn.execute(text("DROP TRIGGER contacts_fts_ai"))
+    try:
+        yield
+    finally:
+        async with engine.begin() as conn:
+            for index in indexes:
+                await conn.run_sync(index.create)
+            if trigger is not None:
+                await conn.execute(text(SQLITE_INSERT_TRIGGER))
+                await conn.execute(text("INSERT INTO contacts_fts(contacts_fts) VALUES ('rebuild')"))
+
+
+async def seed(engine: AsyncEngine, users: int, contacts: int, seed: int = 0, batch_size: int = 50_000,
+               password: str = "password", defer_indexes: bool = True, progress=None) -> SeedResult:
+    """
+    The seed function adds users new users with contacts contacts each. User ids continue after the largest
+    existing one and every batch is committed on its own, so memory stays flat however large the dataset is.
+
+    :param engine: AsyncEngine: Database to fill, with the schema already in place
+    :param users: int: Number of users
+    :param contacts: int: Number of contacts per user
+    :param seed: int: Seed of the dataset
+    :param batch_size: int: Rows per COPY / executemany
+    :param password: str: Password of every user, hashed once
+    :param defer_indexes: bool: Build the contacts indexes after the load (see deferred_indexes)
+    :param progress: Called with the number of contacts loaded so far
+    :return: The number of rows loaded and the time it took
+    """
+    password_hash = auth_service.pwd_context.hash(password)
+    started = perf_counter()
+    loaded = 0
+    async with engine.begin() as conn:
+        first_id = (await conn.execute(select(func.coalesce(func.max(User.id), 0)))).scalar_one() + 1
+        for offset in range(0, users, batch_size):
+            await load_rows(conn, "users", USER_COLUMNS,
+                            user_rows(first_id + offset, min(batch_size, users - offset), password_hash))
+        if conn.dialect.name == "postgresql":
+            # the ids were given explicitly, so the sequence has to catch up
+            await conn.execute(select(func.setval(func.pg_get_serial_sequence("users", "id"),
+                                                  func.coalesce(func.max(User.id), 1))))
+
+    async def load(rows: list[tuple]) -> None:
+        nonlocal loaded
+        async with engine.begin() as conn:
+            await load_rows(conn, Contact.__tablename__, CONTACT_COLUMNS, rows)
+        loaded += len(rows)
+        if progress is not None:
+            progress(loaded)
+
+    pending, loading = [], None
+    async with deferred_indexes(engine) if defer_indexes else nullcontext():
+        for user_id in range(first_id, first_id + users):
+            for batch in contact_batches(user_id, contacts, seed, batch_size):
+                pending.extend(batch)
+                # small address books are gathered into full batches, so there is one commit per batch_size rows
+                if len(pending) >= batch_size or user_id == first_id + users - 1:
+                    # the next batch is generated while the database stores this one
+                    if loading is not None:
+                        await loading
+                    loading = asyncio.create_task(load(pending))
+                    pending = []
+        if loading is not None:
+            await loading
+    return SeedResult(users, loaded, perf_counter() - started)
+
+
+async def main(args) -> None:
+    engine = create_async_engine(to_async_url(args.database_url))
+    if args.create:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    total = args.users * args.contacts
+
+    def progress(loaded: int) -> None:
+        print(f"\r{loaded:,}/{total:,} contacts", end="", flush=True)
+
+    result = await seed(engine, args.users, args.contacts, args.seed, args.batch_size, args.password,
+                        args.defer_indexes, progress if args.progress else None)
+    print(f"\n{result.users:,} users and {result.contacts:,} contacts in {result.seconds:.1f} s "
+          f"({result.rows_per_second:,.0f} rows/s)")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=settings.sqlalchemy_database_url)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--contacts", type=int, default=1000, help="contacts per user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--password", default="password", help="password of every seeded user")
+    parser.add_argument("--create", action="store_true", help="create missing tables first (without Alembic)")
+    parser.add_argument("--keep-indexes", dest="defer_indexes", action="store_false",
+                        help="maintain the contacts indexes row by row instead of rebuilding them after the load")
+    parser.add_argument("--no-progress", dest="progress", action="store_false")
+    asyncio.run(main(parser.parse_args()))
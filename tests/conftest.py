@@ -3,12 +3,16 @@ import redis.asyncio as redis
 from fastapi.testclient import TestClient
 from fastapi_limiter import FastAPILimiter
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from main import app
 from src.conf.config import settings
 from src.database.models import Base
-from src.database.connect import get_db
+from src.database.connect import get_db, to_async_url
+from src.services.profiler import sql_profiler
+from src.services.user_cache import user_cache
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 
@@ -17,6 +21,12 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# TestClient runs every request in a fresh event loop, so async connections must not be pooled between requests
+async_engine = create_async_engine(to_async_url(SQLALCHEMY_DATABASE_URL), poolclass=NullPool)
+AsyncTestingSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False,
+                                              expire_on_commit=False)
+sql_profiler.attach(async_engine.sync_engine)
+
 
 @pytest.fixture(scope="module")
 def session():
@@ -36,13 +46,12 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    async def override_get_db():
+        async with AsyncTestingSessionLocal() as db:
+            yield db
 
     app.dependency_overrides[get_db] = override_get_db
+    user_cache.local.clear()
 
     yield TestClient(app)
 
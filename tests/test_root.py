@@ -1,6 +1,10 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
 from fastapi.testclient import TestClient
 
 import main
+from src.database.redis import get_redis
 
 client = TestClient(main.app)
 
@@ -9,3 +13,53 @@ def test_root():
     response = client.get("/")
     assert response.status_code == 200
     assert response.json() == {"message": "Welcome to FastAPI!"}
+
+
+def test_cors_expose_headers():
+    response = client.get("/", headers={"Origin": "http://localhost:3000"})
+    assert response.headers["access-control-allow-origin"] == "http://localhost:3000"
+    exposed = {name.strip().lower() for name in response.headers["access-control-expose-headers"].split(",")}
+    assert {"x-next-cursor", "etag", "x-sql-profile"} <= exposed
+
+
+def test_restart_injects_new_redis():
+    services = (main.auth_service.cache, main.contact_cache, main.contact_versions, main.email_queue)
+
+    async def restart():
+        with patch("main.FastAPILimiter.init", AsyncMock()):
+            await main.startup()
+            first = get_redis()
+            await main.shutdown()
+            await main.startup()
+        return first
+
+    first = asyncio.run(restart())
+    assert get_redis() is not first
+    assert all(service.redis is get_redis() for service in services)
+
+
+def test_pool_stats():
+    response = client.get("/api/healthchecker/pool")
+    assert response.status_code == 200
+    data = response.json()
+    assert "pool" in data
+    assert data["wait_time"]["buckets"]["+Inf"] == data["wait_time"]["count"]
+
+
+def test_cache_stats():
+    response = client.get("/api/healthchecker/cache")
+    assert response.status_code == 200
+    assert set(response.json()) == {"hits", "misses", "errors", "coalesced"}
+
+
+def test_metrics():
+    client.get("/")
+    client.get("/api/healthchecker/pool")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'http_requests_total{method="GET",route="/",status="200"}' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/healthchecker/pool",le="+Inf"}' in text
+    assert "db_pool_wait_duration_seconds_count" in text
+    assert "contact_cache_hits_total" in text
@@ -1,6 +1,8 @@
-from unittest.mock import MagicMock
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
 
 from src.database.models import User
+from src.services.email_queue import email_queue
 
 
 def test_create_user(client, user, monkeypatch):
@@ -67,3 +69,16 @@ def test_login_wrong_email(client, user):
     assert response.status_code == 401, response.text
     data = response.json()
     assert data["detail"] == "Invalid email"
+
+
+def test_signup_queues_confirmation_email(client, monkeypatch):
+    mock_send_email = MagicMock()
+    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+    with patch.object(email_queue, "redis", AsyncMock()) as r_mock:
+        response = client.post("/api/auth/signup",
+                               json={"username": "queued", "email": "queued@example.com", "password": "123456789"})
+        assert response.status_code == 201, response.text
+        key, raw = r_mock.lpush.call_args.args
+        assert key == "email:ready"
+        assert json.loads(raw)["email"] == "queued@example.com"
+    mock_send_email.assert_not_called()
@@ -1,11 +1,17 @@
-from unittest.mock import MagicMock, patch
+import csv
+import io
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
-from fastapi import Depends
-from fastapi_limiter.depends import RateLimiter
+import redis.asyncio as redis
 
-from src.database.models import User
-from src.services.auth import auth_service
+from src.conf.config import settings
+from src.database.models import Contact, User
+from src.services.contact_cache import contact_cache
+from src.services.contact_versions import contact_versions
+from src.services.profiler import sql_profiler
+from src.services.user_cache import user_cache
 
 
 @pytest.fixture()
@@ -29,7 +35,7 @@ def access_token(client, user, session, monkeypatch):
 
 
 def test_create_contact(client, access_token, monkeypatch):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.post(
             "/api/contact",
@@ -50,7 +56,7 @@ def test_create_contact(client, access_token, monkeypatch):
 
 
 def test_get_contacts(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.get(
             "/api/contact/all",
@@ -63,8 +69,117 @@ def test_get_contacts(client, access_token):
         assert "id" in data[0]
 
 
+def test_get_contacts_page(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+            "/api/contact/all?limit=1",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert len(data) == 1
+        assert response.headers["X-Next-Cursor"] == str(data[0]["id"])
+        response = client.get(
+            f"/api/contact/all?limit=1&cursor={data[0]['id']}",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        assert response.status_code == 200, response.text
+        assert response.json() == []
+        assert "X-Next-Cursor" not in response.headers
+
+
+def test_get_contacts_etag(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock, \
+            patch.object(contact_versions, 'redis', AsyncMock()) as v_mock:
+        r_mock.get.return_value = None
+        v_mock.get.return_value = b"5"
+        response = client.get(
+            "/api/contact/all",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        assert response.status_code == 200, response.text
+        tag = response.headers["ETag"]
+        response = client.get(
+            "/api/contact/all",
+            headers={"Authorization": f"Bearer {access_token}", "If-None-Match": tag},
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+        response = client.get(
+            "/api/contact/birthdays",
+            headers={"Authorization": f"Bearer {access_token}", "If-None-Match": tag},
+        )
+        assert response.status_code == 200, response.text
+        v_mock.get.return_value = b"6"
+        response = client.get(
+            "/api/contact/all",
+            headers={"Authorization": f"Bearer {access_token}", "If-None-Match": tag},
+        )
+        assert response.status_code == 200, response.text
+        assert response.headers["ETag"] != tag
+
+
+class FailingBumpRedis:
+    """Stores keys in memory, but every pipeline (the version bump) fails."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value).encode() if isinstance(value, int) else value
+        return True
+
+    async def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+    def pipeline(self, transaction=True):
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(side_effect=redis.ConnectionError("down"))
+        return pipe
+
+
+def test_get_contacts_after_failed_bump(client, access_token):
+    fake = FailingBumpRedis()
+    headers = {"Authorization": f"Bearer {access_token}"}
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock, patch.object(contact_versions, 'redis', fake), \
+            patch.object(contact_cache, 'redis', fake):
+        r_mock.get.return_value = None
+        response = client.get("/api/contact/all", headers=headers)
+        assert response.status_code == 200, response.text
+        tag = response.headers["ETag"]
+        contact = response.json()[0]
+        assert client.get("/api/contact/all", headers={**headers, "If-None-Match": tag}).status_code == 304
+        response = client.patch(f"/api/contact/{contact['id']}", json={"description": "bump failed"}, headers=headers)
+        assert response.status_code == 200, response.text
+        response = client.get("/api/contact/all", headers={**headers, "If-None-Match": tag})
+        assert response.status_code == 200, response.text
+        assert response.headers["ETag"] != tag
+        assert response.json()[0]["description"] == "bump failed"
+        client.patch(f"/api/contact/{contact['id']}", json={"description": contact["description"]}, headers=headers)
+
+
+def test_get_contacts_ndjson(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+            "/api/contact/all?format=ndjson",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "application/x-ndjson"
+        data = [json.loads(line) for line in response.text.splitlines()]
+        assert data[0]["email"] == "test_contact@gmail.com"
+        assert data[0]["birthday"] == "2000-10-30"
+
+
 def test_get_contact(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.get(
             "/api/contact/1",
@@ -77,7 +192,7 @@ def test_get_contact(client, access_token):
 
 
 def test_get_contact_not_found(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.get(
             "/api/contact/2",
@@ -89,10 +204,10 @@ def test_get_contact_not_found(client, access_token):
 
 
 def test_birthdays(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.get(
-            "/api/contact/birthdays",
+            "/api/contact/birthdays?days=366",
             headers={"Authorization": f"Bearer {access_token}"}
         )
         assert response.status_code == 200, response.text
@@ -102,7 +217,7 @@ def test_birthdays(client, access_token):
 
 
 def test_search_contact(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.get(
             "/api/contact/search/?value=Petro",
@@ -114,8 +229,21 @@ def test_search_contact(client, access_token):
         assert "id" in data[0]
 
 
+def test_search_contact_prefix(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        for value in ("galit", "pet gal", "gmail", "test_contact@gmail.com", "DEVEL"):
+            response = client.get(
+                f"/api/contact/search/?value={value}",
+                headers={"Authorization": f"Bearer {access_token}"}
+            )
+            assert response.status_code == 200, response.text
+            data = response.json()
+            assert data[0]["email"] == "test_contact@gmail.com", value
+
+
 def test_search_contact_not_found(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.get(
             "/api/contact/search/?value=Vasya",
@@ -126,7 +254,7 @@ def test_search_contact_not_found(client, access_token):
 
 
 def test_update_contact(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.put(
             "/api/contact/1",
@@ -147,7 +275,7 @@ def test_update_contact(client, access_token):
 
 
 def test_update_contact_not_found(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.get(
             "/api/contact/2",
@@ -158,8 +286,45 @@ def test_update_contact_not_found(client, access_token):
         assert data["detail"] == "Not Found"
 
 
+def test_patch_contact(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        response = client.patch(
+            "/api/contact/1",
+            json={"description": "patched", "birthday": "2000-11-01"},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["description"] == "patched"
+        assert data["birthday"] == "2000-11-01"
+        assert data["phone"] == "+380999999999"
+
+
+def test_patch_contact_null(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        response = client.patch(
+            "/api/contact/1",
+            json={"description": None},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 422, response.text
+
+
+def test_patch_contact_not_found(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        response = client.patch(
+            "/api/contact/2",
+            json={"description": "patched"},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 404, response.text
+
+
 def test_remove_contact(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.delete(
             "/api/contact/1",
@@ -169,7 +334,7 @@ def test_remove_contact(client, access_token):
 
 
 def test_remove_contact_not_found(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.delete(
             "/api/contact/1",
@@ -181,7 +346,7 @@ def test_remove_contact_not_found(client, access_token):
 
 
 def test_get_contacts_not_found(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.get(
             "/api/contact/all",
@@ -192,7 +357,7 @@ def test_get_contacts_not_found(client, access_token):
 
 
 def test_birthdays_not_found(client, access_token):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.get(
             "/api/contact/birthdays",
@@ -200,3 +365,276 @@ def test_birthdays_not_found(client, access_token):
         )
         data = response.json()
         assert data == []
+
+
+def test_import_contacts_json(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        contact = {"firstname": "Ivan", "lastname": "Franko", "email": "ivan@example.com", "phone": "0501234567",
+                   "birthday": "1999-08-27", "description": "poet"}
+        response = client.post(
+            "/api/contact/import",
+            json=[contact, {**contact, "email": "not an email"}],
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["imported"] == 1
+        assert data["failed"] == 1
+        assert data["errors"][0]["row"] == 2
+        assert data["errors"][0]["errors"][0]["loc"] == ["email"]
+
+
+def test_import_contacts_ndjson(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        body = b'{"firstname": "Lesya", "lastname": "Ukrainka", "email": "lesya@example.com", ' \
+               b'"phone": "0507654321", "birthday": "1999-02-25", "description": "poet"}\n\n{"firstname": \n'
+        response = client.post(
+            "/api/contact/import",
+            content=body,
+            headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/x-ndjson"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["imported"] == 1
+        assert data["failed"] == 1
+        assert data["errors"][0]["row"] == 2
+
+
+def test_import_contacts_csv(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        body = "firstname,lastname,email,phone,birthday,description\r\n" \
+               "Taras,Shevchenko,taras@example.com,0509876543,1999-03-09,poet\r\n"
+        response = client.post(
+            "/api/contact/import",
+            files={"file": ("contacts.csv", body, "text/csv")},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        assert response.json() == {"imported": 1, "failed": 0, "errors": []}
+        response = client.get(
+            "/api/contact/search/?value=taras",
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.json()[0]["birthday"] == "1999-03-09"
+
+
+def test_import_contacts_csv_not_utf8(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        body = "firstname,lastname,email,phone,birthday,description\r\n" \
+               "Ivan,Kotliarevsky,ivan@example.com,0501112233,1999-09-09,Енеїда\r\n".encode("cp1251")
+        response = client.post(
+            "/api/contact/import",
+            files={"file": ("contacts.csv", body, "text/csv")},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 422, response.text
+        response = client.get(
+            "/api/contact/search/?value=kotliarevsky",
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.json() == []
+
+
+def test_import_contacts_csv_not_utf8_partial(client, access_token, session, monkeypatch):
+    monkeypatch.setattr(settings, "import_batch_size", 10)
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        # past the first chunk the CSV reader decodes, so the early batches are committed before the error
+        rows = "".join(f"Name{i},Surname{i},name{i}@example.com,050{i:07d},1999-01-01,friend\r\n" for i in range(200))
+        body = ("firstname,lastname,email,phone,birthday,description\r\n" + rows).encode() + \
+            "Ivan,Kotliarevsky,ivan@example.com,0501112233,1999-09-09,Енеїда\r\n".encode("cp1251")
+        response = client.post(
+            "/api/contact/import",
+            files={"file": ("contacts.csv", body, "text/csv")},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert 0 < data["imported"] <= 200
+        assert data["failed"] == 1
+        assert data["errors"][0]["row"] == data["imported"] + 1
+    # the database is shared with the following tests, which count the contacts
+    session.query(Contact).filter(Contact.email.like("name%@example.com")).delete(synchronize_session=False)
+    session.commit()
+
+
+def test_import_contacts_unsupported(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        response = client.post(
+            "/api/contact/import",
+            content=b"<contacts/>",
+            headers={"Authorization": f"Bearer {access_token}", "Content-Type": "application/xml"}
+        )
+        assert response.status_code == 415, response.text
+
+
+def test_export_contacts_csv(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+            "/api/contact/export?format=csv",
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert rows[0]["email"] == "ivan@example.com"
+        assert rows[0]["birthday"] == "1999-08-27"
+
+
+def test_export_contacts_vcard_gzip(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get(
+            "/api/contact/export?format=vcard&gzip=true",
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.text.count("BEGIN:VCARD") == 3
+        assert "N:Franko;Ivan;;;\r\n" in response.text
+        assert "BDAY:1999-08-27\r\n" in response.text
+
+
+def test_update_contacts_batch(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        response = client.patch(
+            "/api/contact/batch",
+            json={"filter": {"value": "poet", "birthday_from": "1999-03-01"}, "changes": {"description": "writer"}},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["count"] == 2
+        response = client.get(
+            "/api/contact/search/?value=writer",
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert sorted(contact["id"] for contact in response.json()) == sorted(data["ids"])
+
+
+def test_update_contacts_batch_birthday_boundary(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        franko = client.get(
+            "/api/contact/search/?value=franko",
+            headers={"Authorization": f"Bearer {access_token}"}
+        ).json()[0]
+        assert franko["birthday"] == "1999-08-27"
+        # both ends of the range are inclusive, a contact born on the last day is included
+        response = client.patch(
+            "/api/contact/batch",
+            json={"filter": {"birthday_from": "1999-08-27", "birthday_to": "1999-08-27"},
+                  "changes": {"description": franko["description"]}},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        assert response.json()["ids"] == [franko["id"]]
+
+
+def test_update_contacts_batch_invalid(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        response = client.patch(
+            "/api/contact/batch",
+            json={"ids": [1], "filter": {"value": "poet"}, "changes": {"description": "writer"}},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 422, response.text
+        response = client.patch(
+            "/api/contact/batch",
+            json={"ids": [1], "changes": {}},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 422, response.text
+
+
+def test_remove_contacts_batch(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        ids = [contact["id"] for contact in client.get(
+            "/api/contact/all",
+            headers={"Authorization": f"Bearer {access_token}"}
+        ).json()]
+        response = client.request(
+            "DELETE",
+            "/api/contact/batch",
+            json={"ids": ids + [100000]},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        assert sorted(response.json()["ids"]) == sorted(ids)
+        response = client.get(
+            "/api/contact/all",
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.json() == []
+
+
+def test_get_changes(client, access_token, monkeypatch):
+    monkeypatch.setattr(settings, "sync_settle_seconds", 0)
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        headers = {"Authorization": f"Bearer {access_token}"}
+        response = client.get("/api/contact/changes", headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json() == {"changed": [], "deleted": [], "cursor": None, "has_more": False}
+        contact = client.post("/api/contact", headers=headers, json={
+            "firstname": "Marko", "lastname": "Vovchok", "email": "marko@example.com", "phone": "0501112233",
+            "birthday": "1999-12-22", "description": "writer"}).json()
+        data = client.get("/api/contact/changes", headers=headers).json()
+        assert [item["id"] for item in data["changed"]] == [contact["id"]]
+        cursor = data["cursor"]
+        data = client.get("/api/contact/changes", params={"since": cursor}, headers=headers).json()
+        assert data == {"changed": [], "deleted": [], "cursor": cursor, "has_more": False}
+        client.patch(f"/api/contact/{contact['id']}", json={"phone": "0504445566"}, headers=headers)
+        data = client.get("/api/contact/changes", params={"since": cursor}, headers=headers).json()
+        assert data["changed"][0]["phone"] == "0504445566"
+        cursor = data["cursor"]
+        assert client.delete(f"/api/contact/{contact['id']}", headers=headers).status_code == 204
+        data = client.get("/api/contact/changes", params={"since": cursor}, headers=headers).json()
+        assert data["changed"] == []
+        assert data["deleted"] == [contact["id"]]
+        assert client.get(f"/api/contact/{contact['id']}", headers=headers).status_code == 404
+
+
+def test_get_changes_invalid_cursor(client, access_token):
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        for since in ("yesterday", "2023-01-01T00:00:00%2B00:00,1", "2023-01-01T00:00:00,99999999999"):
+            response = client.get(
+                f"/api/contact/changes?since={since}",
+                headers={"Authorization": f"Bearer {access_token}"}
+            )
+            assert response.status_code == 422, response.text
+
+
+def test_sql_profile(client, access_token, monkeypatch):
+    monkeypatch.setattr(sql_profiler, "allow_header", True)
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
+        r_mock.get.return_value = None
+        response = client.get("/api/contact/search/?value=test",
+                              headers={"Authorization": f"Bearer {access_token}", "X-SQL-Profile": "1"})
+        assert response.status_code == 200, response.text
+        summary = response.headers["X-SQL-Profile"]
+        request_id = summary.split(";")[0].removeprefix("id=")
+        assert "queries=" in summary
+        response = client.get(f"/api/debug/profile/{request_id}")
+        assert response.status_code == 200, response.text
+        profile = response.json()
+        assert profile["path"] == "/api/contact/search/"
+        assert profile["queries"] >= 1
+        assert any(s["site"] and s["site"].startswith("src/repository/") for s in profile["statements"])
+
+
+def test_sql_profile_disabled(client, access_token):
+    response = client.get("/api/contact/search/?value=test",
+                          headers={"Authorization": f"Bearer {access_token}", "X-SQL-Profile": "1"})
+    assert "X-SQL-Profile" not in response.headers
+    assert client.get("/api/debug/profile/unknown").status_code == 404
@@ -1,11 +1,12 @@
-from unittest.mock import MagicMock, patch
+import io
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
-from fastapi import Depends
-from fastapi_limiter.depends import RateLimiter
+from PIL import Image
 
 from src.database.models import User
-from src.services.auth import auth_service
+from src.services.avatars import LocalStorage
+from src.services.user_cache import user_cache
 
 
 @pytest.fixture()
@@ -29,7 +30,7 @@ def access_token(client, user, session, monkeypatch):
 
 
 def test_read_users_me(client, access_token, monkeypatch):
-    with patch.object(auth_service, 'r') as r_mock:
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock:
         r_mock.get.return_value = None
         response = client.get(
             "/api/users/me/",
@@ -41,20 +42,32 @@ def test_read_users_me(client, access_token, monkeypatch):
         assert "id" in data
 
 
-# def test_update_avatar_user(client, access_token, monkeypatch):
-#     mock_file = MagicMock()
-#     monkeypatch.setattr("src.routes.users.File", mock_file)
-#     mock_cloudinary = MagicMock()
-#     monkeypatch.setattr("src.routes.users.cloudinary", mock_cloudinary)
-#     with patch.object(auth_service, 'r') as r_mock:
-#         r_mock.get.return_value = None
-#         response = client.patch(
-#             "/api/users/avatar",
-#             json=,
-#             headers={"Authorization": f"Bearer {access_token}"}
-#         )
-#         # assert response.status_code == 200, response.text
-#         data = response.json()
-#         print(data)
-#         assert data["email"] == "deadpool@example.com"
-#         assert "id" in data
+def test_update_avatar_user(client, access_token, tmp_path):
+    storage = LocalStorage(str(tmp_path), "/avatars", 250, 85, workers=1)
+    photo = io.BytesIO()
+    Image.new("RGB", (600, 400), (30, 30, 200)).save(photo, "PNG")
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock, patch("src.routes.users.avatar_storage", storage):
+        r_mock.get.return_value = None
+        response = client.patch(
+            "/api/users/avatar",
+            files={"file": ("avatar.png", photo.getvalue(), "image/png")},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert data["email"] == "deadpool@example.com"
+        assert data["avatar"].startswith("/avatars/")
+        with Image.open(tmp_path / data["avatar"].split("/")[-1].split("?")[0]) as image:
+            assert (image.format, image.size) == ("JPEG", (250, 250))
+
+
+def test_update_avatar_user_not_an_image(client, access_token, tmp_path):
+    storage = LocalStorage(str(tmp_path), "/avatars", 250, 85, workers=1)
+    with patch.object(user_cache, 'redis', AsyncMock()) as r_mock, patch("src.routes.users.avatar_storage", storage):
+        r_mock.get.return_value = None
+        response = client.patch(
+            "/api/users/avatar",
+            files={"file": ("avatar.jpg", b"not an image", "image/jpeg")},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 400, response.text
@@ -0,0 +1,99 @@
+import asyncio
+import io
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+
+from src.services.avatars import AvatarStorage, CloudinaryStorage, InvalidImage, LocalStorage, shrink
+
+
+def jpeg(width: int, height: int) -> io.BytesIO:
+    data = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(data, "JPEG")
+    data.seek(0)
+    return data
+
+
+class TestShrink(unittest.TestCase):
+
+    def test_square_and_smaller(self):
+        original = jpeg(1200, 800)
+        size = len(original.getvalue())
+        with shrink(original, 250, 85) as avatar:
+            data = avatar.read()
+        self.assertLess(len(data), size)
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual(image.size, (250, 250))
+            self.assertEqual(image.format, "JPEG")
+
+    def test_not_an_image(self):
+        with self.assertRaises(InvalidImage):
+            shrink(io.BytesIO(b"not an image"), 250, 85)
+
+
+class TestAvatarStorage(unittest.TestCase):
+
+    def test_save_required(self):
+        class NoSave(AvatarStorage):
+            pass
+
+        with self.assertRaises(TypeError):
+            NoSave(250, 85, workers=1)
+
+
+class TestLocalStorage(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage(self.directory.name, "/avatars/", 250, 85, workers=1)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_store(self):
+        url = await self.storage.store("deadpool", jpeg(1200, 800))
+        self.assertRegex(url, r"^/avatars/deadpool\.jpg\?v=\d+$")
+        with Image.open(os.path.join(self.directory.name, "deadpool.jpg")) as image:
+            self.assertEqual((image.format, image.size), ("JPEG", (250, 250)))
+        self.assertEqual(os.listdir(self.directory.name), ["deadpool.jpg"])
+
+    async def test_name_stays_in_directory(self):
+        url = await self.storage.store("../escape", jpeg(10, 10))
+        self.assertEqual(os.listdir(self.directory.name), ["..%2Fescape.jpg"])
+        self.assertTrue(url.startswith("/avatars/..%2Fescape.jpg?v="))
+
+    async def test_runs_off_event_loop(self):
+        threads = []
+
+        def save(name, file):
+            threads.append(threading.current_thread())
+            return "url"
+
+        with patch.object(self.storage, "save", save):
+            # the loop keeps running other tasks while the upload is in progress
+            self.assertEqual(await asyncio.gather(self.storage.store("a", jpeg(10, 10)), asyncio.sleep(0)),
+                             ["url", None])
+        self.assertIsNot(threads[0], threading.main_thread())
+
+
+class TestCloudinaryStorage(unittest.IsolatedAsyncioTestCase):
+
+    async def test_store(self):
+        with patch("cloudinary.config") as config:
+            storage = CloudinaryStorage("cloud", "key", "secret", "NotesApp", 250, 85, workers=1, chunk_size=1024)
+        config.assert_called_once_with(cloud_name="cloud", api_key="key", api_secret="secret", secure=True)
+        with patch("cloudinary.uploader.upload_large", return_value={"version": 7}) as upload:
+            url = await storage.store("deadpool", jpeg(10, 10))
+        upload.assert_called_once()
+        self.assertEqual(upload.call_args.kwargs["public_id"], "NotesApp/deadpool")
+        self.assertEqual(upload.call_args.kwargs["chunk_size"], 1024)
+        self.assertIn("/v7/NotesApp/deadpool", url)
+        self.assertIn("w_250", url)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+import redis.asyncio as redis
+
+from src.services.contact_cache import ContactCache
+
+
+class TestContactCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.redis.get.return_value = None
+        self.cache = ContactCache(self.redis, ttl=300)
+        self.load = AsyncMock(return_value=b"[]")
+
+    async def test_miss_loads_and_stores(self):
+        self.assertEqual(await self.cache.get(1, 42, "all", self.load), b"[]")
+        self.redis.get.assert_awaited_once_with("contacts:1:2a:all")
+        self.redis.set.assert_awaited_once_with("contacts:1:2a:all", b"[]", ex=300)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    async def test_hit(self):
+        self.redis.get.return_value = b"[1]"
+        self.assertEqual(await self.cache.get(1, 42, "all", self.load), b"[1]")
+        self.load.assert_not_awaited()
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    async def test_without_version(self):
+        self.assertEqual(await self.cache.get(1, None, "all", self.load), b"[]")
+        self.redis.get.assert_not_awaited()
+
+    async def test_redis_error(self):
+        self.redis.get.side_effect = redis.ConnectionError("down")
+        self.assertEqual(await self.cache.get(1, 42, "all", self.load), b"[]")
+        self.assertEqual(self.cache.stats()["errors"], 1)
+
+    async def test_single_flight(self):
+        async def slow_load():
+            await asyncio.sleep(0.01)
+            return b"[]"
+
+        load = AsyncMock(side_effect=slow_load)
+        results = await asyncio.gather(*(self.cache.get(1, 42, "all", load) for _ in range(10)))
+        self.assertEqual(results, [b"[]"] * 10)
+        load.assert_awaited_once()
+        self.assertEqual(self.cache.stats()["coalesced"], 9)
+
+    async def test_single_flight_error(self):
+        async def failing_load():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("database is down")
+
+        results = await asyncio.gather(*(self.cache.get(1, 42, "all", failing_load) for _ in range(3)),
+                                       return_exceptions=True)
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.redis.set.assert_not_awaited()
+        self.assertEqual(self.cache._loading, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+import redis.asyncio as redis
+
+from src.services.contact_versions import ContactVersions, etag, etag_matches
+
+
+class TestContactVersions(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.versions = ContactVersions(self.redis)
+
+    async def test_get_existing(self):
+        self.redis.get.return_value = b"42"
+        self.assertEqual(await self.versions.get(1), 42)
+        self.redis.set.assert_not_awaited()
+
+    async def test_get_creates_missing_version(self):
+        self.redis.get.side_effect = [None, b"1700000000000000000"]
+        self.assertEqual(await self.versions.get(1), 1700000000000000000)
+        self.assertEqual(self.redis.set.await_args.args[0], "contacts:version:1")
+        self.assertEqual(self.redis.set.await_args.kwargs, {"nx": True})
+
+    async def test_get_redis_error(self):
+        self.redis.get.side_effect = redis.ConnectionError("down")
+        self.assertIsNone(await self.versions.get(1))
+
+    async def test_bump(self):
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        self.redis.pipeline = MagicMock(return_value=pipe)
+        await self.versions.bump(1)
+        pipe.incr.assert_called_once_with("contacts:version:1")
+        pipe.execute.assert_awaited_once()
+
+    async def test_bump_failed_deletes_version(self):
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(side_effect=redis.ConnectionError("down"))
+        self.redis.pipeline = MagicMock(return_value=pipe)
+        await self.versions.bump(1)
+        self.redis.delete.assert_awaited_once_with("contacts:version:1")
+        self.assertEqual(self.versions.stale, set())
+
+    async def test_bump_and_delete_failed(self):
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(side_effect=redis.ConnectionError("down"))
+        self.redis.pipeline = MagicMock(return_value=pipe)
+        self.redis.delete.side_effect = redis.ConnectionError("down")
+        await self.versions.bump(1)
+        # no version while the old one cannot be removed
+        self.redis.get.return_value = b"42"
+        self.assertIsNone(await self.versions.get(1))
+        self.redis.delete.side_effect = None
+        self.assertEqual(await self.versions.get(1), 42)
+        self.assertEqual(self.versions.stale, set())
+
+    def test_etag(self):
+        tag = etag(42, 1, "all:None:None:json")
+        self.assertTrue(tag.startswith('"2a-') and tag.endswith('"'))
+        self.assertNotEqual(tag, etag(42, 1, "all:10:None:json"))
+        self.assertNotEqual(tag, etag(42, 2, "all:None:None:json"))
+        self.assertNotEqual(tag, etag(43, 1, "all:None:None:json"))
+
+    def test_etag_matches(self):
+        tag = etag(42, 1, "birthdays")
+        self.assertTrue(etag_matches(tag, tag))
+        self.assertTrue(etag_matches(f'"x", W/{tag}', tag))
+        self.assertTrue(etag_matches("*", tag))
+        self.assertFalse(etag_matches('"x"', tag))
+        self.assertFalse(etag_matches(None, tag))
+        self.assertFalse(etag_matches(tag, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
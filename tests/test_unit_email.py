@@ -0,0 +1,91 @@
+import socket
+import unittest
+from email import message_from_bytes
+
+import aiosmtplib
+from aiosmtpd.controller import Controller
+
+from src.services.email import MailClient, send_emails
+
+
+class Inbox:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, message_from_bytes(envelope.content)))
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestSendEmails(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.inbox = Inbox()
+        self.controller = Controller(self.inbox, hostname="127.0.0.1", port=free_port())
+        self.controller.start()
+        self.connections = 0
+
+    def tearDown(self):
+        self.controller.stop()
+
+    def client(self, port=None) -> aiosmtplib.SMTP:
+        self.connections += 1
+        return aiosmtplib.SMTP(hostname="127.0.0.1", port=port or self.controller.port, start_tls=False, timeout=5)
+
+    async def test_batch_over_one_connection(self):
+        jobs = [{"email": f"user{i}@example.com", "username": f"user{i}", "host": "http://testserver/"}
+                for i in range(3)]
+        pool = MailClient(self.client, pool_size=1)
+        self.assertEqual(await send_emails(jobs, pool), [None, None, None])
+        self.assertEqual(self.connections, 1)
+        self.assertEqual([rcpt for rcpt, _ in self.inbox.messages], [[job["email"]] for job in jobs])
+        body = self.inbox.messages[0][1].get_payload(decode=True).decode()
+        self.assertIn("Hello dear user0", body)
+        self.assertIn("http://testserver/api/auth/confirmed_email/", body)
+
+    async def test_server_unavailable(self):
+        jobs = [{"email": "user@example.com", "username": "user", "host": "http://testserver/"}] * 2
+        errors = await send_emails(jobs, MailClient(lambda: self.client(free_port())))
+        self.assertEqual(len(errors), 2)
+        self.assertTrue(all(isinstance(error, aiosmtplib.SMTPException) for error in errors))
+        self.assertEqual(self.inbox.messages, [])
+
+    async def test_connections_reused_across_batches(self):
+        jobs = [{"email": f"user{i}@example.com", "username": f"user{i}", "host": "http://testserver/"}
+                for i in range(8)]
+        pool = MailClient(self.client, pool_size=2)
+        for start in range(0, 8, 2):
+            self.assertEqual(await send_emails(jobs[start:start + 2], pool), [None, None])
+        await pool.close()
+        self.assertLessEqual(self.connections, 2)
+        self.assertEqual(len(self.inbox.messages), 8)
+
+    async def test_connection_limit(self):
+        jobs = [{"email": f"user{i}@example.com", "username": f"user{i}", "host": "http://testserver/"}
+                for i in range(5)]
+        pool = MailClient(self.client, pool_size=1, messages_per_connection=2)
+        self.assertEqual(await send_emails(jobs, pool), [None] * 5)
+        await pool.close()
+        self.assertEqual(self.connections, 3)
+        self.assertEqual([rcpt for rcpt, _ in self.inbox.messages], [[job["email"]] for job in jobs])
+
+    async def test_idle_connection_checked(self):
+        pool = MailClient(self.client, pool_size=1, keepalive=0)
+        job = {"email": "user@example.com", "username": "user", "host": "http://testserver/"}
+        self.assertEqual(await send_emails([job], pool), [None])
+        client, _, _ = pool._idle[0]
+        client.close()  # the server dropped the idle session
+        self.assertEqual(await send_emails([job], pool), [None])
+        await pool.close()
+        self.assertEqual(self.connections, 2)
+        self.assertEqual(len(self.inbox.messages), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
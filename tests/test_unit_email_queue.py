@@ -0,0 +1,157 @@
+import asyncio
+import unittest
+from time import perf_counter
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import orjson
+
+from src.conf.config import settings
+from src.database.redis import create_redis
+from src.services.email_queue import EmailQueue
+from src.services.email_worker import EmailWorker
+
+
+def job(attempts: int = 0) -> bytes:
+    return orjson.dumps({"id": "1", "email": "user@example.com", "username": "user", "host": "http://test/",
+                         "attempts": attempts})
+
+
+class TestEmailQueue(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = MagicMock()
+        self.redis.lpush = AsyncMock()
+        self.redis.blmove = AsyncMock()
+        self.pipe = self.redis.pipeline.return_value
+        self.pipe.execute = AsyncMock()
+        self.queue = EmailQueue(self.redis, max_attempts=3, backoff=10, max_backoff=25)
+
+    async def test_enqueue(self):
+        job_id = await self.queue.enqueue("user@example.com", "user", "http://test/")
+        key, raw = self.redis.lpush.call_args.args
+        self.assertEqual(key, "email:ready")
+        self.assertEqual(orjson.loads(raw), {"id": job_id, "email": "user@example.com", "username": "user",
+                                             "host": "http://test/", "attempts": 0})
+
+    async def test_take_batch(self):
+        self.redis.blmove.return_value = b"a"
+        self.pipe.execute.return_value = [b"b", None, None]
+        self.assertEqual(await self.queue.take("w1", 4, 5), [b"a", b"b"])
+        self.redis.blmove.assert_awaited_once_with("email:ready", "email:processing:w1", 5, "RIGHT", "LEFT")
+        self.assertEqual(self.pipe.lmove.call_count, 3)
+
+    async def test_take_nothing(self):
+        self.redis.blmove.return_value = None
+        self.assertEqual(await self.queue.take("w1", 4, 5), [])
+        self.redis.pipeline.assert_not_called()
+
+    async def test_finish(self):
+        counts = await self.queue.finish("w1", [job(), job(0), job(2)], [None, OSError("refused"), OSError("down")])
+        self.assertEqual(counts, {"sent": 1, "retried": 1, "failed": 1})
+        self.assertEqual(self.pipe.lrem.call_count, 3)
+        self.redis.pipeline.assert_called_with(transaction=True)
+        retry = orjson.loads(next(iter(self.pipe.zadd.call_args.args[1])))
+        self.assertEqual((retry["attempts"], retry["error"]), (1, "refused"))
+        key, raw = self.pipe.lpush.call_args.args
+        self.assertEqual((key, orjson.loads(raw)["attempts"]), ("email:dead", 3))
+
+    def test_block_timeout(self):
+        self.redis.connection_pool.connection_kwargs = {"socket_timeout": 10}
+        self.assertEqual(self.queue.block_timeout(5), 5)
+        self.assertEqual(self.queue.block_timeout(30), 9)
+        self.redis.connection_pool.connection_kwargs = {"socket_timeout": 1}
+        self.assertEqual(self.queue.block_timeout(5), 0.5)
+        self.redis.connection_pool.connection_kwargs = {"socket_timeout": None}
+        self.assertEqual(self.queue.block_timeout(5), 5)
+
+    def test_retry_delay(self):
+        self.assertTrue(5 <= self.queue.retry_delay(1) <= 10)
+        self.assertTrue(10 <= self.queue.retry_delay(2) <= 20)
+        self.assertTrue(12.5 <= self.queue.retry_delay(10) <= 25)
+
+
+class BlockingRedis:
+    """A Redis server that only knows BLMOVE on an empty list: it blocks for the timeout and answers nil."""
+
+    def __init__(self):
+        self.timeouts = []
+
+    async def handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int((await reader.readline())[1:])
+                    args.append((await reader.readexactly(length + 2))[:-2])
+                if args[0].upper() == b"BLMOVE":
+                    self.timeouts.append(float(args[-1]))
+                    await asyncio.sleep(float(args[-1]))
+                    writer.write(b"$-1\r\n")
+                else:
+                    writer.write(b"+OK\r\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class TestTakeSocketTimeout(unittest.IsolatedAsyncioTestCase):
+
+    async def test_take_blocks_below_socket_timeout(self):
+        server = BlockingRedis()
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        with patch.object(settings, "redis_host", "127.0.0.1"), patch.object(settings, "redis_port", port):
+            client = create_redis(socket_timeout=1)
+        try:
+            started = perf_counter()
+            # asked for 5 s, which would raise redis TimeoutError after the 1 s socket timeout
+            self.assertEqual(await EmailQueue(client).take("w1", 10, timeout=5), [])
+            self.assertLess(perf_counter() - started, 1)
+            self.assertEqual(server.timeouts, [0.5])
+        finally:
+            await client.close(close_connection_pool=True)
+            listener.close()
+            await listener.wait_closed()
+
+
+class TestEmailWorker(unittest.IsolatedAsyncioTestCase):
+
+    async def test_run_once(self):
+        queue = AsyncMock(spec=EmailQueue)
+        queue.take.return_value = [job(), job()]
+        queue.finish.return_value = {"sent": 1, "retried": 1, "failed": 0}
+        send = AsyncMock(return_value=[None, OSError()])
+        worker = EmailWorker(queue, send, "w1", batch_size=10)
+        self.assertEqual(await worker.run_once(), 2)
+        self.assertEqual(send.call_args.args[0][0]["email"], "user@example.com")
+        queue.finish.assert_awaited_once_with("w1", [job(), job()], [None, send.return_value[1]])
+        self.assertEqual((worker.sent, worker.retried), (1, 1))
+
+    async def test_idle(self):
+        queue = AsyncMock(spec=EmailQueue)
+        queue.take.return_value = []
+        send = AsyncMock()
+        self.assertEqual(await EmailWorker(queue, send, "w1", batch_size=10).run_once(), 0)
+        send.assert_not_called()
+
+
+    async def test_run_recovers_periodically(self):
+        queue = AsyncMock(spec=EmailQueue)
+        worker = EmailWorker(queue, AsyncMock(), "w1", batch_size=10, recover_interval=0)
+
+        async def take(*args):
+            if queue.take.await_count == 3:
+                worker.stopping.set()
+            return []
+
+        queue.take.side_effect = take
+        await worker.run()
+        # once at startup and once before every batch, since the interval is 0
+        self.assertEqual(queue.recover.await_count, 4)
+        queue.recover.assert_awaited_with("w1")
+
+
+if __name__ == '__main__':
+    unittest.main()
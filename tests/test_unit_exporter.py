@@ -0,0 +1,51 @@
+import gzip
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+
+from src.services.exporter import CsvEncoder, export_chunks, gzip_chunks, to_vcard
+
+
+def contact(id: int, description: str = "friend") -> SimpleNamespace:
+    return SimpleNamespace(id=id, firstname="Oleg", lastname="Bikov", email=f"bikov{id}@example.com",
+                           phone="+380994563456", birthday=datetime(2000, 12, 13), description=description)
+
+
+async def rows(count: int):
+    for i in range(count):
+        yield contact(i + 1)
+
+
+async def collect(chunks) -> list[bytes]:
+    return [chunk async for chunk in chunks]
+
+
+class TestExporter(unittest.IsolatedAsyncioTestCase):
+
+    async def test_csv_chunks(self):
+        chunks = await collect(export_chunks(rows(1000), "csv", chunk_size=4096))
+        self.assertGreater(len(chunks), 1)
+        lines = b"".join(chunks).decode().split("\r\n")
+        self.assertEqual(lines[0], "id,firstname,lastname,email,phone,birthday,description")
+        self.assertEqual(lines[1], "1,Oleg,Bikov,bikov1@example.com,+380994563456,2000-12-13,friend")
+        self.assertEqual(len(lines), 1002)
+
+    async def test_csv_quoting(self):
+        encode = CsvEncoder()
+        self.assertTrue(encode({**vars(contact(1)), "description": 'a, "b"'}).endswith(b'"a, ""b"""\r\n'))
+
+    async def test_empty_ndjson(self):
+        self.assertEqual(b"".join(await collect(export_chunks(rows(0), "ndjson"))), b"")
+
+    def test_vcard_escaping(self):
+        card = to_vcard({**vars(contact(1)), "birthday": datetime(2000, 12, 13).date(), "description": "a;b,c\nd"})
+        self.assertIn(b"NOTE:a\\;b\\,c\\nd\r\n", card)
+        self.assertIn(b"BDAY:2000-12-13\r\n", card)
+
+    async def test_gzip(self):
+        data = b"".join(await collect(gzip_chunks(export_chunks(rows(100), "ndjson"))))
+        self.assertEqual(gzip.decompress(data).count(b"\n"), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
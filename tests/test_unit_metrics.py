@@ -0,0 +1,77 @@
+import unittest
+
+from sqlalchemy import create_engine, text
+
+from src.services.metrics import Histogram, Metrics, MetricsMiddleware
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.metrics = Metrics()
+        self.engine = create_engine("sqlite://")
+        self.metrics.attach(self.engine)
+
+    async def call(self, app, path="/contacts/1"):
+        scope = {"type": "http", "method": "GET", "path": path}
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await MetricsMiddleware(app, self.metrics)(scope, receive, send)
+        return messages
+
+    async def test_request_by_route_template(self):
+        engine = self.engine
+
+        async def app(scope, receive, send):
+            scope["route"] = type("Route", (), {"path": "/contacts/{contact_id}"})()
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+            await send({"type": "http.response.start", "status": 404, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        messages = await self.call(app)
+        self.assertEqual(messages[0]["status"], 404)
+        key = ("GET", "/contacts/{contact_id}")
+        self.assertEqual(self.metrics.requests[key + (404,)], 1)
+        self.assertEqual(self.metrics.latency[key].count, 1)
+        self.assertEqual(self.metrics.request_queries[key], 2)
+        self.assertEqual(self.metrics.queries, 2)
+        self.assertEqual(self.metrics.in_flight, 0)
+
+    async def test_error_is_counted_as_500(self):
+        async def app(scope, receive, send):
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            await self.call(app, "/missing")
+        self.assertEqual(self.metrics.requests[("GET", "<unmatched>", 500)], 1)
+
+    def test_queries_outside_requests(self):
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        self.assertEqual(self.metrics.queries, 1)
+        self.assertFalse(self.metrics.request_queries)
+
+    def test_render(self):
+        self.metrics.requests[("GET", "/", 200)] = 3
+        with self.metrics.time_redis("get"):
+            pass
+        histogram = Histogram(buckets=(0.1, 1.0))
+        histogram.observe(0.5)
+        text_format = self.metrics.render([("pool_wait", "histogram", "Wait", {(("pool", 'a"b'),): histogram})])
+        self.assertIn('http_requests_total{method="GET",route="/",status="200"} 3\n', text_format)
+        self.assertIn('redis_command_duration_seconds_count{command="get"} 1\n', text_format)
+        self.assertIn('pool_wait_bucket{pool="a\\"b",le="0.1"} 0\n', text_format)
+        self.assertIn('pool_wait_bucket{pool="a\\"b",le="1.0"} 1\n', text_format)
+        self.assertIn("# TYPE pool_wait histogram\n", text_format)
+
+
+if __name__ == '__main__':
+    unittest.main()
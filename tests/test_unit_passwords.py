@@ -0,0 +1,40 @@
+import unittest
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from src.services.passwords import PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5)
+        self.hasher = PasswordHasher(self.context, workers=2, queue_size=2)
+
+    async def test_hash_and_verify(self):
+        password_hash = await self.hasher.hash("123456789")
+        self.assertTrue(await self.hasher.verify("123456789", password_hash))
+        self.assertFalse(await self.hasher.verify("password", password_hash))
+        self.assertEqual(self.hasher.pending, 0)
+
+    async def test_verify_and_update_outdated_hash(self):
+        old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("123456789")
+        valid, new_hash = await self.hasher.verify_and_update("123456789", old_hash)
+        self.assertTrue(valid)
+        self.assertTrue(self.context.verify("123456789", new_hash))
+        self.assertFalse(self.context.needs_update(new_hash))
+
+    async def test_verify_and_update_current_hash(self):
+        password_hash = await self.hasher.hash("123456789")
+        self.assertEqual(await self.hasher.verify_and_update("123456789", password_hash), (True, None))
+
+    async def test_busy(self):
+        self.hasher.pending = self.hasher.limit
+        with self.assertRaises(HTTPException) as err:
+            await self.hasher.hash("123456789")
+        self.assertEqual(err.exception.status_code, 503)
+
+
+if __name__ == '__main__':
+    unittest.main()
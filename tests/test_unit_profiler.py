@@ -0,0 +1,64 @@
+import unittest
+
+from sqlalchemy import create_engine, text
+
+from src.services.profiler import Profile, ProfilerMiddleware, SqlProfiler
+
+
+class TestProfiler(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.profiler = SqlProfiler(enabled=False, allow_header=True, slow=0.5, repeated=3, keep=2)
+        self.engine = create_engine("sqlite://")
+        self.profiler.attach(self.engine)
+
+    async def call(self, headers):
+        engine = self.engine
+        messages = []
+
+        async def app(scope, receive, send):
+            with engine.connect() as conn:
+                for i in range(3):
+                    conn.execute(text("SELECT :i"), {"i": i})
+                conn.execute(text("SELECT 1"))
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/contacts", "headers": headers}
+        await ProfilerMiddleware(app, self.profiler)(scope, None, send)
+        return dict(messages[0]["headers"])
+
+    async def test_profile_on_header(self):
+        headers = await self.call([(b"x-sql-profile", b"1")])
+        summary = headers[b"x-sql-profile"].decode()
+        self.assertIn("queries=4;", summary)
+        self.assertTrue(summary.endswith("slow=0; n+1=1"))
+        profile = self.profiler.get(summary.split(";")[0].removeprefix("id="))
+        self.assertEqual(profile["queries"], 4)
+        self.assertEqual(profile["n_plus_one"][0]["count"], 3)
+        self.assertEqual(profile["n_plus_one"][0]["statement"], "SELECT ?")
+        self.assertTrue(profile["statements"][0]["site"].startswith("tests/test_unit_profiler.py:"))
+
+    async def test_not_profiled_without_header(self):
+        headers = await self.call([])
+        self.assertNotIn(b"x-sql-profile", headers)
+        self.assertFalse(self.profiler.profiles)
+
+    async def test_keeps_latest_profiles(self):
+        for _ in range(3):
+            await self.call([(b"x-sql-profile", b"1")])
+        self.assertEqual(len(self.profiler.profiles), 2)
+
+    def test_slow_statements(self):
+        profile = Profile("id", "GET", "/")
+        profile.statements = [("SELECT 1", 0.7, None), ("SELECT 2", 0.1, None)]
+        summary = profile.summary(slow=0.5, repeated=3)
+        self.assertEqual([s["statement"] for s in summary["slow"]], ["SELECT 1"])
+        self.assertEqual(summary["n_plus_one"], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+
+from src.conf.config import settings
+from src.database import redis as redis_module
+
+
+class TestRedis(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncTearDown(self):
+        await redis_module.close_redis()
+
+    async def test_get_redis_is_shared(self):
+        self.assertIs(redis_module.get_redis(), redis_module.get_redis())
+
+    async def test_pool_settings(self):
+        pool = redis_module.get_redis().connection_pool
+        self.assertEqual(pool.max_connections, settings.redis_max_connections)
+        self.assertEqual(pool.timeout, settings.redis_pool_timeout)
+        self.assertEqual(pool.connection_kwargs["socket_timeout"], settings.redis_socket_timeout)
+
+    async def test_close_redis(self):
+        client = redis_module.get_redis()
+        await redis_module.close_redis()
+        self.assertIsNot(redis_module.get_redis(), client)
+
+
+if __name__ == '__main__':
+    unittest.main()
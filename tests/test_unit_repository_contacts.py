@@ -1,42 +1,75 @@
 import unittest
-from unittest.mock import MagicMock
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from sqlalchemy.orm import Session
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Contact, User
-from src.schemas import ContactModel, ResponseContact
+from src.services.contact_versions import contact_versions
+from src.schemas import ContactFilter, ContactModel, ContactUpdateModel
 from src.repository.contacts import (
     get_contacts,
     get_contact,
     create_contact,
+    create_contacts,
     remove_contact,
+    remove_contacts,
     update_contact,
+    update_contacts,
+    patch_contact,
+    contact_changes,
+    search_contact,
+    search_terms,
+    get_changes,
+    sync_cursor,
+    parse_sync_cursor,
 )
 
 
 class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = User(id=1)
+        patcher = patch.object(contact_versions, 'redis', MagicMock())
+        self.redis = patcher.start()
+        self.redis.pipeline.return_value.execute = AsyncMock()
+        self.addCleanup(patcher.stop)
 
     async def test_get_contacts(self):
-        contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().all.return_value = contacts
+        contacts = [(1, "Oleg"), (2, "Petro"), (3, "Ivan")]
+        self.result.all.return_value = contacts
         result = await get_contacts(user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
     async def test_get_contact_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.result.scalars().first.return_value = contact
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_get_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         result = await get_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
+    async def test_search_contact(self):
+        contacts = [(1, "Oleg"), (2, "Olena")]
+        self.result.all.return_value = contacts
+        result = await search_contact(value="Ole", user=self.user, db=self.session)
+        self.assertEqual(result, contacts)
+
+    async def test_search_contact_empty(self):
+        result = await search_contact(value=" @ ", user=self.user, db=self.session)
+        self.assertEqual(result, [])
+        self.session.execute.assert_not_called()
+
+    def test_search_terms(self):
+        self.assertEqual(search_terms("Oleg bikov@Example.com"), ["oleg", "bikov", "example", "com"])
+
     async def test_create_contact(self):
         body = ContactModel(
             firstname="Oleg",
@@ -55,16 +88,38 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.description, body.description)
         self.assertTrue(hasattr(result, "id"))
 
+    async def test_create_contacts(self):
+        body = ContactModel(
+            firstname="Oleg",
+            lastname="Bikov",
+            email='bikov@example.com',
+            phone='+380994563456',
+            birthday='2020-12-13',
+            description='Python developer'
+        )
+        result = await create_contacts(bodies=[body, body], user=self.user, db=self.session)
+        self.assertEqual(result, 2)
+        rows = self.session.execute.call_args.args[1]
+        self.assertEqual(rows[0]["birth_md"], 1213)
+        self.assertEqual(rows[1]["user_id"], self.user.id)
+        self.session.commit.assert_awaited_once()
+
+    async def test_create_contacts_empty(self):
+        result = await create_contacts(bodies=[], user=self.user, db=self.session)
+        self.assertEqual(result, 0)
+        self.session.execute.assert_not_called()
+
     async def test_remove_contact_found(self):
         contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        self.result.scalars().first.return_value = contact
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
+        self.redis.pipeline.assert_not_called()
 
     async def test_update_contact_found(self):
         body = ContactModel(
@@ -83,7 +138,7 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
             birthday='2020-12-13',
             description='Python developer, backend developer'
         )
-        self.session.query().filter_by().first.return_value = contact
+        self.result.scalars().first.return_value = contact
         self.session.commit.return_value = None
         result = await update_contact(body=body, contact_id=contact.id, user=self.user, db=self.session)
         self.assertEqual(result, contact)
@@ -97,11 +152,63 @@ class TestContacts(unittest.IsolatedAsyncioTestCase):
             birthday='2020-12-13',
             description='Python developer'
         )
-        self.session.query().filter_by().first.return_value = None
+        self.result.scalars().first.return_value = None
         self.session.commit.return_value = None
         result = await update_contact(body=body, contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
 
+    async def test_patch_contact(self):
+        contact = Contact(description='Python developer')
+        self.result.scalars().first.return_value = contact
+        result = await patch_contact(body=ContactUpdateModel(description='Python developer'), contact_id=1,
+                                     user=self.user, db=self.session)
+        self.assertEqual(result, contact)
+        self.assertEqual(self.session.execute.await_count, 1)
+        self.session.commit.assert_awaited_once()
+
+    async def test_patch_contact_without_changes(self):
+        contact = Contact()
+        self.result.scalars().first.return_value = contact
+        result = await patch_contact(body=ContactUpdateModel(), contact_id=1, user=self.user, db=self.session)
+        self.assertEqual(result, contact)
+        self.session.commit.assert_not_awaited()
+
+    async def test_update_contacts(self):
+        self.result.scalars().all.return_value = [1, 2]
+        body = ContactUpdateModel(description='Python developer')
+        result = await update_contacts(body=body, user=self.user, db=self.session, ids=[1, 2, 3])
+        self.assertEqual(result, [1, 2])
+        self.session.commit.assert_awaited_once()
+        self.redis.pipeline.assert_called_once()
+
+    async def test_remove_contacts(self):
+        self.result.scalars().all.return_value = [3]
+        result = await remove_contacts(user=self.user, db=self.session, filter=ContactFilter(value='bikov'))
+        self.assertEqual(result, [3])
+        self.session.commit.assert_awaited_once()
+
+    async def test_get_changes(self):
+        rows = [(1, "Oleg")]
+        self.result.all.return_value = rows
+        result = await get_changes(user=self.user, db=self.session, since=(datetime(2023, 10, 19), 1), limit=10)
+        self.assertEqual(result, rows)
+
+    def test_sync_cursor(self):
+        updated_at = datetime(2023, 10, 19, 19, 20, 1, 123456)
+        self.assertEqual(parse_sync_cursor(sync_cursor(updated_at, 7)), (updated_at, 7))
+        with self.assertRaises(ValueError):
+            parse_sync_cursor("yesterday")
+        with self.assertRaises(ValueError):
+            parse_sync_cursor("2023-01-01T00:00:00+00:00,1")
+        with self.assertRaises(ValueError):
+            parse_sync_cursor(f"2023-01-01T00:00:00,{2 ** 31}")
+
+    def test_contact_changes(self):
+        body = ContactUpdateModel(birthday='2020-12-13')
+        self.assertEqual(contact_changes(body), {"birthday": body.birthday, "birth_md": 1213})
+        with self.assertRaises(ValidationError):
+            ContactUpdateModel(email=None)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,33 +1,40 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel
+from src.services.user_cache import user_cache
 from src.repository.users import (
     get_user_by_email,
     create_user,
     update_token,
     confirmed_email,
     update_avatar,
+    update_password,
 )
 
 
 class TestUsers(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = AsyncMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = User(id=1)
+        patcher = patch.object(user_cache, 'redis', AsyncMock())
+        self.redis = patcher.start()
+        self.addCleanup(patcher.stop)
 
     async def test_get_user_by_email(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         result = await get_user_by_email(email="deadpool@example.com", db=self.session)
         self.assertEqual(result, user)
 
     async def test_get_user_by_email_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         result = await get_user_by_email(email="deadpool@example.com", db=self.session)
         self.assertIsNone(result)
 
@@ -49,28 +56,35 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
     async def test_update_token(self):
         user = User()
         test_token = "fhbvoqur0g8q738qvyb38vb834bv"
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         self.session.commit.return_value = None
         await update_token(user=user, token=test_token, db=self.session)
-        new_user = self.session.query().filter().first.return_value
+        new_user = self.result.scalars().first.return_value
         self.assertEqual(new_user.refresh_token, test_token)
 
+    async def test_update_password(self):
+        user = User(password="old")
+        await update_password(user=user, password="new", db=self.session)
+        self.assertEqual(user.password, "new")
+        self.session.commit.assert_awaited_once()
+
     async def test_confirmed_email(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         self.session.commit.return_value = None
         await confirmed_email(email=user.email, db=self.session)
-        new_user = self.session.query().filter().first.return_value
+        new_user = self.result.scalars().first.return_value
         self.assertTrue(new_user.confirmed_email)
 
     async def test_update_avatar(self):
         user = User()
         test_url = "test/avatar/v1/picture.jpg"
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         self.session.commit.return_value = None
         result = await update_avatar(email=user.email, url=test_url, db=self.session)
-        new_user = self.session.query().filter().first.return_value
+        new_user = self.result.scalars().first.return_value
         self.assertEqual(result.avatar, test_url)
+        self.redis.delete.assert_awaited_once_with(user_cache.key(user.email))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database.models import Base, Contact, User
+from src.tools.seed import CONTACT_COLUMNS, contact_batches, seed
+
+
+class TestContactBatches(unittest.TestCase):
+
+    def test_deterministic(self):
+        first = list(contact_batches(7, 500, seed=3, batch_size=200, today=date(2024, 1, 1)))
+        second = list(contact_batches(7, 500, seed=3, batch_size=200, today=date(2024, 1, 1)))
+        self.assertEqual([len(batch) for batch in first], [200, 200, 100])
+        strip = [[row[:-1] for row in batch] for batch in first]
+        self.assertEqual(strip, [[row[:-1] for row in batch] for batch in second])
+        other = list(contact_batches(8, 500, seed=3, batch_size=200, today=date(2024, 1, 1)))
+        self.assertNotEqual(strip, [[row[:-1] for row in batch] for batch in other])
+
+    def test_rows(self):
+        rows = [dict(zip(CONTACT_COLUMNS, row)) for row in next(contact_batches(1, 1000, today=date(2024, 1, 1)))]
+        self.assertEqual(len({row["email"] for row in rows}), 1000)
+        for row in rows:
+            self.assertEqual(row["birth_md"], row["birthday"].month * 100 + row["birthday"].day)
+            self.assertTrue(1934 <= row["birthday"].year <= 2019)
+            self.assertTrue(row["phone"].startswith("+380"))
+            self.assertEqual(len(row["phone"]), 13)
+            self.assertEqual(row["user_id"], 1)
+
+
+class TestSeed(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'seed.db')}")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_seed(self):
+        result = await seed(self.engine, users=3, contacts=250, batch_size=100)
+        self.assertEqual((result.users, result.contacts), (3, 750))
+        result = await seed(self.engine, users=1, contacts=10, batch_size=100)
+        async with self.engine.connect() as conn:
+            self.assertEqual((await conn.execute(select(func.count(User.id)))).scalar(), 4)
+            self.assertEqual((await conn.execute(select(func.count(Contact.id)).where(Contact.user_id == 4))).scalar(),
+                             10)
+            names = (await conn.execute(text("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger') "
+                                             "AND name LIKE '%contacts%'"))).scalars().all()
+            self.assertTrue({index.name for index in Contact.__table__.indexes} | {"contacts_fts_ai"} <= set(names))
+            firstname = (await conn.execute(select(Contact.firstname).limit(1))).scalar()
+            matches = (await conn.execute(text("SELECT count(*) FROM contacts_fts WHERE contacts_fts MATCH :name"),
+                                          {"name": firstname})).scalar()
+            same_name = select(func.count(Contact.id)).where(Contact.firstname == firstname)
+            self.assertEqual(matches, (await conn.execute(same_name)).scalar())
+            birthday = (await conn.execute(select(Contact.birthday).limit(1))).scalar()
+            self.assertEqual(birthday.hour, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import importlib.util
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from jose import JWTError
+
+from src.services.token_codec import TokenCodec
+
+
+def claims(minutes: int = 15) -> dict:
+    now = datetime.utcnow()
+    return {"sub": "deadpool@example.com", "iat": now, "exp": now + timedelta(minutes=minutes),
+            "scope": "access_token"}
+
+
+class TestTokenCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.codec = TokenCodec("secret_key", "HS256")
+
+    def test_round_trip(self):
+        payload = self.codec.decode(self.codec.encode(claims()))
+        self.assertEqual(payload["sub"], "deadpool@example.com")
+
+    def test_bad_signature(self):
+        token = TokenCodec("other_key", "HS256").encode(claims())
+        with self.assertRaises(JWTError):
+            self.codec.decode_cached(token)
+
+    def test_decode_cached(self):
+        token = self.codec.encode(claims())
+        with patch.object(self.codec, "decode", wraps=self.codec.decode) as decode:
+            first = self.codec.decode_cached(token)
+            second = self.codec.decode_cached(token)
+        self.assertIs(first, second)
+        decode.assert_called_once_with(token)
+
+    def test_expired_token_not_cached(self):
+        token = self.codec.encode(claims(minutes=-1))
+        with self.assertRaises(JWTError):
+            self.codec.decode_cached(token)
+        self.assertEqual(len(self.codec.cache._data), 0)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            TokenCodec("secret_key", "HS256", backend="fast")
+
+    @unittest.skipUnless(importlib.util.find_spec("jwt"), "PyJWT is not installed")
+    def test_pyjwt_backend_compatible(self):
+        pyjwt = TokenCodec("secret_key" * 4, "HS256", backend="pyjwt")
+        jose = TokenCodec("secret_key" * 4, "HS256")
+        self.assertEqual(jose.decode(pyjwt.encode(claims()))["scope"], "access_token")
+        self.assertEqual(pyjwt.decode(jose.encode(claims()))["scope"], "access_token")
+        with self.assertRaises(JWTError):
+            pyjwt.decode(jose.encode(claims(minutes=-1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
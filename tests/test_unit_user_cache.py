@@ -0,0 +1,72 @@
+import unittest
+from datetime import datetime
+from unittest.mock import AsyncMock
+
+import redis.asyncio as redis
+
+from src.database.models import User
+from src.services.user_cache import CachedUser, LocalCache, UserCache
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.redis.get.return_value = None
+        self.cache = UserCache(self.redis, ttl=900, local=LocalCache(maxsize=2, ttl=60))
+        self.user = User(id=1, username="deadpool", email="deadpool@example.com", password="hash",
+                         refresh_token="token", avatar="avatar.png", created_at=datetime(2023, 10, 19, 19, 20),
+                         confirmed_email=True)
+
+    async def test_set_stores_projection(self):
+        result = await self.cache.set(self.user)
+        self.assertEqual(result, CachedUser.from_user(self.user))
+        key, data = self.redis.set.await_args.args
+        self.assertEqual(key, "user:deadpool@example.com")
+        self.assertEqual(self.redis.set.await_args.kwargs, {"ex": 900})
+        self.assertNotIn(b"hash", data)
+        self.assertNotIn(b"token", data)
+
+    async def test_get_local_hit(self):
+        await self.cache.set(self.user)
+        result = await self.cache.get(self.user.email)
+        self.redis.get.assert_not_awaited()
+        self.assertEqual(result.id, 1)
+        self.assertEqual(result.created_at, self.user.created_at)
+        self.assertFalse(hasattr(result, "password"))
+
+    async def test_get_redis_hit(self):
+        self.redis.get.return_value = UserCache.dumps(CachedUser.from_user(self.user))
+        result = await self.cache.get(self.user.email)
+        self.assertEqual(result, CachedUser.from_user(self.user))
+
+    async def test_get_miss(self):
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+    async def test_redis_error_is_a_miss(self):
+        self.redis.get.side_effect = redis.ConnectionError()
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+    async def test_invalidate(self):
+        await self.cache.set(self.user)
+        await self.cache.invalidate(self.user.email)
+        self.redis.delete.assert_awaited_once_with("user:deadpool@example.com")
+        self.assertIsNone(await self.cache.get(self.user.email))
+
+    def test_local_cache_lru(self):
+        local = LocalCache(maxsize=2, ttl=60)
+        local.set("a", 1)
+        local.set("b", 2)
+        local.get("a")
+        local.set("c", 3)
+        self.assertEqual(local.get("a"), 1)
+        self.assertIsNone(local.get("b"))
+
+    def test_local_cache_ttl(self):
+        local = LocalCache(maxsize=2, ttl=-1)
+        local.set("a", 1)
+        self.assertIsNone(local.get("a"))
+
+
+if __name__ == '__main__':
+    unittest.main()